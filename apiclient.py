@@ -83,6 +83,15 @@ def get_parser():
                            'perform paging (v3_0 endpoints and above only). ' +
                            'Range is 0 based inclusive, and must be in ' +
                            'formation \'x-y\'', action='store', default='')
+    parser.add_option('-o', '--output',
+                      help='Save the body of the response of a GET to this ' +
+                           'file instead of printing it. The body is ' +
+                           'written as it is received, so responses of any ' +
+                           'size can be saved.', action='store')
+    parser.add_option('--resume',
+                      help='With --output, continue a partial download ' +
+                           'by requesting only the part of the body the ' +
+                           'file does not have yet.', action='store_true')
 
     return parser
 
@@ -220,6 +229,13 @@ def make_request(args):
         else:
             for key, value in params.items():
                 params[key] = value
+            # With --output the body is written to the file as it arrives
+            # instead of being held in memory.
+            if args.output:
+                return api_client.download(endpoint, args.output,
+                                           params=params, headers=headers,
+                                           resume=args.resume,
+                                           progress=print_progress)
             return api_client.call_api(endpoint, args.method, params=params,
                                        headers=headers)
 
@@ -229,6 +245,21 @@ def make_request(args):
                          '<paramname>="<paramvalue>"')
 
 
+# This method prints how much of a download has been saved, on one line of
+# stderr that is rewritten as the download progresses.
+def print_progress(written, total):
+
+    if total:
+        message = '{0} of {1} bytes ({2:.0%})'.format(
+            written, total, written / total)
+    else:
+        message = '{0} bytes'.format(written)
+    sys.stderr.write('\rSaved ' + message)
+    if total is not None and written >= total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+
 def handle_response_error(response, body):
 
     try:
@@ -263,9 +294,17 @@ def main(args):
         print_api()
     # Then if --api and --method both have values, apiclient will attempt an
     # api request.
+    elif args[0].output and args[0].method not in (None, 'GET'):
+        print("ArgumentError: --output can only be used with --method GET\n")
     elif args[0].api and args[0].method:
         # Gets response object from making api call.
         response = make_request(args[0])
+        # A downloaded body has already been written to the output file.
+        if args[0].output and response.code < 300:
+            print(response.headers)
+            print(response.code)
+            print("\nResponse body saved to " + args[0].output)
+            return
         # Determines content type of response object (for printing).
         content_type = response.headers.get('Content-type')
         # Gleans body from response object.
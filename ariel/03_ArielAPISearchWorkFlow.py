@@ -12,6 +12,7 @@ def main():
     import os
     sys.path.append(os.path.realpath('../modules'))
     import json
+    import time
     from arielapiclient import APIClient
 
     # Creates instance of APIClient. It contains all of the API methods.
@@ -52,12 +53,17 @@ def main():
     # This block of code calls GET /searches/{search_id} on the Ariel API
     # to determine if the search is complete. This block of code will repeat
     # until the status of the search is 'COMPLETE' or there is an error.
+    # Between calls it waits, doubling the wait each time up to 10 seconds, so
+    # a long running search is not polled continuously.
     response = api_client.get_search(search_id)
     error = False
+    wait_seconds = 0.25
     while (response_json['status'] != 'COMPLETED') and not error:
         if (response_json['status'] == 'EXECUTE') | \
                 (response_json['status'] == 'SORTING') | \
                 (response_json['status'] == 'WAIT'):
+            time.sleep(wait_seconds)
+            wait_seconds = min(wait_seconds * 2, 10)
             response = api_client.get_search(search_id)
             response_json = json.loads(response.read().decode('utf-8'))
         else:
@@ -77,9 +83,18 @@ def main():
     # This is for pretty printing the JSON object.
     print(json.dumps(body_json, indent=2, separators=(',', ':')))
 
-    # This is the same call as before, but asks for a CSV object in return.
-    response = api_client.get_search_results(search_id, "application/csv")
-    print("\n" + response.read().decode('utf-8'))
+    # This is the same call as before, but asks for the results as CSV and
+    # saves them to a file. The body is written to the file as it is
+    # received, so even very large results are saved with little memory.
+    file_name = 'search_results.csv'
+    response = api_client.get_search_results(search_id, "application/csv",
+                                             file_name=file_name)
+    if response.code == 200:
+        print("\nCSV results saved to " + file_name + " (" +
+              str(os.path.getsize(file_name)) + " bytes)")
+    else:
+        print("\nFailed to download the CSV results:")
+        print(response.read().decode('utf-8'))
 
     # This method calls POST /searches/{search_id}. It saves the result of a
     # search to a disk.
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# This sample runs the same kind of search as 03_ArielAPISearchWorkFlow.py,
+# but uses the ArielSearchRunner module to do the work. The runner creates the
+# search, polls its status with an increasing delay between calls until it
+# completes, reads the results a page at a time using the Range header, and
+# deletes the search when the results have been read.
+
+
+def main():
+    import sys
+    import os
+    sys.path.append(os.path.realpath('../modules'))
+    import json
+    from arielsearchrunner import ArielSearchRunner
+    from arielsearchrunner import ArielSearchError
+
+    # Creates an instance of ArielSearchRunner. The status of the search is
+    # first checked after a quarter of a second. The delay doubles after each
+    # check, up to 10 seconds. The results are read 100 rows at a time, and
+    # the search is abandoned if it takes more than 10 minutes.
+    runner = ArielSearchRunner(initial_interval=0.25, max_interval=10,
+                               page_size=100, timeout=600)
+
+    # This is the AQL expression to send for the search.
+    query_expression = ("SELECT sourceIP, destinationIP FROM events "
+                        "LAST 5 MINUTES")
+
+    # run() returns the result rows one at a time. The rows are requested
+    # from the console as they are needed, so even a search with a large
+    # number of results does not have to fit in memory.
+    try:
+        row_count = 0
+        for row in runner.run(query_expression):
+            print(json.dumps(row))
+            row_count += 1
+        print(str(row_count) + ' rows returned.')
+    except ArielSearchError as e:
+        print(str(e))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# This sample runs a search over a long time range as several smaller
+# searches, one for each slice of the range, using the ArielQuerySplitter
+# module. The slices run on the console at the same time and their results
+# are merged into the results the single search would have returned.
+
+
+def main():
+    import sys
+    import os
+    sys.path.append(os.path.realpath('../modules'))
+    import json
+    from arielquerysplitter import ArielQuerySplitter
+    from arielsearchrunner import ArielSearchError
+    from arielsearchscheduler import ArielSearchScheduler
+
+    # The scheduler runs at most 5 searches on the console at once. The other
+    # slices wait until a search finishes.
+    scheduler = ArielSearchScheduler(max_searches=5)
+
+    # Creates an instance of ArielQuerySplitter that splits each query into
+    # 10 time slices.
+    splitter = ArielQuerySplitter(scheduler, slices=10)
+
+    # This is the AQL expression to send for the search. The query must have
+    # START and STOP bounds. The counts and sums for each source IP are added
+    # up across the slices, and the LIMIT is applied after merging.
+    query_expression = ("SELECT sourceIP, COUNT(*) AS event_count, "
+                        "SUM(magnitude) AS total_magnitude FROM events "
+                        "GROUP BY sourceIP ORDER BY event_count DESC "
+                        "LIMIT 20 "
+                        "START '2024-01-01 00:00' STOP '2024-01-31 00:00'")
+
+    # Shows the queries the slices are run as.
+    for slice_query in splitter.split(query_expression):
+        print(slice_query)
+
+    try:
+        for row in splitter.run(query_expression):
+            print(json.dumps(row))
+    except (ArielSearchError, ValueError) as e:
+        print(str(e))
+        sys.exit(1)
+    finally:
+        scheduler.shutdown()
+
+if __name__ == "__main__":
+    main()
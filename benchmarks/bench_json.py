@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Microbenchmark for decoding and encoding JSON with JsonCodec.py. A list of
+# synthetic offenses is decoded and encoded with every JSON library that is
+# installed, and the time and throughput of each is printed.
+#
+# Run from this directory:
+#     python3 bench_json.py [number of offenses]
+
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.realpath('../modules'))
+import JsonCodec  # noqa: E402
+
+
+def make_offenses(count):
+    return [{'id': index,
+             'description': 'Multiple Login Failures for admin\n',
+             'status': 'OPEN',
+             'offense_source': '10.0.' + str(index // 256 % 256) + '.' +
+                               str(index % 256),
+             'magnitude': index % 10,
+             'source_network': 'other',
+             'categories': ['Authentication', 'User Login Failure'],
+             'start_time': 1400000000000 + index,
+             'inactive': False,
+             'rules': [{'id': 100 + index % 50, 'type': 'CRE_RULE'}]}
+            for index in range(count)]
+
+
+def best_time(function, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    offenses = make_offenses(count)
+    body = JsonCodec.dumps_bytes(offenses)
+    megabytes = len(body) / 1024.0 / 1024.0
+    print(str(count) + ' offenses, ' + '{0:.1f}'.format(megabytes) + ' MB')
+    print('library'.ljust(10) + 'decode (s)'.rjust(12) + 'MB/s'.rjust(8) +
+          'encode (s)'.rjust(12) + 'MB/s'.rjust(8))
+
+    for name in JsonCodec.BACKENDS:
+        try:
+            JsonCodec.use_backend(name)
+        except ValueError:
+            continue
+        decode_time = best_time(lambda: JsonCodec.loads(body))
+        encode_time = best_time(lambda: JsonCodec.dumps_bytes(offenses))
+        print(name.ljust(10) +
+              '{0:.3f}'.format(decode_time).rjust(12) +
+              '{0:.0f}'.format(megabytes / decode_time).rjust(8) +
+              '{0:.3f}'.format(encode_time).rjust(12) +
+              '{0:.0f}'.format(megabytes / encode_time).rjust(8))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Microbenchmarks for building request paths. Each case is timed with the
+# query string code RestApiClient used before EndpointTemplate.py, and with
+# the current code, and the time per call is printed for both.
+#
+# Run from this directory:
+#     python3 bench_parse_path.py
+
+
+import os
+import sys
+import timeit
+from urllib.parse import quote
+
+sys.path.append(os.path.realpath('../modules'))
+from EndpointTemplate import append_query  # noqa: E402
+from EndpointTemplate import compile_endpoint  # noqa: E402
+
+
+# The parse_path implementation RestApiClient used before, kept here so the
+# two can be compared.
+def legacy_parse_path(endpoint, params):
+    path = endpoint + '?'
+    if isinstance(params, list):
+        for kv in params:
+            if kv[1]:
+                path += kv[0]+'='+quote(kv[1])+'&'
+    else:
+        for k, v in params.items():
+            if params[k]:
+                path += k+'='+quote(v)+'&'
+    return path[:len(path)-1]
+
+
+OFFENSE_NOTES = compile_endpoint('siem/offenses/{offense_id}/notes')
+
+CASES = [
+    ('no parameters',
+     lambda: legacy_parse_path('siem/offense_types', {}),
+     lambda: append_query('siem/offense_types', {})),
+    ('fields and filter',
+     lambda: legacy_parse_path(
+         'siem/offenses', {'fields': 'id,status,offense_source',
+                           'filter': 'status = "OPEN"'}),
+     lambda: append_query(
+         'siem/offenses', {'fields': 'id,status,offense_source',
+                           'filter': 'status = "OPEN"'})),
+    ('hot source_ip filter',
+     lambda: legacy_parse_path(
+         'siem/source_addresses',
+         [('filter', 'source_ip="10.1.2.3"'), ('fields', 'id')]),
+     lambda: append_query(
+         'siem/source_addresses',
+         [('filter', 'source_ip="10.1.2.3"'), ('fields', 'id')])),
+    ('path parameter',
+     lambda: legacy_parse_path(
+         'siem/offenses/' + quote(str(42)) + '/notes', {'fields': 'id'}),
+     lambda: OFFENSE_NOTES.path({'fields': 'id'}, offense_id=42)),
+]
+
+
+def main():
+    number = 100000
+    print('case'.ljust(24) + 'legacy (us)'.rjust(12) +
+          'current (us)'.rjust(14) + 'speedup'.rjust(9))
+    for name, legacy, current in CASES:
+        legacy_time = min(timeit.repeat(legacy, number=number, repeat=5))
+        current_time = min(timeit.repeat(current, number=number, repeat=5))
+        print(name.ljust(24) +
+              '{0:.3f}'.format(legacy_time / number * 1e6).rjust(12) +
+              '{0:.3f}'.format(current_time / number * 1e6).rjust(14) +
+              '{0:.2f}x'.format(legacy_time / current_time).rjust(9))
+
+if __name__ == "__main__":
+    main()
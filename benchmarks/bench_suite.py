@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# Benchmarks for the hot paths of the client modules, run against the mock
+# server in ../mock_server. The server is started in its own process, so it
+# does not compete with the client for the interpreter. For each benchmark
+# the throughput and the 50th, 95th and 99th percentile time of one
+# operation are printed.
+#
+# The results can be saved as a named baseline in the baselines directory,
+# and later runs compared with it. A benchmark whose throughput drops, or
+# whose 95th percentile time grows, by more than the threshold is reported
+# as a regression and the script exits with status 1.
+#
+# Run from this directory:
+#     python3 bench_suite.py                        run every benchmark
+#     python3 bench_suite.py call_api pagination    run some of them
+#     python3 bench_suite.py --save-baseline main   save the results
+#     python3 bench_suite.py --compare main         compare with a baseline
+
+
+import argparse
+import json
+import os
+import platform
+import socket
+import ssl
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.realpath('../modules'))
+sys.path.append(os.path.realpath('../mock_server'))
+import JsonCodec  # noqa: E402
+from arielapiclient import APIClient  # noqa: E402
+from mockserver import MockConfig  # noqa: E402
+from mockserver import ensure_certificate  # noqa: E402
+from ReferenceDataBulkLoader import ReferenceDataBulkLoader  # noqa: E402
+from RestApiClient import RestApiClient  # noqa: E402
+
+
+BASELINE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'baselines')
+
+
+class Result:
+
+    def __init__(self, name, unit, items, elapsed, samples):
+        self.name = name
+        self.unit = unit
+        self.items = items
+        self.elapsed = elapsed
+        self.samples = sorted(samples)
+
+    def throughput(self):
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, percent):
+        # The nearest rank percentile of the operation times, in seconds.
+        if not self.samples:
+            return 0.0
+        rank = int(round(percent / 100.0 * len(self.samples) + 0.5)) - 1
+        return self.samples[max(0, min(rank, len(self.samples) - 1))]
+
+    def to_dict(self):
+        return {'unit': self.unit,
+                'operations': len(self.samples),
+                'throughput': self.throughput(),
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
+def timed(name, unit, operation, count, items_per_operation=1):
+    # Run operation count times after one untimed warm up run, recording the
+    # time of each run.
+    operation()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(count):
+        operation_start = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - operation_start)
+    elapsed = time.perf_counter() - start
+    return Result(name, unit, count * items_per_operation, elapsed, samples)
+
+
+def timed_batches(name, unit, function, batches, batch_size):
+    # For operations too quick to time one at a time: each sample is the
+    # average time of one call over a batch of batch_size calls.
+    function()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(batches):
+        batch_start = time.perf_counter()
+        for _ in range(batch_size):
+            function()
+        samples.append((time.perf_counter() - batch_start) / batch_size)
+    elapsed = time.perf_counter() - start
+    return Result(name, unit, batches * batch_size, elapsed, samples)
+
+
+def bench_call_api(context):
+    client = context.client()
+
+    def operation():
+        response = client.call_api('siem/offense_types', 'GET')
+        response.read()
+    return timed('call_api', 'requests', operation, context.count(1000))
+
+
+def bench_call_api_concurrent(context):
+    client = context.client(pool_maxsize=8)
+    count = context.count(2000)
+
+    def operation():
+        response = client.call_api('siem/offense_types', 'GET')
+        response.read()
+
+    def run_one(_):
+        start = time.perf_counter()
+        operation()
+        return time.perf_counter() - start
+
+    operation()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(8) as executor:
+        samples = list(executor.map(run_one, range(count)))
+    elapsed = time.perf_counter() - start
+    return Result('call_api_concurrent', 'requests', count, elapsed,
+                  samples)
+
+
+def bench_parse_path(context):
+    client = context.client()
+    params = {'fields': 'id,status,offense_source,magnitude',
+              'filter': 'status = "OPEN" and magnitude > 5',
+              'sort': '-magnitude'}
+    return timed_batches(
+        'parse_path', 'calls',
+        lambda: client.parse_path('siem/offenses', params),
+        context.count(200), 1000)
+
+
+def bench_merge_headers(context):
+    client = context.client()
+    headers = {b'Accept': 'application/csv', 'range': 'items=0-49',
+               'Content-Type': 'application/json'}
+    return timed_batches('merge_headers', 'calls',
+                         lambda: client.merge_headers(headers),
+                         context.count(200), 1000)
+
+
+def bench_json_decode(context):
+    client = context.client()
+    response = client.call_api('siem/offenses', 'GET',
+                               headers={'Range': 'items=0-9999'})
+    body = response.read()
+    records = len(JsonCodec.loads(body))
+    return timed('json_decode', 'records', lambda: JsonCodec.loads(body),
+                 context.count(20), records)
+
+
+def bench_pagination(context):
+    client = context.client()
+    records = context.offenses
+
+    def operation():
+        count = sum(1 for _ in client.paginate(
+            'siem/offenses', params={'fields': 'id,status,magnitude'},
+            page_size=500, max_workers=4))
+        if count != records:
+            raise Exception('Expected ' + str(records) + ' offenses but '
+                            'received ' + str(count) + '.')
+    return timed('pagination', 'records', operation, context.count(5),
+                 records)
+
+
+def bench_ariel_search(context):
+    api_client = APIClient(config=context.config)
+    context.clients.append(api_client)
+    query = 'SELECT sourceip, destinationip, qid FROM events LIMIT 1000'
+
+    def operation():
+        search = JsonCodec.load_response(api_client.create_search(query))
+        search_id = search['search_id']
+        while search['status'] != 'COMPLETED':
+            time.sleep(0.01)
+            search = JsonCodec.load_response(api_client.get_search(search_id))
+        response = api_client.get_search_results(search_id,
+                                                 'application/json')
+        events = JsonCodec.load_response(response)['events']
+        api_client.delete_search(search_id).read()
+        if len(events) != 1000:
+            raise Exception('Expected 1000 events but received ' +
+                            str(len(events)) + '.')
+    return timed('ariel_search', 'searches', operation, context.count(50))
+
+
+def bench_bulk_load(context):
+    client = context.client()
+    loader = ReferenceDataBulkLoader(client, chunk_size=5000)
+    values = ['10.{0}.{1}.{2}'.format(index >> 16 & 255, index >> 8 & 255,
+                                      index & 255)
+              for index in range(50000)]
+    names = iter(range(1000000))
+
+    def operation():
+        name = 'bench_set_' + str(next(names))
+        response = client.call_api('reference_data/sets', 'POST',
+                                   params={'name': name,
+                                           'element_type': 'IP'})
+        response.read()
+        result = loader.load_set(name, values)
+        client.call_api('reference_data/sets/' + name, 'DELETE').read()
+        if result.elements_loaded != len(values):
+            raise Exception(result.summary())
+    return timed('bulk_load', 'elements', operation, context.count(5),
+                 len(values))
+
+
+BENCHMARKS = [('call_api', bench_call_api),
+              ('call_api_concurrent', bench_call_api_concurrent),
+              ('parse_path', bench_parse_path),
+              ('merge_headers', bench_merge_headers),
+              ('json_decode', bench_json_decode),
+              ('pagination', bench_pagination),
+              ('ariel_search', bench_ariel_search),
+              ('bulk_load', bench_bulk_load)]
+
+
+class Context:
+    # What the benchmarks share: the configuration for the mock server, the
+    # number of offenses it serves and the scale of the runs.
+
+    def __init__(self, config, offenses, scale):
+        self.config = config
+        self.offenses = offenses
+        self.scale = scale
+        self.clients = []
+
+    def count(self, count):
+        return max(1, int(count * self.scale))
+
+    def client(self, **options):
+        client = RestApiClient(config=self.config, version='6.0', **options)
+        self.clients.append(client)
+        return client
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.clients = []
+
+
+class MockServerProcess:
+    # Runs ../mock_server/mockserver.py on a free port.
+
+    def __init__(self, offenses, latency):
+        self.certificate_file, _ = ensure_certificate()
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        mock_directory = os.path.dirname(self.certificate_file)
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(mock_directory, 'mockserver.py'),
+             '--port', str(self.port), '--offenses', str(offenses),
+             '--latency', str(latency), '--search-seconds', '0',
+             '--auth-token', 'bench-token'],
+            stdout=subprocess.DEVNULL)
+        self.config = MockConfig({
+            'server_ip': '127.0.0.1:' + str(self.port),
+            'certificate_file': self.certificate_file,
+            'auth_token': 'bench-token'})
+        self.wait_until_ready()
+
+    def wait_until_ready(self, timeout=30):
+        context = ssl.create_default_context(cafile=self.certificate_file)
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.process.poll() is not None:
+                raise Exception('The mock server exited with status ' +
+                                str(self.process.returncode) + '.')
+            try:
+                with socket.create_connection(('127.0.0.1', self.port),
+                                              timeout=1) as connection:
+                    with context.wrap_socket(connection,
+                                             server_hostname='127.0.0.1'):
+                        return
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise
+                time.sleep(0.1)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def print_results(results):
+    print('benchmark'.ljust(22) + 'ops'.rjust(7) + 'throughput'.rjust(14) +
+          'unit'.rjust(12) + 'p50 (ms)'.rjust(11) + 'p95 (ms)'.rjust(11) +
+          'p99 (ms)'.rjust(11))
+    for result in results:
+        print(result.name.ljust(22) +
+              str(len(result.samples)).rjust(7) +
+              '{0:,.0f}'.format(result.throughput()).rjust(14) +
+              (result.unit + '/s').rjust(12) +
+              _milliseconds(result.percentile(50)).rjust(11) +
+              _milliseconds(result.percentile(95)).rjust(11) +
+              _milliseconds(result.percentile(99)).rjust(11))
+
+
+def _milliseconds(seconds):
+    return '{0:.4g}'.format(seconds * 1000)
+
+
+def baseline_file(name):
+    if os.path.dirname(name) or name.endswith('.json'):
+        return name
+    return os.path.join(BASELINE_DIRECTORY, name + '.json')
+
+
+def save_baseline(name, results, settings):
+    file_name = baseline_file(name)
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    baseline = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'json_backend': JsonCodec.backend,
+                'settings': settings,
+                'results': dict((result.name, result.to_dict())
+                                for result in results)}
+    with open(file_name, 'w') as baseline_file_handle:
+        json.dump(baseline, baseline_file_handle, indent=2, sort_keys=True)
+    print('Saved baseline ' + file_name)
+
+
+def compare_baseline(name, results, threshold, settings):
+    # Print the change of each benchmark from the baseline and return the
+    # names of those that regressed by more than threshold percent.
+    file_name = baseline_file(name)
+    with open(file_name) as baseline_file_handle:
+        baseline = json.load(baseline_file_handle)
+    print('Compared with ' + file_name + ' (' + baseline['created'] +
+          ', threshold ' + '{0:g}'.format(threshold) + '%)')
+    if baseline.get('settings') != settings:
+        print('Warning: the baseline was recorded with different settings: ' +
+              json.dumps(baseline.get('settings')))
+    print('benchmark'.ljust(22) + 'throughput'.rjust(12) + 'p95'.rjust(10) +
+          '  status')
+
+    regressions = []
+    for result in results:
+        before = baseline['results'].get(result.name)
+        if before is None:
+            print(result.name.ljust(22) + '-'.rjust(12) + '-'.rjust(10) +
+                  '  not in baseline')
+            continue
+        after = result.to_dict()
+        throughput_change = _change(before['throughput'],
+                                    after['throughput'])
+        p95_change = _change(before['p95'], after['p95'])
+        status = 'ok'
+        if throughput_change < -threshold or p95_change > threshold:
+            status = 'REGRESSION'
+            regressions.append(result.name)
+        elif throughput_change > threshold and p95_change < threshold:
+            status = 'faster'
+        print(result.name.ljust(22) +
+              '{0:+.1f}%'.format(throughput_change).rjust(12) +
+              '{0:+.1f}%'.format(p95_change).rjust(10) + '  ' + status)
+    return regressions
+
+
+def _change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / before * 100.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the client modules against the mock server.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='The benchmarks to run, all of them by '
+                             'default: ' + ', '.join(
+                                 name for name, _ in BENCHMARKS))
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiply the number of operations of each '
+                             'benchmark, for example 0.1 for a quick run.')
+    parser.add_argument('--offenses', type=int, default=20000,
+                        help='The number of offenses the server lists.')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='The latency the server adds to every request, '
+                             'in milliseconds.')
+    parser.add_argument('--save-baseline', metavar='NAME',
+                        help='Save the results as baselines/NAME.json.')
+    parser.add_argument('--compare', metavar='NAME',
+                        help='Compare the results with baselines/NAME.json.')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='The change, in percent, that counts as a '
+                             'regression.')
+    args = parser.parse_args()
+
+    names = [name for name, _ in BENCHMARKS]
+    for name in args.benchmarks:
+        if name not in names:
+            parser.error('Unknown benchmark ' + name + '.')
+    selected = [(name, function) for name, function in BENCHMARKS
+                if not args.benchmarks or name in args.benchmarks]
+
+    server = MockServerProcess(args.offenses, args.latency)
+    context = Context(server.config, args.offenses, args.scale)
+    results = []
+    try:
+        for name, function in selected:
+            print('Running ' + name + '...', file=sys.stderr)
+            try:
+                results.append(function(context))
+            finally:
+                context.close()
+    finally:
+        server.stop()
+
+    print_results(results)
+    settings = {'scale': args.scale, 'offenses': args.offenses,
+                'latency': args.latency}
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, settings)
+    if args.compare:
+        print()
+        if compare_baseline(args.compare, results, args.threshold,
+                            settings):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -42,26 +42,24 @@ def main():
     file_name = 'python_sample.py'
     file_path = os.path.join(root_path, 'custom_action_samples', file_name)
 
-    # Opening script file in local file system
-    with open(file_path) as script:
-        # Adding a request header to contain the file name
-        # Also setting content-type header to application/octet-stream
-        request_header = rest_client.headers.copy()
-        request_header['file_name'] = file_name
-        request_header['Content-Type'] = 'application/octet-stream'
-        # Reading the content of the script file & encoding it for use
-        # with the endpoint.
-        script_data = script.read()
-        script_data_encoded = str.encode(script_data)
+    # Adding a request header to contain the file name
+    # Also setting content-type header to application/octet-stream
+    request_header = rest_client.headers.copy()
+    request_header['file_name'] = file_name
+    request_header['Content-Type'] = 'application/octet-stream'
 
     SampleUtilities.pretty_print_request(rest_client,
                                          scripts_endpoint,
                                          'POST')
-    # Calling scripts endpoint to POST script file.
-    response = rest_client.call_api(scripts_endpoint,
-                                    'POST',
-                                    headers=request_header,
-                                    data=script_data_encoded)
+    # Opening script file in local file system in binary mode. The open file
+    # is passed to call_api, which sends it as it reads it instead of reading
+    # the whole script into memory first.
+    with open(file_path, 'rb') as script:
+        # Calling scripts endpoint to POST script file.
+        response = rest_client.call_api(scripts_endpoint,
+                                        'POST',
+                                        headers=request_header,
+                                        data=script)
     # Checking for a successful response code.
     if response.code != 201:
         print('Failed to POST custom action script to the server')
@@ -86,27 +84,23 @@ def main():
     file_name = 'bash_sample.sh'
     file_path = os.path.join(root_path, 'custom_action_samples', file_name)
 
-    with open(file_path) as script:
-        # Adding a request header to contain the file name
-        # Also setting content-type header to application/octet-stream
-        request_header = rest_client.headers.copy()
-        request_header['file_name'] = file_name
-        request_header['Content-Type'] = 'application/octet-stream'
-        # Reading the content of the script file & encoding it
-        # for use with the endpoint.
-        script_data = script.read()
-        script_data_encoded = str.encode(script_data)
+    # Adding a request header to contain the file name
+    # Also setting content-type header to application/octet-stream
+    request_header = rest_client.headers.copy()
+    request_header['file_name'] = file_name
+    request_header['Content-Type'] = 'application/octet-stream'
     # Updating endpoint to include /{id}.
     scripts_endpoint += '/' + str(script_id)
     SampleUtilities.pretty_print_request(rest_client,
                                          scripts_endpoint,
                                          'POST')
-    # Calling the POST /scripts/{id} endpoint to
-    # update the script resource.
-    response = rest_client.call_api(scripts_endpoint,
-                                    'POST',
-                                    headers=request_header,
-                                    data=script_data_encoded)
+    with open(file_path, 'rb') as script:
+        # Calling the POST /scripts/{id} endpoint to
+        # update the script resource.
+        response = rest_client.call_api(scripts_endpoint,
+                                        'POST',
+                                        headers=request_header,
+                                        data=script)
 
     if (response.code != 200):
         print('Failed to POST updated custom action script to the server')
@@ -65,7 +65,7 @@ def main():
                       'low_level_category_id': 1008
                       }
 
-    qid_record = create_qid_record(new_qid_record)
+    qid_record = create_qid_record(client, new_qid_record)
 
     endpoint_url = 'data_classification/dsm_event_mappings'
     http_method = 'POST'
@@ -129,7 +129,7 @@ def main():
                       'low_level_category_id': 1009
                       }
 
-    updated_qid_record = create_qid_record(new_qid_record)
+    updated_qid_record = create_qid_record(client, new_qid_record)
 
     # using dsm event mapping created in step 2
     dsm_event_mapping_id = dsm_event_mapping['id']
@@ -159,10 +159,9 @@ def main():
         sys.exit(1)
 
 
-# function helps creating qid record needed for dsm event mapping
-def create_qid_record(qid_record):
-
-    client = client_module.RestApiClient(version='7.0')
+# function helps creating qid record needed for dsm event mapping. It uses
+# the client created in main, so the request reuses its open connection.
+def create_qid_record(client, qid_record):
 
     endpoint_url = 'data_classification/qid_records'
     http_method = 'POST'
@@ -1,6 +1,5 @@
 """Domain utilities used by sample scripts for Domain API.
 """
-import json
 import os
 import sys
 import uuid
@@ -10,6 +9,7 @@ sys.path.append(os.path.realpath('../modules'))
 
 _RestApiClient = import_module('RestApiClient')
 _SampleUtilities = import_module('SampleUtilities')
+_JsonCodec = import_module('JsonCodec')
 _client = _RestApiClient.RestApiClient(version='6.0')
 
 
@@ -33,13 +33,13 @@ def api(endpoint, method, data=None, json=False):
 def from_json(response):
     """Converts RestApiClient response from JSON to string.
     """
-    return json.loads(response.read().decode('utf-8'))
+    return _JsonCodec.load_response(response)
 
 
 def to_json(data):
     """Converts Python data to JSON.
     """
-    return json.dumps(data).encode('utf8')
+    return _JsonCodec.dumps_bytes(data)
 
 
 def setup_domain():
@@ -27,12 +27,14 @@ def upload_extension():
     # setup file for posting
     cwd = os.path.dirname(os.path.realpath(__file__))
     app_zip_file_path = os.path.join(cwd, 'ExtensionPackageTest.zip')
-    app_zip_file = open(app_zip_file_path, 'rb')
 
-    data = app_zip_file.read()
-
-    response = client.call_api('config/extension_management/extensions',
-                               'POST', headers=request_header, data=data)
+    # The open file is passed to call_api, which sends it with its size as
+    # the Content-Length and reads it a block at a time, so large extension
+    # packages are never held in memory.
+    with open(app_zip_file_path, 'rb') as app_zip_file:
+        response = client.call_api('config/extension_management/extensions',
+                                   'POST', headers=request_header,
+                                   data=app_zip_file)
 
     # If the response code is 201, that means the extension package has been
     # successfully uploaded and the extension id will be returned.
@@ -82,6 +82,13 @@ def main():
         SampleUtilities.pretty_print_response(response)
         current_position = current_position + 5
 
+    # The client can do this paging for us. paginate reads the total from the
+    # Content-Range header of the first page, requests the remaining pages in
+    # parallel and returns the elements one at a time, in order.
+    for ref_data_set in client.paginate('reference_data/sets', page_size=5,
+                                        max_workers=4):
+        print(ref_data_set['name'])
+
     # Now suppose that we want to find a specific set that contains data we are
     # interested in. We can use the filter parameter to do this.
     # Some sets were added during the setup of this sample script. Lets find
@@ -0,0 +1,1052 @@
+"""
+The endpoints of the mock server. MockApi.handle() takes a MockRequest and
+returns a MockResponse, so the endpoints can be used without the HTTP
+server.
+
+The routes are kept in a table, which is also used to answer
+help/capabilities and help/endpoints. Errors are returned in
+the same JSON form as QRadar's.
+"""
+import csv
+import io
+import json
+import re
+import threading
+import time
+import uuid
+from urllib.parse import parse_qsl
+
+from mockdata import Collection
+from mockdata import EVENT_COLUMNS
+from mockdata import FLOW_COLUMNS
+from mockquery import QueryError
+from mockquery import parse_fields
+from mockquery import parse_filter
+from mockquery import parse_range
+from mockquery import parse_sort
+from mockquery import select_fields
+from mockquery import sort_key
+
+
+VERSIONS = ['3.0', '4.0', '5.0', '5.1', '6.0', '7.0', '8.0', '9.0', '10.0',
+            '11.0', '12.0', '13.0', '14.0', '15.0', '16.0', '17.0', '18.0',
+            '19.0', '20.0']
+
+ELEMENT_TYPES = ('ALN', 'NUM', 'IP', 'PORT', 'ALNIC', 'DATE')
+
+ARIEL_DATABASES = {'events': EVENT_COLUMNS, 'flows': FLOW_COLUMNS}
+
+# Ariel searches pass through these states, each for a share of the search
+# time, before they are COMPLETED.
+_SEARCH_STATES = (('WAIT', 0.1), ('EXECUTE', 0.8), ('SORTING', 1.0))
+
+_LIMIT_PATTERN = re.compile(r'\blimit\s+(\d+)', re.IGNORECASE)
+_SELECT_PATTERN = re.compile(r'^\s*select\s+(.*?)\s+from\s+(\w+)',
+                             re.IGNORECASE | re.DOTALL)
+_ALIAS_PATTERN = re.compile(r'\s+as\s+[\'"]?([^\'"]+?)[\'"]?\s*$',
+                            re.IGNORECASE)
+
+
+class MockRequest:
+    """
+    A request to the mock API. path is the part of the URL after /api/,
+    without the query string. params holds the query string parameters and
+    those of a form encoded body.
+    """
+
+    def __init__(self, method, path, query='', headers=None, body=b''):
+        self.method = method.upper()
+        self.path = path.strip('/')
+        self.params = {}
+        for name, value in parse_qsl(query, keep_blank_values=True):
+            self.params.setdefault(name, value)
+        self.headers = dict((name.lower(), value)
+                            for name, value in (headers or {}).items())
+        self.body = body or b''
+        # Form encoded bodies, as sent by arielapiclient.py, are parameters.
+        if self.header('Content-Type', '').startswith(
+                'application/x-www-form-urlencoded'):
+            for name, value in parse_qsl(self.body.decode('utf-8'),
+                                         keep_blank_values=True):
+                self.params.setdefault(name, value)
+
+    def param(self, name, default=None):
+        return self.params.get(name, default)
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def json(self):
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except ValueError as e:
+            raise ApiError(422, 1005, 'The request body is not valid JSON: ' +
+                           str(e))
+
+
+class MockResponse:
+    """
+    A response from the mock API. value is encoded as JSON unless it is
+    bytes already.
+    """
+
+    def __init__(self, code, value=None, headers=None,
+                 content_type='application/json'):
+        self.code = code
+        self.value = value
+        self.headers = headers or {}
+        self.content_type = content_type
+
+    def body(self):
+        if self.value is None:
+            return b''
+        if isinstance(self.value, bytes):
+            return self.value
+        return json.dumps(self.value).encode('utf-8')
+
+
+class ApiError(Exception):
+    """
+    An error returned as a QRadar error response.
+    """
+
+    MESSAGES = {400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+                406: 'Not Acceptable', 409: 'Conflict',
+                415: 'Unsupported Media Type',
+                422: 'Unprocessable Entity', 429: 'Too Many Requests',
+                500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+    def __init__(self, code, api_code, message):
+        super(ApiError, self).__init__(message)
+        self.code = code
+        self.api_code = api_code
+        self.message = message
+
+    def response(self):
+        return MockResponse(self.code, {
+            'http_response': {'code': self.code,
+                              'message': self.MESSAGES.get(self.code, '')},
+            'code': self.api_code,
+            'message': self.message,
+            'description': '',
+            'details': {}})
+
+
+def _not_found(what):
+    return ApiError(404, 1002, what + ' does not exist.')
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError(422, 1005, name + ' must be an integer.')
+
+
+def _bool(value):
+    return str(value).lower() == 'true'
+
+
+class _Task:
+    """
+    An asynchronous task, an Ariel search or a QVM search, whose status
+    depends on how long ago it was started.
+    """
+
+    def __init__(self, duration, record_count, **info):
+        self.started = time.time()
+        self.duration = duration
+        self.record_count = record_count
+        self.canceled = False
+        self.save_results = False
+        self.info = info
+
+    def progress(self):
+        if self.duration <= 0:
+            return 1.0
+        return min(1.0, (time.time() - self.started) / self.duration)
+
+    def state(self, states, done):
+        if self.canceled:
+            return 'CANCELED'
+        progress = self.progress()
+        for state, until in states:
+            if progress < until:
+                return state
+        return done
+
+
+class MockApi:
+    """
+    The mock QRadar API over a Dataset. search_seconds is how long Ariel and
+    QVM searches take to complete. max_searches is the number of Ariel
+    searches that may run at once before new ones are refused with 503, or
+    None for no limit.
+    """
+
+    def __init__(self, dataset, search_seconds=1.0, max_searches=None):
+        self.data = dataset
+        self.search_seconds = search_seconds
+        self.max_searches = max_searches
+        self.searches = {}
+        self.qvm_tasks = {}
+        self._lock = threading.Lock()
+        self.routes = []
+        self._add_routes()
+
+    def route(self, method, pattern, handler, description):
+        self.routes.append((method, re.compile('^' + pattern + '$'), handler,
+                            pattern, description))
+
+    def handle(self, request):
+        """
+        Return the MockResponse for a MockRequest.
+        """
+
+        try:
+            methods = []
+            for method, pattern, handler, _, _ in self.routes:
+                match = pattern.match(request.path)
+                if match is None:
+                    continue
+                if method != request.method:
+                    methods.append(method)
+                    continue
+                return handler(request, *match.groups())
+            if methods:
+                raise ApiError(405, 1010, request.method + ' is not '
+                               'supported by ' + request.path + '.')
+            raise ApiError(404, 1002, 'No endpoint ' + request.path +
+                           ' exists.')
+        except QueryError as e:
+            return ApiError(422, e.code, str(e)).response()
+        except ApiError as e:
+            return e.response()
+
+    # Lists
+
+    def list_response(self, request, collection, indexes=None):
+        """
+        Return the records of collection selected by the filter, sort and
+        fields parameters and the Range header. indexes, if given, limits
+        the records to those indexes.
+        """
+
+        filter_text = request.param('filter')
+        sort_text = request.param('sort')
+        predicate = parse_filter(filter_text)
+        sort = parse_sort(sort_text)
+        fields = parse_fields(request.param('fields'))
+        item_range = parse_range(request.header('Range'))
+
+        if indexes is None:
+            indexes = collection.query(predicate, sort,
+                                       key=(filter_text, sort_text))
+        elif predicate is not None or sort:
+            records = dict((index, collection.get(index))
+                           for index in indexes)
+            indexes = [index for index in indexes
+                       if records[index] is not None and
+                       (predicate is None or predicate(records[index]))]
+            for path, descending in reversed(sort):
+                indexes.sort(key=lambda index: sort_key(records[index], path),
+                             reverse=descending)
+
+        total = len(indexes)
+        first, last = 0, total - 1
+        if item_range is not None:
+            first, last = item_range[0], min(item_range[1], total - 1)
+        records = []
+        for position in range(first, last + 1):
+            record = collection.get(indexes[position])
+            if record is None:
+                continue
+            records.append(select_fields(record, fields))
+
+        headers = {}
+        if records:
+            headers['Content-Range'] = ('items ' + str(first) + '-' +
+                                        str(first + len(records) - 1) + '/' +
+                                        str(total))
+        else:
+            headers['Content-Range'] = 'items */' + str(total)
+        return MockResponse(200, records, headers)
+
+    def item_response(self, request, record, code=200):
+        if record is None:
+            raise _not_found('The requested item')
+        return MockResponse(code, select_fields(
+            record, parse_fields(request.param('fields'))))
+
+    def _add_routes(self):
+        route = self.route
+        route('GET', 'help/versions', self.get_versions,
+              'Retrieve the available API versions.')
+        route('GET', 'help/capabilities', self.get_capabilities,
+              'Retrieve the endpoints of the API, grouped by category.')
+        route('GET', 'help/endpoints', self.get_endpoints,
+              'Retrieve a list of the endpoints of the API.')
+
+        route('GET', 'siem/offenses', self.get_offenses,
+              'Retrieve a list of offenses.')
+        route('GET', r'siem/offenses/(\d+)', self.get_offense,
+              'Retrieve an offense.')
+        route('POST', r'siem/offenses/(\d+)', self.post_offense,
+              'Update an offense.')
+        route('GET', r'siem/offenses/(\d+)/notes', self.get_notes,
+              'Retrieve the notes of an offense.')
+        route('POST', r'siem/offenses/(\d+)/notes', self.post_note,
+              'Create a note on an offense.')
+        route('GET', r'siem/offenses/(\d+)/notes/(\d+)', self.get_note,
+              'Retrieve a note of an offense.')
+        route('GET', 'siem/offense_types', self.lister('offense_types'),
+              'Retrieve a list of offense types.')
+        route('GET', r'siem/offense_types/(\d+)',
+              self.getter('offense_types', 0), 'Retrieve an offense type.')
+        route('GET', 'siem/offense_closing_reasons',
+              self.lister('closing_reasons'),
+              'Retrieve a list of offense closing reasons.')
+        route('POST', 'siem/offense_closing_reasons',
+              self.post_closing_reason, 'Create an offense closing reason.')
+        route('GET', r'siem/offense_closing_reasons/(\d+)',
+              self.getter('closing_reasons', 1),
+              'Retrieve an offense closing reason.')
+        route('GET', 'siem/source_addresses', self.lister('source_addresses'),
+              'Retrieve a list of offense source addresses.')
+        route('GET', r'siem/source_addresses/(\d+)',
+              self.getter('source_addresses', 1),
+              'Retrieve an offense source address.')
+        route('GET', 'siem/local_destination_addresses',
+              self.lister('local_destination_addresses'),
+              'Retrieve a list of offense local destination addresses.')
+        route('GET', r'siem/local_destination_addresses/(\d+)',
+              self.getter('local_destination_addresses', 1),
+              'Retrieve an offense local destination address.')
+
+        route('GET', 'ariel/databases', self.get_databases,
+              'Retrieve the names of the Ariel databases.')
+        route('GET', r'ariel/databases/(\w+)', self.get_database,
+              'Retrieve the columns of an Ariel database.')
+        route('GET', 'ariel/searches', self.get_searches,
+              'Retrieve the ids of the Ariel searches.')
+        route('POST', 'ariel/searches', self.post_search,
+              'Create a new Ariel search.')
+        route('GET', r'ariel/searches/([^/]+)', self.get_search,
+              'Retrieve the status of an Ariel search.')
+        route('POST', r'ariel/searches/([^/]+)', self.post_search_update,
+              'Cancel an Ariel search or save its results.')
+        route('DELETE', r'ariel/searches/([^/]+)', self.delete_search,
+              'Delete an Ariel search.')
+        route('GET', r'ariel/searches/([^/]+)/results',
+              self.get_search_results,
+              'Retrieve the results of an Ariel search.')
+
+        for kind in ('sets', 'maps', 'map_of_sets', 'tables'):
+            route('GET', 'reference_data/' + kind,
+                  self.reference_lister(kind),
+                  'Retrieve a list of reference data ' + kind + '.')
+            route('POST', 'reference_data/' + kind,
+                  self.reference_creator(kind),
+                  'Create a reference data ' + kind + ' collection.')
+            route('POST', 'reference_data/' + kind + '/bulk_load/([^/]+)',
+                  self.reference_bulk_loader(kind),
+                  'Add or update many elements of a reference data ' +
+                  kind + ' collection.')
+            route('GET', 'reference_data/' + kind + '/([^/]+)',
+                  self.reference_getter(kind),
+                  'Retrieve a reference data ' + kind + ' collection.')
+            route('POST', 'reference_data/' + kind + '/([^/]+)',
+                  self.reference_adder(kind),
+                  'Add or update an element of a reference data ' + kind +
+                  ' collection.')
+            route('DELETE', 'reference_data/' + kind + '/([^/]+)',
+                  self.reference_deleter(kind),
+                  'Remove a reference data ' + kind + ' collection or '
+                  'purge its elements.')
+            route('DELETE', 'reference_data/' + kind + '/([^/]+)/(.+)',
+                  self.reference_element_deleter(kind),
+                  'Remove an element from a reference data ' + kind +
+                  ' collection.')
+
+        route('GET', 'asset_model/assets', self.lister('assets'),
+              'Retrieve a list of assets.')
+        route('POST', r'asset_model/assets/(\d+)', self.post_asset,
+              'Update the properties of an asset.')
+        route('GET', 'asset_model/properties',
+              self.lister('asset_properties'),
+              'Retrieve a list of asset property types.')
+        route('GET', 'asset_model/saved_searches',
+              self.lister('asset_saved_searches'),
+              'Retrieve a list of asset saved searches.')
+        route('GET', r'asset_model/saved_searches/(\d+)/results',
+              self.get_asset_search_results,
+              'Retrieve the assets found by an asset saved search.')
+
+        route('GET', 'qvm/saved_searches',
+              self.lister('qvm_saved_searches'),
+              'Retrieve a list of vulnerability saved searches.')
+        route('GET', r'qvm/saved_searches/(\d+)/vuln_instances',
+              self.post_qvm_search,
+              'Start a vulnerability instance search from a saved search.')
+        route('GET', r'qvm/saved_searches/vuln_instances/(\d+)/status',
+              self.get_qvm_status,
+              'Retrieve the status of a vulnerability instance search.')
+        route('GET', r'qvm/saved_searches/vuln_instances/(\d+)/results/'
+              r'(vuln_instances|assets|vulnerabilities)',
+              self.get_qvm_results,
+              'Retrieve the results of a vulnerability instance search.')
+
+    # help
+
+    def get_versions(self, request):
+        versions = [{'id': index, 'version': version,
+                     'deprecated': False, 'removed': False}
+                    for index, version in enumerate(VERSIONS)]
+        return MockResponse(200, select_fields(
+            versions, parse_fields(request.param('fields'))))
+
+    def get_capabilities(self, request):
+        categories = {}
+        for method, _, _, pattern, description in self.routes:
+            category, _, api = _display_path(pattern).partition('/')
+            apis = categories.setdefault(category, {})
+            operations = apis.setdefault('/' + api, [])
+            operations.append({
+                'httpMethod': method,
+                'version': VERSIONS[-1],
+                'description': description,
+                'supportedContentTypes': [{'mimeType': 'application/json'}],
+                'parameters': _parameters(method, pattern)})
+        return MockResponse(200, {'categories': [
+            {'path': '/' + category,
+             'apis': [{'path': api, 'operations': operations}
+                      for api, operations in sorted(apis.items())]}
+            for category, apis in sorted(categories.items())]})
+
+    def get_endpoints(self, request):
+        endpoints = [{'id': index, 'http_method': method,
+                      'path': '/' + _display_path(pattern),
+                      'summary': description, 'version': VERSIONS[-1]}
+                     for index, (method, _, _, pattern, description)
+                     in enumerate(self.routes)]
+        return MockResponse(200, endpoints)
+
+    # Generic list and item handlers
+
+    def lister(self, name):
+        def handler(request):
+            return self.list_response(request, getattr(self.data, name))
+        return handler
+
+    def getter(self, name, first_id):
+        def handler(request, item_id):
+            collection = getattr(self.data, name)
+            return self.item_response(
+                request, collection.get(int(item_id) - first_id))
+        return handler
+
+    # siem
+
+    def get_offenses(self, request):
+        return self.list_response(request, self.data.offenses)
+
+    def get_offense(self, request, offense_id):
+        return self.item_response(
+            request, self.data.offenses.get(int(offense_id) - 1))
+
+    def post_offense(self, request, offense_id):
+        index = int(offense_id) - 1
+        offense = self.data.offenses.get(index)
+        if offense is None:
+            raise _not_found('Offense ' + offense_id)
+        changes = {}
+        status = request.param('status')
+        if status is not None:
+            status = status.upper()
+            if status not in ('OPEN', 'HIDDEN', 'CLOSED'):
+                raise ApiError(422, 1005, 'status must be OPEN, HIDDEN or '
+                               'CLOSED.')
+            changes['status'] = status
+            if status == 'CLOSED':
+                reason = request.param('closing_reason_id')
+                if reason is None:
+                    raise ApiError(422, 1005, 'closing_reason_id is required '
+                                   'to close an offense.')
+                if self.data.closing_reasons.get(
+                        _int(reason, 'closing_reason_id') - 1) is None:
+                    raise ApiError(422, 1005, 'closing_reason_id ' + reason +
+                                   ' does not exist.')
+                changes['closing_reason_id'] = int(reason)
+                changes['closing_user'] = 'admin'
+                changes['close_time'] = int(time.time() * 1000)
+            elif offense['status'] == 'CLOSED':
+                raise ApiError(409, 1008, 'A closed offense cannot be '
+                               'reopened.')
+        if request.param('assigned_to') is not None:
+            changes['assigned_to'] = request.param('assigned_to')
+        for name in ('follow_up', 'protected'):
+            if request.param(name) is not None:
+                changes[name] = _bool(request.param(name))
+        self.data.offenses.update(index, changes)
+        return self.item_response(request, self.data.offenses.get(index))
+
+    def get_notes(self, request, offense_id):
+        self._offense_or_404(offense_id)
+        return self.list_response(request,
+                                  self.data.notes_for(int(offense_id)))
+
+    def post_note(self, request, offense_id):
+        self._offense_or_404(offense_id)
+        text = request.param('note_text')
+        if not text:
+            raise ApiError(422, 1005, 'note_text is required.')
+        notes = self.data.notes_for(int(offense_id))
+        with self._lock:
+            note_id = int(offense_id) * 1000 + len(notes) + 1
+            notes.add({'id': note_id, 'note_text': text,
+                       'create_time': int(time.time() * 1000),
+                       'username': 'admin'})
+        return self.item_response(request, notes.get(len(notes) - 1), 201)
+
+    def get_note(self, request, offense_id, note_id):
+        self._offense_or_404(offense_id)
+        notes = self.data.notes_for(int(offense_id))
+        index = notes.find(lambda note: note['id'] == int(note_id))
+        if index is None:
+            raise _not_found('Note ' + note_id)
+        return self.item_response(request, notes.get(index))
+
+    def post_closing_reason(self, request):
+        text = request.param('reason')
+        if not text:
+            raise ApiError(422, 1005, 'reason is required.')
+        reasons = self.data.closing_reasons
+        if reasons.find(lambda reason: reason['text'] == text) is not None:
+            raise ApiError(409, 1004, 'A closing reason with that text '
+                           'already exists.')
+        with self._lock:
+            index = reasons.add({'id': len(reasons) + 1, 'text': text,
+                                 'is_reserved': False, 'is_deleted': False})
+        return self.item_response(request, reasons.get(index), 201)
+
+    def _offense_or_404(self, offense_id):
+        if self.data.offenses.get(int(offense_id) - 1) is None:
+            raise _not_found('Offense ' + offense_id)
+
+    # ariel
+
+    def get_databases(self, request):
+        return MockResponse(200, sorted(ARIEL_DATABASES))
+
+    def get_database(self, request, name):
+        if name not in ARIEL_DATABASES:
+            raise _not_found('Database ' + name)
+        columns = [{'name': column,
+                    'argument_type': _column_type(column),
+                    'indexable': column in ('sourceip', 'destinationip',
+                                            'qid', 'username'),
+                    'nullable': column == 'username',
+                    'object_value_type': _column_type(column),
+                    'provider_name': name.upper()}
+                   for column in ARIEL_DATABASES[name]]
+        return MockResponse(200, select_fields(
+            {'columns': columns}, parse_fields(request.param('fields'))))
+
+    def get_searches(self, request):
+        with self._lock:
+            return MockResponse(200, list(self.searches))
+
+    def post_search(self, request):
+        query = request.param('query_expression')
+        if not query:
+            raise ApiError(422, 1005, 'query_expression is required.')
+        match = _SELECT_PATTERN.match(query)
+        if match is None:
+            raise ApiError(422, 2000, 'The AQL query could not be parsed: ' +
+                           query)
+        database = match.group(2).lower()
+        if database not in ARIEL_DATABASES:
+            raise ApiError(422, 2000, 'Unknown database ' + database + '.')
+        columns, numeric = _select_columns(match.group(1), database)
+        limit = _LIMIT_PATTERN.search(query)
+        record_count = (int(limit.group(1)) if limit
+                        else self.data.events_per_search)
+
+        with self._lock:
+            running = sum(1 for search in self.searches.values()
+                          if search.state(_SEARCH_STATES, 'COMPLETED')
+                          in ('WAIT', 'EXECUTE', 'SORTING'))
+            if self.max_searches is not None and running >= self.max_searches:
+                raise ApiError(503, 1020, 'The maximum number of concurrent '
+                               'searches has been reached.')
+            search_id = str(uuid.uuid4())
+            self.searches[search_id] = _Task(
+                self.search_seconds, record_count, query=query,
+                database=database, columns=columns, numeric=numeric,
+                salt=len(self.searches))
+        return MockResponse(201, self._search_status(search_id))
+
+    def get_search(self, request, search_id):
+        return MockResponse(200, self._search_status(search_id))
+
+    def post_search_update(self, request, search_id):
+        search = self._search(search_id)
+        status = request.param('status')
+        if status is not None:
+            if status.upper() != 'CANCELED':
+                raise ApiError(422, 1005, 'status can only be CANCELED.')
+            search.canceled = True
+        if request.param('save_results') is not None:
+            search.save_results = _bool(request.param('save_results'))
+        return MockResponse(200, self._search_status(search_id))
+
+    def delete_search(self, request, search_id):
+        status = self._search_status(search_id)
+        with self._lock:
+            del self.searches[search_id]
+        return MockResponse(202, status)
+
+    def get_search_results(self, request, search_id):
+        search = self._search(search_id)
+        if search.state(_SEARCH_STATES, 'COMPLETED') != 'COMPLETED':
+            raise ApiError(404, 1003, 'The search ' + search_id + ' has not '
+                           'completed.')
+        item_range = parse_range(request.header('Range'))
+        first, last = 0, search.record_count - 1
+        if item_range is not None:
+            first = item_range[0]
+            last = min(item_range[1], search.record_count - 1)
+        columns = search.info['columns']
+        rows = (self.data.event_row(index, columns, search.info['salt'],
+                                    search.info['numeric'])
+                for index in range(first, last + 1))
+
+        headers = {}
+        if last >= first:
+            headers['Content-Range'] = ('items ' + str(first) + '-' +
+                                        str(last) + '/' +
+                                        str(search.record_count))
+        accept = request.header('Accept', 'application/json')
+        if 'csv' in accept:
+            output = io.StringIO()
+            writer = csv.DictWriter(output, columns)
+            writer.writeheader()
+            writer.writerows(rows)
+            return MockResponse(200, output.getvalue().encode('utf-8'),
+                                headers, 'application/csv')
+        if 'json' not in accept and '*/*' not in accept:
+            raise ApiError(406, 1009, 'Results can be returned as '
+                           'application/json or application/csv.')
+        return MockResponse(200, {search.info['database']: list(rows)},
+                            headers)
+
+    def _search(self, search_id):
+        with self._lock:
+            search = self.searches.get(search_id)
+        if search is None:
+            raise _not_found('Search ' + search_id)
+        return search
+
+    def _search_status(self, search_id):
+        search = self._search(search_id)
+        status = search.state(_SEARCH_STATES, 'COMPLETED')
+        progress = int(search.progress() * 100)
+        completed = status == 'COMPLETED'
+        return {'search_id': search_id,
+                'status': status,
+                'progress': progress,
+                'completed': completed,
+                'record_count': search.record_count if completed else 0,
+                'data_total_size': search.record_count * 100,
+                'query_execution_time': int(search.duration * 1000),
+                'save_results': search.save_results,
+                'cursor_id': search_id,
+                'compressed_data_file_count': 0,
+                'compressed_data_total_size': 0,
+                'data_file_count': 1,
+                'index_file_count': 0,
+                'index_total_size': 0,
+                'processed_record_count': (search.record_count * progress //
+                                           100),
+                'desired_retention_time_msec': 86400000,
+                'error_messages': [],
+                'progress_details': []}
+
+    # reference_data
+
+    def _collection(self, kind, name):
+        collection = self.data.reference_data[kind].get(name)
+        if collection is None:
+            raise _not_found('The reference data collection ' + name)
+        return collection
+
+    def reference_lister(self, kind):
+        def handler(request):
+            with self.data.lock:
+                summaries = [_summary(collection) for collection in
+                             self.data.reference_data[kind].values()]
+            listing = Collection(len(summaries), summaries.__getitem__)
+            return self.list_response(request, listing)
+        return handler
+
+    def reference_creator(self, kind):
+        def handler(request):
+            name = request.param('name')
+            element_type = (request.param('element_type') or
+                            request.param('value_type') or 'ALN').upper()
+            if not name:
+                raise ApiError(422, 1005, 'name is required.')
+            if element_type not in ELEMENT_TYPES:
+                raise ApiError(422, 1005, 'element_type must be one of ' +
+                               ', '.join(ELEMENT_TYPES) + '.')
+            collection = {'name': name,
+                          'element_type': element_type,
+                          'creation_time': int(time.time() * 1000),
+                          'number_of_elements': 0,
+                          'timeout_type': request.param('timeout_type',
+                                                        'UNKNOWN'),
+                          'data': {}}
+            if request.param('time_to_live'):
+                collection['time_to_live'] = request.param('time_to_live')
+            if kind in ('map_of_sets', 'tables'):
+                collection['key_label'] = request.param('key_label')
+                collection['value_label'] = request.param('value_label')
+            if kind == 'tables':
+                collection['outer_key_label'] = request.param(
+                    'outer_key_label')
+                key_types = request.param('key_name_types')
+                if key_types:
+                    try:
+                        key_types = json.loads(key_types)
+                    except ValueError:
+                        raise ApiError(422, 1005, 'key_name_types is not '
+                                       'valid JSON.')
+                    collection['key_name_types'] = dict(
+                        (item['key_name'], item['element_type'])
+                        for item in key_types)
+            with self.data.lock:
+                if name in self.data.reference_data[kind]:
+                    raise ApiError(409, 1004, 'The reference data '
+                                   'collection ' + name + ' already exists.')
+                self.data.reference_data[kind][name] = collection
+            return MockResponse(201, _summary(collection))
+        return handler
+
+    def reference_getter(self, kind):
+        def handler(request, name):
+            with self.data.lock:
+                collection = self._collection(kind, name)
+                value = dict(_summary(collection))
+                value['data'] = _data(kind, collection['data'])
+            return MockResponse(200, select_fields(
+                value, parse_fields(request.param('fields'))))
+        return handler
+
+    def reference_adder(self, kind):
+        def handler(request, name):
+            value = request.param('value')
+            if value is None:
+                raise ApiError(422, 1005, 'value is required.')
+            source = request.param('source', 'reference data api')
+            with self.data.lock:
+                collection = self._collection(kind, name)
+                _check_type(collection['element_type'], value)
+                if kind == 'sets':
+                    _add_set_value(collection['data'], value, source)
+                elif kind == 'maps':
+                    collection['data'][_required(request, 'key')] = (
+                        _element(value, source))
+                elif kind == 'map_of_sets':
+                    _add_set_value(collection['data'].setdefault(
+                        _required(request, 'key'), {}), value, source)
+                else:
+                    collection['data'].setdefault(
+                        _required(request, 'outer_key'), {})[
+                        _required(request, 'inner_key')] = _element(value,
+                                                                    source)
+                _count(kind, collection)
+                return MockResponse(200, _summary(collection))
+        return handler
+
+    def reference_bulk_loader(self, kind):
+        def handler(request, name):
+            body = request.json()
+            source = 'reference data api'
+            with self.data.lock:
+                collection = self._collection(kind, name)
+                data = collection['data']
+                try:
+                    if kind == 'sets':
+                        for value in body:
+                            _add_set_value(data, str(value), source)
+                    elif kind == 'maps':
+                        for key, value in body.items():
+                            data[key] = _element(str(value), source)
+                    elif kind == 'map_of_sets':
+                        for key, values in body.items():
+                            elements = data.setdefault(key, {})
+                            for value in values:
+                                _add_set_value(elements, str(value), source)
+                    else:
+                        for outer_key, inner in body.items():
+                            row = data.setdefault(outer_key, {})
+                            for inner_key, value in inner.items():
+                                row[inner_key] = _element(str(value), source)
+                except (AttributeError, TypeError):
+                    raise ApiError(422, 1005, 'The request body does not '
+                                   'have the form required for reference '
+                                   'data ' + kind + '.')
+                _count(kind, collection)
+                return MockResponse(200, _summary(collection))
+        return handler
+
+    def reference_deleter(self, kind):
+        def handler(request, name):
+            with self.data.lock:
+                collection = self._collection(kind, name)
+                if _bool(request.param('purge_only', 'false')):
+                    collection['data'] = {}
+                    _count(kind, collection)
+                else:
+                    del self.data.reference_data[kind][name]
+            return MockResponse(202, {
+                'id': int(time.time() * 1000) % 100000,
+                'name': 'Reference data deletion',
+                'status': 'QUEUED',
+                'created_by': 'admin',
+                'created': int(time.time() * 1000)})
+        return handler
+
+    def reference_element_deleter(self, kind):
+        def handler(request, name, key):
+            with self.data.lock:
+                collection = self._collection(kind, name)
+                data = collection['data']
+                if kind == 'sets':
+                    if key not in data:
+                        raise _not_found('The value ' + key)
+                    del data[key]
+                elif kind == 'tables' and '/' in key:
+                    outer_key, inner_key = key.split('/', 1)
+                    if inner_key not in data.get(outer_key, {}):
+                        raise _not_found('The key ' + key)
+                    del data[outer_key][inner_key]
+                elif kind == 'map_of_sets' and request.param('value'):
+                    if request.param('value') not in data.get(key, {}):
+                        raise _not_found('The value ' +
+                                         request.param('value'))
+                    del data[key][request.param('value')]
+                elif key in data:
+                    del data[key]
+                else:
+                    raise _not_found('The key ' + key)
+                _count(kind, collection)
+                return MockResponse(200, _summary(collection))
+        return handler
+
+    # asset_model
+
+    def post_asset(self, request, asset_id):
+        index = int(asset_id) - 1
+        asset = self.data.assets.get(index)
+        if asset is None:
+            raise _not_found('Asset ' + asset_id)
+        body = request.json()
+        properties = list(asset['properties'])
+        for change in body.get('properties', []):
+            properties = [item for item in properties
+                          if item['type_id'] != change.get('type_id')]
+            properties.append({'id': index * 8 + len(properties) + 1,
+                               'name': change.get('name', ''),
+                               'value': change.get('value'),
+                               'type_id': change.get('type_id')})
+        self.data.assets.update(index, {'properties': properties})
+        return MockResponse(202, None)
+
+    def get_asset_search_results(self, request, search_id):
+        search = self.data.asset_saved_searches.get(int(search_id) - 1)
+        if search is None:
+            raise _not_found('Saved search ' + search_id)
+        predicates = {
+            1: None,
+            2: parse_filter('properties.value = "Ottawa"'),
+            3: parse_filter('risk_score_sum > 500')}
+        indexes = self.data.assets.query(
+            predicates[search['id']], key=('asset_saved_search', search_id))
+        return self.list_response(request, self.data.assets, indexes)
+
+    # qvm
+
+    def post_qvm_search(self, request, saved_search_id):
+        if self.data.qvm_saved_searches.get(int(saved_search_id) - 1) is None:
+            raise _not_found('Saved search ' + saved_search_id)
+        with self._lock:
+            task_id = len(self.qvm_tasks) + 1
+            self.qvm_tasks[task_id] = _Task(
+                self.search_seconds, len(self.data.vuln_instances),
+                saved_search_id=int(saved_search_id))
+        return MockResponse(201, self._qvm_status(task_id))
+
+    def get_qvm_status(self, request, task_id):
+        return MockResponse(200, self._qvm_status(int(task_id)))
+
+    def get_qvm_results(self, request, task_id, kind):
+        status = self._qvm_status(int(task_id))
+        if status['status'] != 'COMPLETED':
+            raise ApiError(404, 1003, 'The search ' + task_id + ' has not '
+                           'completed.')
+        collection = {'vuln_instances': self.data.vuln_instances,
+                      'assets': self.data.assets,
+                      'vulnerabilities': self.data.vulnerabilities}[kind]
+        return self.list_response(request, collection)
+
+    def _qvm_status(self, task_id):
+        with self._lock:
+            task = self.qvm_tasks.get(task_id)
+        if task is None:
+            raise _not_found('Task ' + str(task_id))
+        status = task.state((('QUEUED', 0.2), ('PROCESSING', 1.0)),
+                            'COMPLETED')
+        return {'id': task_id,
+                'saved_search_id': task.info['saved_search_id'],
+                'status': status,
+                'retention_period_in_days': 7,
+                'created': int(task.started * 1000),
+                'progress': int(task.progress() * 100)}
+
+
+def _display_path(pattern):
+    # Show the regular expression groups of a route as named parameters.
+    names = iter(['id', 'sub_id', 'value'])
+    path = re.sub(r'\((?:[^()]|\([^()]*\))*\)',
+                  lambda match: '{' + next(names) + '}', pattern)
+    return path.replace('\\', '')
+
+
+def _parameters(method, pattern):
+    parameters = []
+    for name in re.findall(r'{(\w+)}', _display_path(pattern)):
+        parameters.append({'name': name, 'description': '', 'source': 'PATH',
+                           'required': True,
+                           'supportedContentTypes': [
+                               {'dataType': 'String',
+                                'mimeType': 'text/plain'}]})
+    if method == 'GET':
+        for name in ('fields', 'filter', 'sort', 'Range'):
+            parameters.append({'name': name, 'description': '',
+                               'source': ('HEADER' if name == 'Range'
+                                          else 'QUERY'),
+                               'required': False,
+                               'supportedContentTypes': [
+                                   {'dataType': 'String',
+                                    'mimeType': 'text/plain'}]})
+    return parameters
+
+
+def _column_type(column):
+    name = column.lower()
+    if 'time' in name or name.endswith(('count', 'bytes', 'packets')):
+        return 'NUMERIC'
+    if name.endswith('ip'):
+        return 'IP'
+    if name.endswith(('port', 'id')):
+        return 'NUMERIC'
+    return 'STRING'
+
+
+def _select_columns(select_list, database):
+    # Split the select list on the commas that are not inside parentheses,
+    # and name each column by its alias if it has one. Returns the columns
+    # and those that are function results, such as COUNT(*).
+    columns = []
+    numeric = []
+    depth = 0
+    current = ''
+    for character in select_list + ',':
+        if character == ',' and depth == 0:
+            item = current.strip()
+            current = ''
+            if not item:
+                continue
+            if item == '*':
+                columns.extend(ARIEL_DATABASES[database])
+                continue
+            alias = _ALIAS_PATTERN.search(item)
+            columns.append(alias.group(1) if alias else item)
+            if '(' in item:
+                numeric.append(columns[-1])
+            continue
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        current += character
+    return columns, numeric
+
+
+def _element(value, source):
+    now = int(time.time() * 1000)
+    return {'value': value, 'source': source, 'first_seen': now,
+            'last_seen': now}
+
+
+def _add_set_value(elements, value, source):
+    # The elements of sets are kept in a dictionary by value.
+    element = elements.get(value)
+    if element is None:
+        elements[value] = _element(value, source)
+    else:
+        element['last_seen'] = int(time.time() * 1000)
+
+
+def _count(kind, collection):
+    data = collection['data']
+    if kind in ('sets', 'maps'):
+        count = len(data)
+    else:
+        count = sum(len(value) for value in data.values())
+    collection['number_of_elements'] = count
+
+
+def _data(kind, data):
+    # Return the data of a reference data collection as the API does, with
+    # the elements of sets in lists.
+    if kind == 'sets':
+        return [dict(element) for element in data.values()]
+    if kind == 'map_of_sets':
+        return dict((key, [dict(element) for element in elements.values()])
+                    for key, elements in data.items())
+    if kind == 'maps':
+        return dict((key, dict(element)) for key, element in data.items())
+    return dict((key, dict((inner_key, dict(element))
+                           for inner_key, element in row.items()))
+                for key, row in data.items())
+
+
+def _summary(collection):
+    return dict((name, value) for name, value in collection.items()
+                if name != 'data')
+
+
+def _required(request, name):
+    value = request.param(name)
+    if value is None:
+        raise ApiError(422, 1005, name + ' is required.')
+    return value
+
+
+def _check_type(element_type, value):
+    if element_type == 'NUM':
+        try:
+            float(value)
+        except ValueError:
+            raise ApiError(422, 1005, value + ' is not a NUM value.')
+    elif element_type == 'PORT':
+        if not value.isdigit() or int(value) > 65535:
+            raise ApiError(422, 1005, value + ' is not a PORT value.')
+    elif element_type == 'IP':
+        parts = value.split('.')
+        if len(parts) != 4 or not all(part.isdigit() and int(part) < 256
+                                      for part in parts):
+            if ':' not in value:
+                raise ApiError(422, 1005, value + ' is not an IP value.')
@@ -0,0 +1,435 @@
+"""
+Synthetic data for the mock server. Large collections such as offenses and
+assets are never stored: each record is built from its index when it is
+requested, from a hash of the index, so the same index always gives the same
+record and a collection of millions of records costs no memory. Changes made
+through the API are kept as overrides on top of the built records, and new
+records are appended after them.
+
+Filtering or sorting a collection has to look at every record, so the
+matching indexes of recent queries are cached.
+"""
+import collections
+import threading
+
+from mockquery import sort_key
+
+
+_MASK = 0xFFFFFFFFFFFFFFFF
+
+# The time of the first synthetic record, in milliseconds since the epoch.
+BASE_TIME = 1700000000000
+
+
+def mix(index, salt=0):
+    """
+    Return a well mixed 64 bit number for index, the same every time.
+    """
+
+    x = (index * 0x9E3779B97F4A7C15 + (salt + 1) * 0xBF58476D1CE4E5B9) & _MASK
+    x ^= x >> 31
+    x = (x * 0x94D049BB133111EB) & _MASK
+    x ^= x >> 29
+    return x
+
+
+def pick(index, salt, choices):
+    return choices[mix(index, salt) % len(choices)]
+
+
+def ip_address(index, prefix='10'):
+    value = mix(index, 99)
+    if prefix == '10':
+        return '10.{0}.{1}.{2}'.format(value >> 16 & 255, value >> 8 & 255,
+                                       value & 255)
+    return prefix + '.{0}.{1}'.format(value >> 8 & 255, value & 255)
+
+
+class Collection:
+    """
+    A list of records. The first count records are built by build(index)
+    when they are requested; records added later are stored. Records can be
+    updated or deleted by index.
+    """
+
+    def __init__(self, count=0, build=None, cache_size=8):
+        self.count = count
+        self.build = build
+        self.added = []
+        self.overrides = {}
+        self.deleted = set()
+        self.version = 0
+        self.cache_size = cache_size
+        self._queries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count + len(self.added)
+
+    def get(self, index):
+        """
+        Return the record at index, or None if it was deleted.
+        """
+
+        if index in self.deleted or index < 0 or index >= len(self):
+            return None
+        if index < self.count:
+            record = self.build(index)
+        else:
+            record = dict(self.added[index - self.count])
+        if index in self.overrides:
+            record.update(self.overrides[index])
+        return record
+
+    def add(self, record):
+        """
+        Add a record and return its index.
+        """
+
+        with self._lock:
+            self.added.append(record)
+            self._changed()
+            return len(self) - 1
+
+    def update(self, index, changes):
+        with self._lock:
+            self.overrides.setdefault(index, {}).update(changes)
+            self._changed()
+
+    def delete(self, index):
+        with self._lock:
+            self.deleted.add(index)
+            self._changed()
+
+    def find(self, predicate):
+        """
+        Return the index of the first record for which predicate is True,
+        or None.
+        """
+
+        for index in range(len(self)):
+            record = self.get(index)
+            if record is not None and predicate(record):
+                return index
+        return None
+
+    def query(self, predicate=None, sort=None, key=None):
+        """
+        Return the indexes of the records that match predicate, in the order
+        given by sort, a list of (field path, descending) pairs. key
+        identifies the query for the cache. Without a predicate, sort or
+        deleted records the indexes are a range and nothing is computed.
+        """
+
+        if predicate is None and not sort and not self.deleted:
+            return range(len(self))
+        with self._lock:
+            cache_key = (key, self.version)
+            indexes = self._queries.get(cache_key)
+            if indexes is not None:
+                self._queries.move_to_end(cache_key)
+                return indexes
+
+        indexes = []
+        records = {}
+        for index in range(len(self)):
+            record = self.get(index)
+            if record is None:
+                continue
+            if predicate is None or predicate(record):
+                indexes.append(index)
+                if sort:
+                    records[index] = record
+        for path, descending in reversed(sort or []):
+            indexes.sort(key=lambda index: sort_key(records[index], path),
+                         reverse=descending)
+
+        with self._lock:
+            self._queries[cache_key] = indexes
+            while len(self._queries) > self.cache_size:
+                self._queries.popitem(last=False)
+        return indexes
+
+    def _changed(self):
+        # Called with the lock held.
+        self.version += 1
+        self._queries.clear()
+
+
+OFFENSE_TYPES = ['Source IP', 'Destination IP', 'Event Name', 'Username',
+                 'Source MAC Address', 'Destination MAC Address',
+                 'Log Source', 'Host Name', 'Source Port', 'Destination Port',
+                 'Source IPv6', 'Destination IPv6', 'Source ASN',
+                 'Destination ASN', 'Rule', 'App Id', 'Scheduled Search']
+
+OFFENSE_DESCRIPTIONS = ['Multiple Login Failures for the Same User',
+                        'Excessive Firewall Denies Between Hosts',
+                        'Potential Botnet Connection',
+                        'Local Malware Events',
+                        'Remote Access Policy Violation',
+                        'Suspicious Outbound Communication',
+                        'Vulnerability Scanner Detected',
+                        'Login Failures Followed By Success']
+
+CATEGORIES = ['Authentication', 'User Login Failure', 'Firewall Deny',
+              'Malware', 'Botnet', 'Policy', 'Suspicious Activity',
+              'Recon', 'Access Denied', 'Exploit']
+
+LOG_SOURCES = [(63, 'Custom Rule Engine-8 :: qradar', 18, 'EventCRE'),
+               (64, 'Firewall @ 10.1.1.1', 4, 'Cisco ASA'),
+               (65, 'WindowsAuthServer @ 10.1.1.2', 12, 'Microsoft Windows'),
+               (66, 'Linux OS @ 10.1.1.3', 11, 'Linux OS')]
+
+USERS = ['admin', 'alice', 'bob', 'carol', 'dave', 'erin', 'frank', None]
+
+STATUSES = ['OPEN'] * 6 + ['HIDDEN', 'CLOSED']
+
+CLOSING_REASONS = ['False-Positive, Tuned', 'Non-Issue', 'Policy Violation']
+
+ASSET_PROPERTY_TYPES = [(1001, 'Unified Name'), (1002, 'Given Name'),
+                        (1003, 'Business Owner'), (1004, 'Location'),
+                        (1005, 'Description'), (1006, 'Technical Owner')]
+
+EVENT_COLUMNS = ['starttime', 'sourceip', 'destinationip', 'sourceport',
+                 'destinationport', 'qid', 'username', 'magnitude',
+                 'category', 'logsourceid', 'eventcount', 'protocolid']
+
+FLOW_COLUMNS = ['firstpackettime', 'lastpackettime', 'sourceip',
+                'destinationip', 'sourceport', 'destinationport',
+                'protocolid', 'sourcebytes', 'destinationbytes',
+                'sourcepackets', 'destinationpackets', 'applicationid']
+
+
+class Dataset:
+    """
+    All the data served by the mock server. The sizes of the large
+    collections are set by the arguments; the others have a few records.
+    """
+
+    def __init__(self, offenses=10000, assets=10000, vulnerabilities=10000,
+                 events=10000):
+        self.offense_count = offenses
+        self.asset_count = max(1, assets)
+        self.events_per_search = events
+
+        self.offenses = Collection(offenses, self._offense)
+        self.offense_types = Collection(len(OFFENSE_TYPES),
+                                        self._offense_type)
+        self.closing_reasons = Collection(len(CLOSING_REASONS),
+                                          self._closing_reason)
+        self.notes = {}
+        self.source_address_count = max(1, offenses // 4)
+        self.source_addresses = Collection(self.source_address_count,
+                                           self._source_address)
+        self.local_destination_count = max(1, offenses // 8)
+        self.local_destination_addresses = Collection(
+            self.local_destination_count, self._local_destination)
+
+        self.assets = Collection(assets, self._asset)
+        self.asset_properties = Collection(len(ASSET_PROPERTY_TYPES),
+                                           self._asset_property)
+        self.asset_saved_searches = Collection(3, self._asset_saved_search)
+
+        self.vulnerability_count = max(1, vulnerabilities // 10)
+        self.vulnerabilities = Collection(self.vulnerability_count,
+                                          self._vulnerability)
+        self.vuln_instances = Collection(vulnerabilities,
+                                         self._vuln_instance)
+        self.qvm_saved_searches = Collection(3, self._qvm_saved_search)
+
+        self.reference_data = {'sets': collections.OrderedDict(),
+                               'maps': collections.OrderedDict(),
+                               'map_of_sets': collections.OrderedDict(),
+                               'tables': collections.OrderedDict()}
+        self.lock = threading.Lock()
+
+    def notes_for(self, offense_id):
+        with self.lock:
+            return self.notes.setdefault(offense_id, Collection())
+
+    def _offense(self, index):
+        offense_id = index + 1
+        h = mix(index, 1)
+        status = STATUSES[h % len(STATUSES)]
+        start_time = BASE_TIME + index * 60000
+        source_index = index % self.source_address_count
+        destination_index = index % self.local_destination_count
+        log_source = LOG_SOURCES[h >> 8 & 3]
+        offense_type = (h >> 12) % 4
+        user = USERS[(h >> 16) % len(USERS)]
+        categories = [CATEGORIES[(h >> 20) % len(CATEGORIES)],
+                      CATEGORIES[(h >> 24) % len(CATEGORIES)]]
+        return {
+            'id': offense_id,
+            'description': (OFFENSE_DESCRIPTIONS[(h >> 28) %
+                                                 len(OFFENSE_DESCRIPTIONS)] +
+                            '\n'),
+            'offense_type': offense_type,
+            'offense_source': (ip_address(source_index) if offense_type == 0
+                               else ip_address(destination_index, '192.168')
+                               if offense_type == 1
+                               else user or 'unknown'),
+            'status': status,
+            'magnitude': 1 + (h >> 32) % 10,
+            'severity': 1 + (h >> 36) % 10,
+            'credibility': 1 + (h >> 40) % 10,
+            'relevance': 1 + (h >> 44) % 10,
+            'assigned_to': user,
+            'follow_up': bool(h >> 48 & 1),
+            'protected': False,
+            'inactive': bool(h >> 49 & 1),
+            'start_time': start_time,
+            'last_updated_time': start_time + (h >> 50 & 1023) * 1000,
+            'close_time': (start_time + 86400000 if status == 'CLOSED'
+                           else None),
+            'closing_user': 'admin' if status == 'CLOSED' else None,
+            'closing_reason_id': 1 if status == 'CLOSED' else None,
+            'event_count': 1 + (h >> 20) % 5000,
+            'flow_count': (h >> 24) % 100,
+            'categories': categories,
+            'category_count': len(set(categories)),
+            'source_count': 1,
+            'source_address_ids': [source_index + 1],
+            'local_destination_count': 1,
+            'local_destination_address_ids': [destination_index + 1],
+            'remote_destination_count': (h >> 30) % 3,
+            'username_count': 0 if user is None else 1,
+            'device_count': 1,
+            'log_sources': [{'id': log_source[0], 'name': log_source[1],
+                             'type_id': log_source[2],
+                             'type_name': log_source[3]}],
+            'rules': [{'id': 100000 + (h >> 34) % 500, 'type': 'CRE_RULE'}],
+            'source_network': 'other',
+            'destination_networks': ['Net-10-172-192.Net_192_168_0_0'],
+            'security_category_count': 1 + (h >> 38) % 3,
+            'policy_category_count': 0,
+            'domain_id': 0,
+        }
+
+    def _offense_type(self, index):
+        return {'id': index, 'name': OFFENSE_TYPES[index],
+                'property_name': OFFENSE_TYPES[index].lower().replace(' ',
+                                                                      ''),
+                'database_type': 'COMMON', 'custom': False}
+
+    def _closing_reason(self, index):
+        return {'id': index + 1, 'text': CLOSING_REASONS[index],
+                'is_reserved': index == 0, 'is_deleted': False}
+
+    def _source_address(self, index):
+        return {'id': index + 1,
+                'source_ip': ip_address(index),
+                'offense_ids': [offense_index + 1 for offense_index in
+                                range(index, self.offense_count,
+                                      self.source_address_count)],
+                'magnitude': 1 + mix(index, 2) % 10,
+                'network': 'other',
+                'first_event_flow_seen': BASE_TIME + index * 60000,
+                'last_event_flow_seen': BASE_TIME + index * 60000 + 3600000,
+                'event_flow_count': 1 + mix(index, 3) % 10000,
+                'domain_id': 0}
+
+    def _local_destination(self, index):
+        return {'id': index + 1,
+                'local_destination_ip': ip_address(index, '192.168'),
+                'offense_ids': [offense_index + 1 for offense_index in
+                                range(index, self.offense_count,
+                                      self.local_destination_count)],
+                'magnitude': 1 + mix(index, 4) % 10,
+                'network': 'Net-10-172-192.Net_192_168_0_0',
+                'first_event_flow_seen': BASE_TIME + index * 60000,
+                'last_event_flow_seen': BASE_TIME + index * 60000 + 3600000,
+                'event_flow_count': 1 + mix(index, 5) % 10000,
+                'domain_id': 0}
+
+    def _asset(self, index):
+        h = mix(index, 6)
+        ip = ip_address(index)
+        name = 'host-{0:07d}'.format(index)
+        return {
+            'id': index + 1,
+            'domain_id': 0,
+            'hostnames': [{'id': index * 2 + 1, 'name': name + '.example.com',
+                           'type': 'DNS'}],
+            'interfaces': [{
+                'id': index * 2 + 1,
+                'mac_address': ':'.join('{0:02X}'.format(h >> shift & 255)
+                                        for shift in range(0, 48, 8)),
+                'ip_addresses': [{'id': index * 2 + 1, 'value': ip,
+                                  'type': 'IPV4'}]}],
+            'properties': [
+                {'id': index * 8 + 1, 'name': 'Unified Name', 'value': name,
+                 'type_id': 1001},
+                {'id': index * 8 + 2, 'name': 'Location',
+                 'value': pick(index, 7, ['Ottawa', 'Austin', 'Cork',
+                                          'Singapore']),
+                 'type_id': 1004}],
+            'products': [],
+            'users': [{'id': index + 1,
+                       'username': pick(index, 8, USERS[:-1])}],
+            'vulnerability_count': h >> 8 & 31,
+            'risk_score_sum': float(h >> 16 & 1023),
+        }
+
+    def _asset_property(self, index):
+        property_id, name = ASSET_PROPERTY_TYPES[index]
+        return {'id': property_id, 'name': name, 'data_type': 'STRING',
+                'display': True, 'custom': False, 'state': 0}
+
+    def _asset_saved_search(self, index):
+        names = ['All Assets', 'Assets in Ottawa', 'High Risk Assets']
+        return {'id': index + 1, 'name': names[index],
+                'description': names[index], 'columns': [], 'filters': []}
+
+    def _vulnerability(self, index):
+        h = mix(index, 9)
+        return {'id': index + 1,
+                'name': 'Synthetic vulnerability ' + str(index + 1),
+                'cve_id': 'CVE-2023-{0:05d}'.format(index + 1),
+                'risk_score': float(h % 100) / 10,
+                'severity': pick(index, 10, ['Low', 'Medium', 'High',
+                                             'Critical'])}
+
+    def _vuln_instance(self, index):
+        h = mix(index, 11)
+        return {'asset_id': 1 + h % self.asset_count,
+                'vulnerability_id': 1 + (h >> 16) % self.vulnerability_count,
+                'port': pick(index, 12, [22, 80, 443, 445, 3389, 8080]),
+                'protocol': 'TCP',
+                'first_seen_date': BASE_TIME + index * 1000,
+                'last_seen_date': BASE_TIME + index * 1000 + 86400000,
+                'risk_score': float(h >> 32 & 1023) / 10}
+
+    def _qvm_saved_search(self, index):
+        names = ['High risk', 'Critical vulnerabilities', 'All instances']
+        return {'id': index + 1, 'name': names[index],
+                'description': names[index]}
+
+    def event_row(self, index, columns, salt=0, numeric=()):
+        """
+        Return row index of an Ariel search result with the given columns.
+        The columns in numeric, such as the results of aggregate functions,
+        are always numbers.
+        """
+
+        h = mix(index, 13 + salt)
+        row = {}
+        for column in columns:
+            name = column.lower()
+            if 'time' in name:
+                row[column] = BASE_TIME + index * 1000 + h % 1000
+            elif name.endswith('ip'):
+                row[column] = ip_address(h >> (len(name) % 8), '10')
+            elif name.endswith('port'):
+                row[column] = 1 + (h >> 16) % 65535
+            elif name in ('username', 'user'):
+                row[column] = pick(index, 14, USERS)
+            elif name in ('category', 'magnitude', 'severity',
+                          'credibility', 'relevance'):
+                row[column] = 1 + (h >> 20) % 10
+            elif (column in numeric or
+                  name.endswith(('id', 'count', 'bytes', 'packets'))):
+                row[column] = (h >> 24) % 100000
+            else:
+                row[column] = column + ' ' + str(h % 1000)
+        return row
@@ -0,0 +1,404 @@
+"""
+The query parameters of the mock server: the filter and fields parameters
+and the sort parameter of list endpoints, and the items Range header.
+
+filter supports the comparisons of the QRadar filter syntax: =, !=, <>, <,
+>, <=, >=, LIKE, ILIKE, IN (...), BETWEEN ... AND ..., IS NULL and IS NOT
+NULL, combined with AND, OR, NOT and parentheses. Fields are named by dotted
+paths such as rules.id. fields selects fields with the same syntax as QRadar,
+for example 'id,status,rules(id,type)'.
+"""
+import re
+
+
+class QueryError(Exception):
+    """
+    Raised for a filter, fields, sort or Range value that cannot be parsed.
+    The server answers with 422 and the message.
+    """
+
+    code = 1005
+
+
+class RangeError(QueryError):
+    """
+    Raised for a Range header that is not of the form items=x-y, such as a
+    byte range. QRadar answers these with 422 and error code 36.
+    """
+
+    code = 36
+
+
+_TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<operator><=|>=|!=|<>|=|<|>)
+      | (?P<punctuation>[(),])
+      | (?P<word>[^\s()=!<>,"']+)
+    )''', re.VERBOSE)
+
+_KEYWORDS = ('AND', 'OR', 'NOT', 'IN', 'BETWEEN', 'IS', 'NULL', 'LIKE',
+             'ILIKE')
+
+_MISSING = object()
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if match is None or match.end() == position:
+            raise QueryError('Cannot parse the filter at: ' + text[position:])
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'word' and value.upper() in _KEYWORDS:
+            kind = 'keyword'
+            value = value.upper()
+        tokens.append((kind, value))
+    return tokens
+
+
+def _literal(kind, value):
+    if kind == 'string':
+        return value
+    lower = value.lower()
+    if lower == 'true':
+        return True
+    if lower == 'false':
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _lookup(record, path):
+    # Return the value of a dotted field path. A path through a list
+    # returns the list of values found in its elements.
+    values = [record]
+    for name in path:
+        found = []
+        for value in values:
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict) and name in item:
+                        found.append(item[name])
+            elif isinstance(value, dict) and name in value:
+                found.append(value[name])
+        if not found:
+            return _MISSING
+        values = found
+    if len(values) == 1:
+        return values[0]
+    return values
+
+
+def _coerce(value, literal):
+    # Compare like with like: the literal is converted to the type of the
+    # field where that makes sense, as QRadar does for unquoted values.
+    if isinstance(value, bool):
+        if isinstance(literal, str):
+            return value, literal.lower() == 'true'
+        return value, literal
+    if isinstance(value, (int, float)):
+        if isinstance(literal, str):
+            try:
+                return value, float(literal)
+            except ValueError:
+                return str(value), literal
+        return value, literal
+    if isinstance(value, str) and not isinstance(literal, str):
+        if isinstance(literal, bool):
+            return value.lower(), str(literal).lower()
+        return value, str(literal)
+    return value, literal
+
+
+def _any(value, test):
+    # A field that holds a list matches if any of its elements matches.
+    if isinstance(value, list):
+        return any(_any(item, test) for item in value)
+    return test(value)
+
+
+_COMPARISONS = {
+    '=': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def _like_pattern(pattern, ignore_case):
+    expression = ''.join('.*' if c == '%' else '.' if c == '_'
+                         else re.escape(c) for c in pattern)
+    return re.compile('^' + expression + '$',
+                      re.IGNORECASE | re.DOTALL if ignore_case else re.DOTALL)
+
+
+class _FilterParser:
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def parse(self):
+        predicate = self._or()
+        if self.position != len(self.tokens):
+            raise QueryError('Unexpected ' + self.tokens[self.position][1] +
+                             ' in the filter.')
+        return predicate
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise QueryError('The filter ended unexpectedly.')
+        self.position += 1
+        return token
+
+    def _expect(self, value):
+        kind, token = self._next()
+        if token != value:
+            raise QueryError('Expected ' + value + ' but found ' + token +
+                             ' in the filter.')
+
+    def _or(self):
+        terms = [self._and()]
+        while self._peek() == ('keyword', 'OR'):
+            self._next()
+            terms.append(self._and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda record: any(term(record) for term in terms)
+
+    def _and(self):
+        terms = [self._not()]
+        while self._peek() == ('keyword', 'AND'):
+            self._next()
+            terms.append(self._not())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda record: all(term(record) for term in terms)
+
+    def _not(self):
+        if self._peek() == ('keyword', 'NOT'):
+            self._next()
+            term = self._not()
+            return lambda record: not term(record)
+        if self._peek() == ('punctuation', '('):
+            self._next()
+            term = self._or()
+            self._expect(')')
+            return term
+        return self._comparison()
+
+    def _value(self):
+        kind, value = self._next()
+        if kind not in ('string', 'word'):
+            raise QueryError('Expected a value but found ' + value +
+                             ' in the filter.')
+        return _literal(kind, value)
+
+    def _comparison(self):
+        kind, name = self._next()
+        if kind != 'word':
+            raise QueryError('Expected a field name but found ' + name +
+                             ' in the filter.')
+        path = name.split('.')
+        kind, operator = self._next()
+
+        if kind == 'operator':
+            literal = self._value()
+            compare = _COMPARISONS[operator]
+
+            def test(value):
+                left, right = _coerce(value, literal)
+                try:
+                    return compare(left, right)
+                except TypeError:
+                    return False
+        elif operator in ('LIKE', 'ILIKE'):
+            pattern = _like_pattern(str(self._value()), operator == 'ILIKE')
+
+            def test(value):
+                return (value is not None and
+                        pattern.match(str(value)) is not None)
+        elif operator == 'IN':
+            self._expect('(')
+            literals = [self._value()]
+            while self._peek() == ('punctuation', ','):
+                self._next()
+                literals.append(self._value())
+            self._expect(')')
+
+            def test(value):
+                return any(left == right for left, right in
+                           (_coerce(value, literal) for literal in literals))
+        elif operator == 'BETWEEN':
+            low = self._value()
+            self._expect('AND')
+            high = self._value()
+
+            def test(value):
+                left, lower = _coerce(value, low)
+                upper = _coerce(value, high)[1]
+                try:
+                    return lower <= left <= upper
+                except TypeError:
+                    return False
+        elif operator == 'IS':
+            negate = self._peek() == ('keyword', 'NOT')
+            if negate:
+                self._next()
+            self._expect('NULL')
+            return lambda record: (
+                (_lookup(record, path) in (None, _MISSING)) != negate)
+        else:
+            raise QueryError('Unknown operator ' + operator +
+                             ' in the filter.')
+
+        def predicate(record):
+            value = _lookup(record, path)
+            if value is _MISSING or value is None:
+                return False
+            return _any(value, test)
+        return predicate
+
+
+def parse_filter(text):
+    """
+    Return a function that returns True for the records that match a filter
+    expression, or None if text is empty.
+    """
+
+    if not text or not text.strip():
+        return None
+    return _FilterParser(text).parse()
+
+
+def parse_fields(text):
+    """
+    Parse a fields parameter into a dictionary of field name to the
+    dictionary of its selected sub-fields, or None if all of its sub-fields
+    are selected. Returns None if text is empty.
+    """
+
+    if not text or not text.strip():
+        return None
+    fields, position = _parse_field_list(text, 0)
+    if position != len(text):
+        raise QueryError('Cannot parse the fields parameter at: ' +
+                         text[position:])
+    return fields
+
+
+def _parse_field_list(text, position):
+    fields = {}
+    while True:
+        match = re.compile(r'\s*([^\s(),]+)\s*').match(text, position)
+        if match is None:
+            raise QueryError('Expected a field name in the fields parameter '
+                             'at: ' + text[position:])
+        name = match.group(1)
+        position = match.end()
+        children = None
+        if position < len(text) and text[position] == '(':
+            children, position = _parse_field_list(text, position + 1)
+            if position >= len(text) or text[position] != ')':
+                raise QueryError('Missing ) in the fields parameter.')
+            position += 1
+            while position < len(text) and text[position].isspace():
+                position += 1
+        fields[name] = children
+        if position < len(text) and text[position] == ',':
+            position += 1
+            continue
+        return fields, position
+
+
+def select_fields(value, fields):
+    """
+    Return value with only the selected fields, applied to each element of
+    a list.
+    """
+
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [select_fields(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return dict((name, select_fields(value[name], children))
+                for name, children in fields.items() if name in value)
+
+
+def parse_sort(text):
+    """
+    Return a list of (field path, descending) pairs for a sort parameter
+    such as '-magnitude,+id', or an empty list if text is empty.
+    """
+
+    keys = []
+    for item in (text or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        descending = item.startswith('-')
+        name = item.lstrip('+-')
+        if not name:
+            raise QueryError('Cannot parse the sort parameter: ' + text)
+        keys.append((name.split('.'), descending))
+    return keys
+
+
+def sort_key(record, path):
+    """
+    Return a key that sorts a record by the field at path, with records
+    without the field last.
+    """
+
+    value = _lookup(record, path)
+    if value is _MISSING or value is None:
+        return (1, 0, '')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, 0, value)
+    return (0, 1, str(value))
+
+
+_RANGE_PATTERN = re.compile(r'^\s*items\s*=\s*(\d+)\s*-\s*(\d+)\s*$')
+
+
+def parse_range(header):
+    """
+    Return the (first, last) item numbers of an items Range header, or None
+    if header is None. last may be past the end of the list.
+    """
+
+    if header is None:
+        return None
+    match = _RANGE_PATTERN.match(header)
+    if match is None:
+        raise RangeError('The Range header must be of the form '
+                         'items=x-y: ' + header)
+    first, last = int(match.group(1)), int(match.group(2))
+    if last < first:
+        raise QueryError('The end of the Range is before its start: ' +
+                         header)
+    return first, last
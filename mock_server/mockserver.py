@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the QRadar REST API, for trying the samples and
+benchmarking the modules without a QRadar console.
+
+The server speaks HTTPS with keep-alive under /api/, like a console, and
+serves synthetic offenses, assets, vulnerabilities, Ariel searches and
+reference data. List endpoints support the filter, fields and sort
+parameters and the Range header, and Ariel and QVM searches move through
+their states over a configurable time. Latency, error responses and dropped
+connections can be injected at a configurable rate, and changed while the
+server runs with POST /api/mock/settings.
+
+Run it from this directory:
+
+    python3 mockserver.py --write-config ../config.ini
+
+which also writes a config.ini section the samples can use. It can also be
+started from Python with MockServer(...).start().
+"""
+import argparse
+import base64
+import configparser
+import gzip
+import hashlib
+import http.server
+import os
+import random
+import socket
+import ssl
+import subprocess
+import sys
+import threading
+import time
+
+from mockapi import ApiError
+from mockapi import MockApi
+from mockapi import MockRequest
+from mockapi import MockResponse
+from mockdata import Dataset
+
+
+MOCK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Responses smaller than this are not compressed.
+GZIP_MIN_SIZE = 1024
+
+# The settings that can be changed while the server runs.
+SETTINGS = ('latency', 'jitter', 'error_rate', 'error_codes',
+            'disconnect_rate', 'search_seconds', 'max_searches')
+
+
+def ensure_certificate(directory=MOCK_DIRECTORY):
+    """
+    Return the (certificate file, key file) of a self-signed certificate for
+    localhost and 127.0.0.1 in directory, creating them with openssl the
+    first time.
+    """
+
+    certificate_file = os.path.join(directory, 'mock_certificate.pem')
+    key_file = os.path.join(directory, 'mock_key.pem')
+    if not (os.path.isfile(certificate_file) and os.path.isfile(key_file)):
+        subprocess.check_call(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+             '-days', '3650', '-subj', '/CN=localhost',
+             '-addext', 'subjectAltName=IP:127.0.0.1,DNS:localhost',
+             '-keyout', key_file, '-out', certificate_file],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certificate_file, key_file
+
+
+class MockConfig:
+    """
+    A configuration with the same methods as config.Config, for passing to
+    RestApiClient as config without reading or writing config.ini.
+    """
+
+    def __init__(self, values):
+        self.values = dict(values)
+
+    def has_config_value(self, config_name):
+        return config_name in self.values
+
+    def get_config_value(self, config_name):
+        return self.values.get(config_name)
+
+    def set_config_value(self, config_name, config_value):
+        self.values[config_name] = config_value
+
+
+class MockServer:
+    """
+    The mock server. port 0 picks a free port. dataset is the Dataset to
+    serve, 10000 records of each kind by default.
+
+    latency and jitter are in seconds: every request waits latency plus a
+    random time up to jitter. error_rate is the fraction of requests that
+    fail with one of error_codes, and disconnect_rate the fraction whose
+    connection is closed without a response. search_seconds is how long
+    Ariel and QVM searches take, and max_searches the number of Ariel
+    searches that can run at once. auth_token, if not None, is required in
+    the SEC header.
+
+    Without certificate_file and key_file a self-signed certificate is
+    created with openssl.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, dataset=None, latency=0.0,
+                 jitter=0.0, error_rate=0.0, error_codes=(503,),
+                 disconnect_rate=0.0, search_seconds=1.0, max_searches=None,
+                 auth_token='mock-token', certificate_file=None,
+                 key_file=None, seed=None, verbose=False):
+        if certificate_file is None:
+            certificate_file, key_file = ensure_certificate()
+        self.certificate_file = os.path.abspath(certificate_file)
+        self.key_file = key_file
+        self.auth_token = auth_token
+        self.verbose = verbose
+        self.api = MockApi(dataset or Dataset(), search_seconds, max_searches)
+        self.settings = {'latency': latency, 'jitter': jitter,
+                         'error_rate': error_rate,
+                         'error_codes': list(error_codes),
+                         'disconnect_rate': disconnect_rate}
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.request_count = 0
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.certificate_file, key_file)
+        self.httpd = _HTTPServer((host, port), _Handler, context, self)
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def server_ip(self):
+        """
+        The host and port, as the server_ip of config.ini.
+        """
+
+        return self.host + ':' + str(self.port)
+
+    def start(self):
+        """
+        Serve requests in a background thread and return the server.
+        """
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def config_values(self):
+        """
+        Return the config.ini settings for connecting to the server.
+        """
+
+        values = {'server_ip': self.server_ip,
+                  'certificate_file': self.certificate_file}
+        values['auth_token'] = self.auth_token or 'mock-token'
+        return values
+
+    def config(self):
+        """
+        Return a MockConfig for passing to RestApiClient as config.
+        """
+
+        return MockConfig(self.config_values())
+
+    def write_config(self, config_file, config_section='mock'):
+        """
+        Add or replace config_section of config_file with the settings for
+        connecting to the server.
+        """
+
+        config = configparser.ConfigParser()
+        if os.path.isfile(config_file):
+            config.read(config_file)
+        config[config_section] = self.config_values()
+        with open(config_file, 'w') as config_file_handle:
+            config.write(config_file_handle)
+
+    def update_settings(self, changes):
+        """
+        Change the injected latency, errors and disconnects, or the search
+        settings, while the server runs.
+        """
+
+        for name, value in changes.items():
+            if name not in SETTINGS:
+                raise ApiError(422, 1005, 'Unknown setting ' + name + '.')
+            try:
+                if name == 'error_codes':
+                    value = [int(code) for code in
+                             (value if isinstance(value, list)
+                              else str(value).split(','))]
+                elif name == 'max_searches':
+                    value = None if value in (None, '') else int(value)
+                else:
+                    value = float(value)
+            except ValueError:
+                raise ApiError(422, 1005, 'Invalid value for ' + name + '.')
+            if name in ('search_seconds', 'max_searches'):
+                setattr(self.api, name, value)
+            else:
+                self.settings[name] = value
+
+    def current_settings(self):
+        settings = dict(self.settings)
+        settings['search_seconds'] = self.api.search_seconds
+        settings['max_searches'] = self.api.max_searches
+        settings['request_count'] = self.request_count
+        return settings
+
+    def _chance(self, rate):
+        if rate <= 0:
+            return False
+        with self.random_lock:
+            return self.random.random() < rate
+
+    def _delay(self):
+        latency = self.settings['latency']
+        jitter = self.settings['jitter']
+        if jitter > 0:
+            with self.random_lock:
+                latency += self.random.uniform(0, jitter)
+        return latency
+
+    def _error_code(self):
+        with self.random_lock:
+            return self.random.choice(self.settings['error_codes'])
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, handler, context, mock):
+        self.context = context
+        self.mock = mock
+        super(_HTTPServer, self).__init__(address, handler)
+
+    def get_request(self):
+        # The TLS handshake is done by the thread that handles the
+        # connection, so a slow client does not hold up the others.
+        connection, address = self.socket.accept()
+        connection = self.context.wrap_socket(
+            connection, server_side=True, do_handshake_on_connect=False)
+        return connection, address
+
+    def handle_error(self, request, client_address):
+        if self.mock.verbose:
+            super(_HTTPServer, self).handle_error(request, client_address)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'QRadarMock/1.0'
+    # The headers and the body are written separately, so without this
+    # every response on a kept-alive connection waits for a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def log_message(self, format, *args):
+        if self.server.mock.verbose:
+            super(_Handler, self).log_message(format, *args)
+
+    def _handle(self):
+        mock = self.server.mock
+        body = self._read_body()
+        path, _, query = self.path.partition('?')
+        if not path.startswith('/api/'):
+            self._send(ApiError(404, 1002, 'No endpoint ' + path +
+                                ' exists.').response(), 'GET')
+            return
+        request = MockRequest(self.command, path[len('/api/'):], query,
+                              dict(self.headers.items()), body)
+        with mock.random_lock:
+            mock.request_count += 1
+
+        if request.path == 'mock/settings':
+            self._send(self._settings(request), request.method)
+            return
+
+        delay = mock._delay()
+        if delay > 0:
+            time.sleep(delay)
+        if mock._chance(mock.settings['disconnect_rate']):
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        if not self._authorized(request):
+            response = ApiError(401, 1000, 'You are not authorized to '
+                                'access this resource.').response()
+        elif mock._chance(mock.settings['error_rate']):
+            code = mock._error_code()
+            response = ApiError(code, 1020, 'Injected error.').response()
+            if code in (429, 503):
+                response.headers['Retry-After'] = '1'
+        else:
+            response = mock.api.handle(request)
+        self._send(response, request.method)
+
+    def _settings(self, request):
+        mock = self.server.mock
+        try:
+            if request.method == 'POST':
+                changes = dict(request.params)
+                if request.body:
+                    changes.update(request.json())
+                mock.update_settings(changes)
+            elif request.method != 'GET':
+                raise ApiError(405, 1010, request.method + ' is not '
+                               'supported by mock/settings.')
+        except ApiError as e:
+            return e.response()
+        return MockResponse(200, mock.current_settings())
+
+    def _authorized(self, request):
+        token = self.server.mock.auth_token
+        if token is None:
+            return True
+        if request.header('SEC') == token:
+            return True
+        authorization = request.header('Authorization', '')
+        if authorization.startswith('Basic '):
+            try:
+                credentials = base64.b64decode(authorization[6:]).decode()
+            except ValueError:
+                return False
+            return credentials.partition(':')[2] == token
+        return False
+
+    def _read_body(self):
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, response, method):
+        body = response.body()
+        headers = dict(response.headers)
+        code = response.code
+
+        if method == 'GET' and code == 200:
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                code = 304
+                body = b''
+
+        if (len(body) >= GZIP_MIN_SIZE and
+                'gzip' in self.headers.get('Accept-Encoding', '')):
+            body = gzip.compress(body, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
+
+        self.send_response(code)
+        if body:
+            headers['Content-Type'] = response.content_type
+        headers['Content-Length'] = str(len(body))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a local stand-in for the QRadar REST API.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='The address to listen on.')
+    parser.add_argument('--port', type=int, default=8443,
+                        help='The port to listen on, 0 for any free port.')
+    parser.add_argument('--offenses', type=int, default=10000,
+                        help='The number of offenses.')
+    parser.add_argument('--assets', type=int, default=10000,
+                        help='The number of assets.')
+    parser.add_argument('--vulnerabilities', type=int, default=10000,
+                        help='The number of vulnerability instances.')
+    parser.add_argument('--events', type=int, default=10000,
+                        help='The number of results of an Ariel search '
+                             'without a LIMIT.')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='The latency added to every request, in '
+                             'milliseconds.')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='The most random latency added to every '
+                             'request, in milliseconds.')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='The fraction of requests that fail.')
+    parser.add_argument('--error-codes', default='503',
+                        help='The status codes of failed requests, '
+                             'separated by commas.')
+    parser.add_argument('--disconnect-rate', type=float, default=0,
+                        help='The fraction of requests whose connection is '
+                             'closed without a response.')
+    parser.add_argument('--search-seconds', type=float, default=1.0,
+                        help='How long Ariel and QVM searches take.')
+    parser.add_argument('--max-searches', type=int, default=None,
+                        help='The number of Ariel searches that can run at '
+                             'once.')
+    parser.add_argument('--auth-token', default='mock-token',
+                        help='The authorization token clients must send.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed the random injected errors and latency.')
+    parser.add_argument('--write-config', metavar='FILE',
+                        help='Write the settings for connecting to the '
+                             'server to this config.ini file.')
+    parser.add_argument('--config-section', default='mock',
+                        help='The section of --write-config to write.')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Log every request.')
+    args = parser.parse_args()
+
+    dataset = Dataset(offenses=args.offenses, assets=args.assets,
+                      vulnerabilities=args.vulnerabilities,
+                      events=args.events)
+    server = MockServer(
+        args.host, args.port, dataset, latency=args.latency / 1000.0,
+        jitter=args.jitter / 1000.0, error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(',')],
+        disconnect_rate=args.disconnect_rate,
+        search_seconds=args.search_seconds, max_searches=args.max_searches,
+        auth_token=args.auth_token, seed=args.seed, verbose=args.verbose)
+
+    if args.write_config:
+        server.write_config(args.write_config, args.config_section)
+        print('Wrote section [' + args.config_section + '] of ' +
+              os.path.abspath(args.write_config))
+
+    print('Serving the mock QRadar API at https://' + server.server_ip +
+          '/api/ (press Ctrl+C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
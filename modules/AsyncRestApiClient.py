@@ -0,0 +1,452 @@
+"""
+An asyncio version of RestApiClient. Requests are built exactly as
+RestApiClient builds them (same Config, headers, credentials and parse_path
+semantics) but are sent from an event loop, so many requests can be in flight
+at once without a thread per request.
+
+Example:
+
+    async def main():
+        async with AsyncRestApiClient(version='6.0') as client:
+            responses = await asyncio.gather(
+                client.call_api('siem/offense_types', 'GET'),
+                client.call_api('siem/offense_closing_reasons', 'GET'))
+
+Like RestApiClient, the client connects through the HTTPS proxy given by
+the https_proxy environment variable (or the system settings), unless the
+server is listed in no_proxy. The proxy is asked to open a tunnel with
+CONNECT and the TLS handshake is made with the server through it.
+"""
+import asyncio
+import http.client
+import io
+import time
+from urllib.error import URLError
+from urllib.parse import urlsplit
+
+from HttpTransport import BufferedResponse
+from HttpTransport import RequestTiming
+from HttpTransport import STREAM_BLOCK_SIZE
+from HttpTransport import body_length
+from HttpTransport import body_position
+from HttpTransport import decode_content
+from HttpTransport import is_stream
+from HttpTransport import proxy_for
+from HttpTransport import rewind_body
+from RestApiClient import RestApiClient
+from RetryPolicy import CircuitOpenError
+
+
+# The largest response header block accepted from the server.
+_HEADER_LIMIT = 1024 * 1024
+
+
+class AsyncRestApiClient:
+    """
+    Sends REST API requests from an asyncio event loop. At most
+    max_concurrency requests are in flight at once; further calls wait for a
+    free slot. Connections are kept open and reused between calls, and up to
+    max_concurrency idle connections are kept. call_api returns the same kind
+    of response object as RestApiClient.call_api, with the body already read.
+
+    Requests are recorded in metrics, a RequestMetrics, if one is given. The
+    time taken to open a connection, including the TLS handshake, is
+    recorded as its connect time. Connections are made through an HTTPS
+    proxy if one is configured, as described at the top of this module.
+    """
+
+    def __init__(self, config_section='DEFAULT', version=None, config=None,
+                 max_concurrency=50, idle_timeout=60.0, metrics=None):
+
+        # The synchronous client is used for everything that does not touch
+        # the network, so both clients build requests the same way.
+        self.client = RestApiClient(config_section=config_section,
+                                    version=version, config=config,
+                                    metrics=metrics)
+        self.max_concurrency = max_concurrency
+        self.idle_timeout = idle_timeout
+
+        location = urlsplit('https://' + self.client.get_server_ip())
+        self._host = location.hostname
+        self._port = location.port or 443
+        self._proxy = proxy_for(self.client.get_server_ip())
+        self._idle = []
+        self._semaphore = None
+
+    async def call_api(self, endpoint, method, headers=None, params=[],
+                       data=None, print_request=False, retry_policy=None):
+        """
+        Send a request and return the response once its body has been
+        received. Takes the same arguments as RestApiClient.call_api.
+        """
+
+        path, actual_headers = self.client.prepare_request(
+            endpoint, method, headers=headers, params=params, data=data,
+            print_request=print_request)
+        selector = self.client.get_base_uri() + path
+        url = 'https://' + self.client.get_server_ip() + selector
+        metrics = self.client.metrics
+        if metrics is not None:
+            metrics.before_request(method, path, actual_headers)
+
+        # The semaphore is created here rather than in the constructor so it
+        # belongs to the event loop that is running the calls.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Failed requests are retried under the given retry policy, or that
+        # of the synchronous client, and the circuit breaker of the server,
+        # waiting without holding a slot.
+        policy = retry_policy
+        if policy is None:
+            policy = self.client.retry_policy
+        breaker = policy.circuit_breaker(self.client.get_server_ip())
+        position = body_position(data)
+        attempt = 0
+        while True:
+            try:
+                if breaker is not None:
+                    breaker.before_request()
+            except CircuitOpenError as e:
+                if attempt >= policy.max_retries:
+                    raise
+                await asyncio.sleep(max(e.retry_at - time.monotonic(),
+                                        policy.backoff(attempt)))
+                attempt += 1
+                continue
+            try:
+                if self.client.rate_limiter is not None:
+                    # Waiting for a token can block on a file lock shared
+                    # with other processes, so it is done off the event
+                    # loop.
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.client.rate_limiter.acquire,
+                        self.client.get_server_ip(), path)
+                async with self._semaphore:
+                    (code, reason, response_headers, body,
+                     timing) = await self._send(method, selector,
+                                                actual_headers, data)
+            except OSError as e:
+                error = e
+            except BaseException:
+                # Any other error, including cancellation, still ends the
+                # request, so a trial request cannot leave the breaker
+                # waiting for its result for good.
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            else:
+                error = None
+
+            if error is not None:
+                if metrics is not None:
+                    metrics.record_error(method, path)
+                self.client.record_result(breaker, error=error,
+                                          retry_policy=policy)
+                if not (policy.should_retry(method, attempt, error=error) and
+                        rewind_body(data, position)):
+                    self.client.handle_connection_error(error)
+                await asyncio.sleep(policy.backoff(attempt))
+                attempt += 1
+                continue
+
+            response = BufferedResponse(code, reason, response_headers, url,
+                                        body)
+            response.timing = timing
+            if metrics is not None:
+                self.client.record_metrics(method, path, response)
+            self.client.record_result(breaker, code=code, retry_policy=policy)
+            if not (policy.should_retry(method, attempt, code=code) and
+                    rewind_body(data, position)):
+                break
+            await asyncio.sleep(policy.backoff(attempt, response))
+            attempt += 1
+
+        response = decode_content(response)
+        self.client.check_response(response)
+        if metrics is not None:
+            metrics.after_request(method, path, response)
+        return response
+
+    async def close(self):
+        """
+        Close all idle connections.
+        """
+
+        idle, self._idle = self._idle, []
+        for reader, writer, last_used in idle:
+            writer.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # Simple getters that mirror those of RestApiClient.
+    def get_headers(self):
+        return self.client.get_headers()
+
+    def get_server_ip(self):
+        return self.client.get_server_ip()
+
+    def get_base_uri(self):
+        return self.client.get_base_uri()
+
+    async def _send(self, method, selector, headers, data):
+        request, chunked = _encode_request(
+            method, selector, self.client.server_ip, headers, data)
+        position = body_position(data)
+        while True:
+            timing = RequestTiming()
+            start = time.monotonic()
+            reader, writer, reused = await self._get_connection()
+            timing.reused = reused
+            if not reused:
+                timing.connect = time.monotonic() - start
+            try:
+                sent = time.monotonic()
+                writer.write(request)
+                await _write_body(writer, data, chunked)
+                await writer.drain()
+                result = await _read_response(reader, method, timing)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+                # The server closed a kept-alive connection before our
+                # request reached it. Try again on a new connection.
+                if reused and rewind_body(data, position):
+                    continue
+                raise ConnectionResetError(
+                    'Connection closed by ' + self._host)
+            except BaseException:
+                writer.close()
+                raise
+
+            code, reason, response_headers, body, keep_alive = result
+            if keep_alive and len(self._idle) < self.max_concurrency:
+                self._idle.append((reader, writer, time.monotonic()))
+            else:
+                writer.close()
+            timing.ttfb = timing._headers_received_at - sent
+            timing.bytes_out = len(request) + (
+                body_length(data, position) or 0)
+            timing.bytes_in = len(body)
+            timing.finish()
+            return code, reason, response_headers, body, timing
+
+    async def _get_connection(self):
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if (now - last_used > self.idle_timeout or
+                    reader.at_eof() or writer.is_closing()):
+                writer.close()
+                continue
+            return reader, writer, True
+
+        if self._proxy is not None:
+            reader, writer = await self._open_tunnel()
+        else:
+            reader, writer = await asyncio.open_connection(
+                self._host, self._port, ssl=self.client.ssl_context,
+                server_hostname=self._host, limit=_HEADER_LIMIT)
+        return reader, writer, False
+
+    async def _open_tunnel(self):
+        # Ask the proxy to open a tunnel to the server, then make the TLS
+        # handshake with the server through it and wrap the connection in
+        # streams as asyncio.open_connection does.
+        loop = asyncio.get_running_loop()
+        proxy_host, proxy_headers = self._proxy
+        proxy = urlsplit('//' + proxy_host)
+        transport, tunnel = await loop.create_connection(
+            _TunnelProtocol, proxy.hostname, proxy.port)
+        try:
+            target = self._host
+            if ':' in target:
+                target = '[' + target + ']'
+            target += ':' + str(self._port)
+            lines = ['CONNECT ' + target + ' HTTP/1.1', 'Host: ' + target]
+            for name, value in proxy_headers.items():
+                lines.append(name + ': ' + value)
+            transport.write(('\r\n'.join(lines) + '\r\n\r\n').encode(
+                'latin-1'))
+            status_line = await tunnel.response
+            status = status_line.decode('iso-8859-1').split(' ', 2)
+            if len(status) < 2 or status[1] != '200':
+                # The same error http.client raises for a refused tunnel.
+                raise OSError('Tunnel connection failed: ' +
+                              ' '.join(status[1:]).strip())
+
+            reader = asyncio.StreamReader(limit=_HEADER_LIMIT)
+            protocol = asyncio.StreamReaderProtocol(reader)
+            transport = await loop.start_tls(
+                transport, protocol, self.client.ssl_context,
+                server_hostname=self._host)
+        except BaseException:
+            transport.close()
+            raise
+        protocol.connection_made(transport)
+        return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+
+class _TunnelProtocol(asyncio.Protocol):
+    """
+    Reads the answer of a proxy to CONNECT. response is a Future for its
+    status line, set once the whole header block has been received.
+    """
+
+    def __init__(self):
+        self.response = asyncio.get_running_loop().create_future()
+        self._buffer = b''
+
+    def data_received(self, data):
+        if self.response.done():
+            return
+        self._buffer += data
+        header_block, found, _ = self._buffer.partition(b'\r\n\r\n')
+        if found:
+            self.response.set_result(header_block.split(b'\r\n', 1)[0])
+        elif len(self._buffer) > _HEADER_LIMIT:
+            self.response.set_exception(URLError(
+                'The answer of the proxy is longer than ' +
+                str(_HEADER_LIMIT) + ' bytes.'))
+
+    def connection_lost(self, exc):
+        if not self.response.done():
+            self.response.set_exception(exc or ConnectionResetError(
+                'Connection closed by the proxy.'))
+
+
+def _encode_request(method, selector, host, headers, data):
+    """
+    Build the bytes of the start line and headers of an HTTP/1.1 request.
+    Returns them and whether the body must be sent with chunked transfer
+    encoding, which is the case for a file object of unknown length.
+    """
+
+    lines = [(method + ' ' + selector + ' HTTP/1.1').encode('ascii'),
+             b'Host: ' + host.encode('idna')]
+    for name, value in headers.items():
+        if not isinstance(value, bytes):
+            value = str(value).encode('latin-1')
+        lines.append(name.encode('ascii') + b': ' + value)
+    names = [name.lower() for name in headers]
+    chunked = 'chunked' in str(headers.get('Transfer-Encoding', '')).lower()
+    if (data is not None and 'content-length' not in names and
+            'transfer-encoding' not in names):
+        length = body_length(data)
+        if length is None:
+            lines.append(b'Transfer-Encoding: chunked')
+            chunked = True
+        else:
+            lines.append(b'Content-Length: ' + str(length).encode('ascii'))
+    lines.append(b'')
+    lines.append(b'')
+    return b'\r\n'.join(lines), chunked
+
+
+async def _write_body(writer, data, chunked):
+    """
+    Write a request body, a block at a time for file objects and buffers
+    such as an mmap so that no copy of the whole body is made.
+    """
+
+    if data is None:
+        return
+    if isinstance(data, (bytes, bytearray)):
+        writer.write(data)
+        return
+    if isinstance(data, str):
+        writer.write(data.encode('iso-8859-1'))
+        return
+    if not is_stream(data):
+        with memoryview(data) as view:
+            view = view.cast('B')
+            for start in range(0, len(view), STREAM_BLOCK_SIZE):
+                writer.write(bytes(view[start:start + STREAM_BLOCK_SIZE]))
+                await writer.drain()
+            view.release()
+        return
+    while True:
+        block = data.read(STREAM_BLOCK_SIZE)
+        if not block:
+            break
+        if isinstance(block, str):
+            block = block.encode('iso-8859-1')
+        if chunked:
+            writer.write(('%x\r\n' % len(block)).encode('ascii'))
+            writer.write(block)
+            writer.write(b'\r\n')
+        else:
+            writer.write(block)
+        await writer.drain()
+    if chunked:
+        writer.write(b'0\r\n\r\n')
+
+
+async def _read_response(reader, method, timing):
+    """
+    Read one HTTP/1.1 response from reader. Returns the status code, reason,
+    headers, body and whether the connection can be reused. Interim 1xx
+    responses, such as 100 Continue, are skipped. A response that cannot be
+    parsed raises URLError.
+    """
+
+    while True:
+        header_block = await _read_until(reader, b'\r\n\r\n')
+        status_line, _, header_lines = header_block.partition(b'\r\n')
+        version, code, reason = (status_line.decode('iso-8859-1') +
+                                 '  ').split(' ', 2)
+        try:
+            code = int(code)
+            headers = http.client.parse_headers(io.BytesIO(header_lines))
+        except (ValueError, http.client.HTTPException):
+            raise URLError(http.client.BadStatusLine(
+                status_line.decode('iso-8859-1')))
+        reason = reason.strip()
+        if not 100 <= code < 200 or code == 101:
+            break
+    timing._headers_received_at = time.monotonic()
+
+    keep_alive = (version == 'HTTP/1.1' and
+                  headers.get('Connection', '').lower() != 'close')
+
+    if method == 'HEAD' or code in (204, 304, 101):
+        body = b''
+    elif headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        body = await _read_chunked(reader)
+    elif headers.get('Content-Length') is not None:
+        body = await reader.readexactly(int(headers['Content-Length']))
+    else:
+        body = await reader.read()
+        keep_alive = False
+
+    return code, reason, headers, body, keep_alive
+
+
+async def _read_until(reader, separator):
+    # Header and chunk size lines longer than the reader's limit raise
+    # LimitOverrunError, which is not a connection error.
+    try:
+        return await reader.readuntil(separator)
+    except asyncio.LimitOverrunError:
+        raise URLError('A response header or chunk size line is longer '
+                       'than ' + str(_HEADER_LIMIT) + ' bytes.')
+
+
+async def _read_chunked(reader):
+    chunks = []
+    while True:
+        size_line = await _read_until(reader, b'\r\n')
+        try:
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise URLError(http.client.IncompleteRead(b''.join(chunks)))
+        if size == 0:
+            # Skip any trailer headers up to the final empty line.
+            while (await _read_until(reader, b'\r\n')) != b'\r\n':
+                pass
+            return b''.join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
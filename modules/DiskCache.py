@@ -0,0 +1,220 @@
+"""
+A size bounded cache of byte strings stored as files in a directory. Each
+entry is a single file holding a line of JSON metadata followed by the value.
+When the total size of the entries exceeds max_bytes the least recently used
+entries are removed. Entries can be given a time to live, after which get()
+no longer returns them unless asked to. An on_remove callback can be given to
+release anything an entry refers to when the cache removes it.
+"""
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class CacheEntry:
+    """
+    A value read from a DiskCache with the metadata it was stored with.
+    expires_at is a time.time() timestamp, or None if the entry never
+    expires.
+    """
+
+    def __init__(self, value, metadata, expires_at):
+        self.value = value
+        self.metadata = metadata
+        self.expires_at = expires_at
+
+    def is_expired(self):
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+
+class DiskCache:
+    """
+    Stores byte strings on disk under string keys. Writes are atomic, so a
+    cache directory can be shared by several processes; each process keeps
+    its own view of which entries were used most recently.
+
+    on_remove, if given, is called with the CacheEntry (without its value)
+    of each entry the cache removes because it expired or to make room. It
+    is not called for entries removed with delete() or clear().
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024,
+                 on_remove=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.on_remove = on_remove
+        self._lock = threading.Lock()
+
+        # File name -> size, ordered from least to most recently used. The
+        # order is seeded from the modification times of the files, which
+        # are updated whenever an entry is read.
+        self._sizes = collections.OrderedDict()
+        self._total = 0
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith('.entry'):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for mtime, name, size in sorted(entries):
+            self._sizes[name] = size
+            self._total += size
+
+    def get(self, key, include_expired=False):
+        """
+        Return the CacheEntry stored under key, or None if there is none or
+        it has expired. Expired entries are returned, rather than removed,
+        when include_expired is True.
+        """
+
+        name = self._file_name(key)
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as entry_file:
+                header = json.loads(entry_file.readline().decode('utf-8'))
+                if header['key'] != key:
+                    return None
+                entry = CacheEntry(None, header['metadata'],
+                                   header['expires_at'])
+                if entry.is_expired() and not include_expired:
+                    entry_file.close()
+                    self.delete(key)
+                    if self.on_remove is not None:
+                        self.on_remove(entry)
+                    return None
+                entry.value = entry_file.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        with self._lock:
+            if name in self._sizes:
+                self._sizes.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, value, ttl=None, metadata=None):
+        """
+        Store value under key. The entry expires after ttl seconds, or never
+        if ttl is None. Values larger than max_bytes are not stored.
+        """
+
+        header = {'key': key,
+                  'expires_at': None if ttl is None else time.time() + ttl,
+                  'metadata': metadata or {}}
+        header_bytes = json.dumps(header).encode('utf-8') + b'\n'
+        size = len(header_bytes) + len(value)
+        if size > self.max_bytes:
+            return False
+
+        name = self._file_name(key)
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as entry_file:
+            entry_file.write(header_bytes)
+            entry_file.write(value)
+        os.replace(temporary_path, os.path.join(self.directory, name))
+
+        with self._lock:
+            self._total -= self._sizes.pop(name, 0)
+            self._sizes[name] = size
+            self._total += size
+            evicted = self._evict()
+        self._remove_files(evicted)
+        return True
+
+    def delete(self, key):
+        """
+        Remove the entry stored under key, if there is one.
+        """
+
+        name = self._file_name(key)
+        with self._lock:
+            self._total -= self._sizes.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def remove_expired(self):
+        """
+        Remove every expired entry. Returns the number of entries removed.
+        """
+
+        with self._lock:
+            names = list(self._sizes)
+        expired = []
+        for name in names:
+            entry = self._read_header(name)
+            if entry is not None and entry.is_expired():
+                expired.append(name)
+        with self._lock:
+            for name in expired:
+                self._total -= self._sizes.pop(name, 0)
+        self._remove_files(expired)
+        return len(expired)
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+
+        with self._lock:
+            names = list(self._sizes)
+            self._sizes.clear()
+            self._total = 0
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def size(self):
+        """
+        Return the total size in bytes of the entries in the cache.
+        """
+
+        return self._total
+
+    def _evict(self):
+        # Called with the lock held. Returns the names of the entries taken
+        # out of the index, whose files are then removed by _remove_files
+        # once the lock is released.
+        names = []
+        while self._total > self.max_bytes and self._sizes:
+            name, size = self._sizes.popitem(last=False)
+            self._total -= size
+            names.append(name)
+        return names
+
+    def _remove_files(self, names):
+        for name in names:
+            entry = None
+            if self.on_remove is not None:
+                entry = self._read_header(name)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            if entry is not None:
+                self.on_remove(entry)
+
+    def _read_header(self, name):
+        # Returns the CacheEntry of a file without its value, or None if it
+        # cannot be read.
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as entry_file:
+                header = json.loads(entry_file.readline().decode('utf-8'))
+            return CacheEntry(None, header['metadata'], header['expires_at'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def _file_name(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest() + '.entry'
@@ -0,0 +1,124 @@
+"""
+Builds request paths for RestApiClient. An EndpointTemplate such as
+'siem/offenses/{offense_id}/notes' is parsed once, with its static parts
+already percent-encoded, so building a path only encodes the values filled
+in. encode_query() builds query strings, keeping repeated keys, and caches
+the encoding of each parameter so hot filters are only encoded once.
+"""
+from urllib.parse import quote
+import functools
+import re
+
+
+_FIELD_PATTERN = re.compile(r'{(\w+)}')
+
+
+class EndpointTemplate:
+    """
+    An endpoint path with {name} fields that are filled in by expand().
+    Field values are percent-encoded, including any '/', so a value always
+    stays within its path segment.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.parts = []
+        self.fields = []
+        position = 0
+        for match in _FIELD_PATTERN.finditer(template):
+            self.parts.append(quote(template[position:match.start()]))
+            self.fields.append(match.group(1))
+            position = match.end()
+        self.tail = quote(template[position:])
+
+    def expand(self, **values):
+        """
+        Return the endpoint path with each field replaced by its value.
+        """
+
+        path = []
+        for part, field in zip(self.parts, self.fields):
+            path.append(part)
+            path.append(_quote_segment(str(values[field])))
+        path.append(self.tail)
+        return ''.join(path)
+
+    def path(self, params=None, **values):
+        """
+        Return the expanded endpoint path followed by the query string for
+        params.
+        """
+
+        path = self.expand(**values)
+        if not params:
+            return path
+        return append_query(path, params)
+
+    def __repr__(self):
+        return 'EndpointTemplate(' + repr(self.template) + ')'
+
+
+@functools.lru_cache(maxsize=256)
+def compile_endpoint(template):
+    """
+    Return the EndpointTemplate for template, parsing it only the first time.
+    """
+
+    return EndpointTemplate(template)
+
+
+@functools.lru_cache(maxsize=1024)
+def _quote_segment(value):
+    return quote(value, safe='')
+
+
+@functools.lru_cache(maxsize=1024)
+def _encode_pair(key, value):
+    return quote(key, safe='') + '=' + quote(value)
+
+
+def encode_query(params):
+    """
+    Return the query string for params, a dictionary or a list of (key,
+    value) pairs. Keys may repeat in a list, and a dictionary value may be a
+    list or tuple to repeat its key. Values that are None or '' are left
+    out. Booleans are sent as true or false and other values are converted
+    with str().
+    """
+
+    if not params:
+        return ''
+    if isinstance(params, dict):
+        items = params.items()
+    else:
+        items = params
+
+    encoded = []
+    for key, value in items:
+        if isinstance(value, (list, tuple)):
+            values = value
+        else:
+            values = (value,)
+        for value in values:
+            if value is None or value == '':
+                continue
+            if isinstance(value, bool):
+                value = 'true' if value else 'false'
+            elif not isinstance(value, str):
+                value = str(value)
+            encoded.append(_encode_pair(key, value))
+    return '&'.join(encoded)
+
+
+def append_query(path, params):
+    """
+    Return path with the query string for params added, joined with '&' if
+    path already has a query string.
+    """
+
+    query = encode_query(params)
+    if not query:
+        return path
+    if '?' in path:
+        return path + '&' + query
+    return path + '?' + query
@@ -0,0 +1,227 @@
+"""
+Sends the same API calls to several QRadar consoles at once. Each console is
+a section of config.ini, as used by the config_section argument of
+RestApiClient, and has its own RestApiClient, so every console keeps its own
+connections, retry policy and rate limits.
+
+call_api() sends one request to every console in parallel and returns the
+responses by console. paginate() lists an endpoint on every console in
+parallel and yields the elements as they arrive, each tagged with the console
+it came from, so a report over a dozen consoles takes about as long as the
+slowest console rather than the sum of all of them.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import heapq
+import queue
+import threading
+
+from RestApiClient import RestApiClient
+
+
+class FleetError(Exception):
+    """
+    Raised when a call fails on some of the consoles. errors is a dictionary
+    of console to the exception raised for it. For call_api, responses holds
+    the responses of the consoles that did answer.
+    """
+
+    def __init__(self, errors, responses=None):
+        self.errors = errors
+        self.responses = responses or {}
+        super(FleetError, self).__init__(
+            'The call failed on ' + str(len(errors)) + ' console(s): ' +
+            '; '.join(console + ': ' + str(error)
+                      for console, error in errors.items()))
+
+
+# Marks the end of the elements from one console in a feed queue.
+_Done = collections.namedtuple('_Done', 'console')
+
+
+class FleetClient:
+    """
+    A client for the consoles named by config_sections. version and any
+    other keyword arguments are passed to the RestApiClient of each console.
+    Alternatively clients may be given as a dictionary of console name to an
+    existing RestApiClient.
+
+    paginate() adds the console name to each element under console_key.
+    """
+
+    def __init__(self, config_sections=None, version=None, clients=None,
+                 console_key='console', **client_options):
+        if clients is None:
+            clients = collections.OrderedDict(
+                (section, RestApiClient(config_section=section,
+                                        version=version, **client_options))
+                for section in config_sections)
+        self.clients = collections.OrderedDict(clients)
+        self.console_key = console_key
+
+    def consoles(self):
+        """
+        Return the names of the consoles, in the order they were given.
+        """
+
+        return list(self.clients)
+
+    def call_api(self, endpoint, method, headers=None, params=[], data=None):
+        """
+        Send the same request to every console in parallel and return a
+        dictionary of console to response, in the order the consoles were
+        given. Responses with an error status code are returned like any
+        other. If a console cannot be reached FleetError is raised once every
+        console has answered, holding the responses that were received.
+
+        data must be bytes, since it is sent once per console.
+        """
+
+        responses = collections.OrderedDict()
+        errors = collections.OrderedDict()
+        with ThreadPoolExecutor(max_workers=len(self.clients)) as executor:
+            futures = [(console, executor.submit(
+                client.call_api, endpoint, method, headers=headers,
+                params=params, data=data))
+                for console, client in self.clients.items()]
+            for console, future in futures:
+                try:
+                    responses[console] = future.result()
+                except Exception as e:
+                    errors[console] = e
+        if errors:
+            raise FleetError(errors, responses)
+        return responses
+
+    def paginate(self, endpoint, params=[], page_size=50, headers=None,
+                 max_workers=4, key=None, buffer_pages=4):
+        """
+        Yield every element of a list endpoint from every console, with the
+        console name added to each element under console_key. Each console
+        is listed with RestApiClient.paginate in its own thread, using up to
+        max_workers requests at a time.
+
+        Without key, elements are yielded in the order they arrive, so a
+        slow console does not hold back the others. With key, each console's
+        list must already be sorted by key (for example with a sort
+        parameter), and the lists are merged so the elements are yielded in
+        key order.
+
+        At most buffer_pages pages per console are held waiting to be
+        yielded. If any console fails, the elements of the others are still
+        yielded, then FleetError is raised.
+        """
+
+        stop = threading.Event()
+        shared = queue.Queue(maxsize=buffer_pages * len(self.clients))
+        feeds = []
+        for console, client in self.clients.items():
+            output = shared
+            if key is not None:
+                output = queue.Queue(maxsize=buffer_pages)
+            records = client.paginate(endpoint, params=params,
+                                      page_size=page_size, headers=headers,
+                                      max_workers=max_workers)
+            feeds.append(_ConsoleFeed(console, records, output, stop,
+                                      self.console_key, page_size))
+
+        for feed in feeds:
+            feed.thread.start()
+        try:
+            if key is None:
+                remaining = len(feeds)
+                while remaining:
+                    batch = shared.get()
+                    if isinstance(batch, _Done):
+                        remaining -= 1
+                        continue
+                    for element in batch:
+                        yield element
+            else:
+                for element in heapq.merge(
+                        *[_drain(feed.output) for feed in feeds], key=key):
+                    yield element
+        finally:
+            stop.set()
+            for feed in feeds:
+                feed.thread.join()
+
+        errors = collections.OrderedDict(
+            (feed.console, feed.error) for feed in feeds
+            if feed.error is not None)
+        if errors:
+            raise FleetError(errors)
+
+    def close(self):
+        """
+        Close the connections of every console.
+        """
+
+        for client in self.clients.values():
+            client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _ConsoleFeed:
+    """
+    Reads the elements of one console in a thread and puts them on output in
+    batches, followed by a _Done. Stops early once stop is set.
+    """
+
+    def __init__(self, console, records, output, stop, console_key,
+                 batch_size):
+        self.console = console
+        self.records = records
+        self.output = output
+        self.stop = stop
+        self.console_key = console_key
+        self.batch_size = max(1, batch_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        try:
+            batch = []
+            for record in self.records:
+                if isinstance(record, dict):
+                    record[self.console_key] = self.console
+                else:
+                    record = {self.console_key: self.console,
+                              'value': record}
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch:
+                self._put(batch)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.records.close()
+            self._put(_Done(self.console))
+
+    def _put(self, item):
+        # Wait for room on the queue, giving up if the reader has stopped.
+        while not self.stop.is_set():
+            try:
+                self.output.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+def _drain(output):
+    # Yield the elements of one console's queue until its _Done.
+    while True:
+        batch = output.get()
+        if isinstance(batch, _Done):
+            return
+        for element in batch:
+            yield element
@@ -0,0 +1,682 @@
+"""
+The HTTPS transport used by RestApiClient. Connections to the server are kept
+open after a request completes and are reused for later requests, so most
+calls skip the TCP connect and the TLS handshake. When a new connection has to
+be opened the TLS session of an earlier connection is resumed if possible.
+Bodies sent with a gzip or deflate Content-Encoding are decompressed as they
+are read. The time spent in each phase of a request is recorded in a
+RequestTiming attached to its response.
+
+A request body may be bytes, any object that supports the buffer protocol
+such as an mmap, or a binary file object. File objects are sent in chunks as
+they are read, so a large upload is never held in memory; see body_length()
+for how their length is found.
+
+TLS sessions are kept per host and SSLContext for the life of the process, so
+a new client, or a new pool, resumes the session of an earlier one. Python's
+ssl module cannot save a session to disk, so each process still performs one
+full handshake per host.
+
+As with urllib, an HTTPS proxy set in the environment (https_proxy, and
+no_proxy for the hosts that bypass it) is used through a CONNECT tunnel.
+Errors from http.client are raised as URLError, as urllib raised them.
+"""
+import base64
+import collections
+import http.client
+import io
+import os
+import socket
+import ssl
+import stat
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+from urllib.error import URLError
+
+import JsonStream
+
+
+# Errors that indicate the server closed a kept-alive connection before we
+# tried to reuse it. A request that fails this way on a reused connection is
+# sent again on a new connection. Before Python 3.5 http.client raises
+# BadStatusLine where it now raises RemoteDisconnected.
+_STALE_CONNECTION_ERRORS = (getattr(http.client, 'RemoteDisconnected',
+                                    http.client.BadStatusLine),
+                            ConnectionResetError, BrokenPipeError,
+                            ssl.SSLEOFError)
+
+# The size of the blocks read from a file object sent as a request body.
+STREAM_BLOCK_SIZE = 256 * 1024
+
+# The most recent TLS session for each (host, SSLContext), shared by all pools.
+_tls_sessions = {}
+_tls_sessions_lock = threading.Lock()
+
+# The Accept-Encoding header sent with requests, and the zlib wbits used to
+# decompress each of the encodings it offers.
+ACCEPT_ENCODING = 'gzip, deflate'
+_ENCODING_WBITS = {'gzip': 16 + zlib.MAX_WBITS,
+                   'x-gzip': 16 + zlib.MAX_WBITS,
+                   'deflate': zlib.MAX_WBITS}
+
+# How much compressed data is read from the underlying response at a time.
+_COMPRESSED_CHUNK_SIZE = 16 * 1024
+
+
+class RequestTiming:
+    """
+    How long each phase of a request took, in seconds, and how many bytes of
+    body were sent and received. dns, connect and tls are 0 when the request
+    reused an open connection. ttfb is the time from sending the request to
+    receiving the response headers, and body the time from then until the
+    body had been read. Functions passed to on_complete are called once the
+    body has been read or the response closed.
+    """
+
+    PHASES = ('dns', 'connect', 'tls', 'ttfb', 'body')
+
+    def __init__(self):
+        self.dns = 0.0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.ttfb = 0.0
+        self.body = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.reused = False
+        self.complete = False
+        self._headers_received_at = None
+        self._callbacks = []
+
+    def total(self):
+        return self.dns + self.connect + self.tls + self.ttfb + self.body
+
+    def on_complete(self, callback):
+        """
+        Call callback(timing) when the request completes, or straight away if
+        it already has.
+        """
+
+        if self.complete:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def finish(self):
+        if self.complete:
+            return
+        if self._headers_received_at is not None:
+            self.body = time.monotonic() - self._headers_received_at
+        self.complete = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class PooledHTTPSConnection(http.client.HTTPSConnection):
+    """
+    An HTTPSConnection that belongs to a ConnectionPool. When connecting it
+    offers the TLS session saved by the pool so the server can resume it
+    instead of performing a full handshake. The time taken to resolve the
+    host, connect and complete the handshake is kept in connect_timing until
+    the pool reads it.
+    """
+
+    def __init__(self, pool, **kwargs):
+        if pool.proxy is None:
+            super().__init__(pool.host, context=pool.context, **kwargs)
+        else:
+            proxy_host, proxy_headers = pool.proxy
+            super().__init__(proxy_host, context=pool.context, **kwargs)
+            self.set_tunnel(pool.host, headers=proxy_headers)
+        self.pool = pool
+        self.last_used = time.monotonic()
+        self.connect_timing = None
+
+    def connect(self):
+        start = time.monotonic()
+        addresses = socket.getaddrinfo(self.host, self.port, 0,
+                                       socket.SOCK_STREAM)
+        resolved = time.monotonic()
+
+        # Connect to each address in turn, as socket.create_connection does.
+        error = None
+        for family, socket_type, protocol, name, address in addresses:
+            try:
+                self.sock = socket.create_connection(
+                    address[:2], self.timeout, self.source_address)
+                break
+            except OSError as e:
+                error = e
+        else:
+            raise error
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # Through a proxy, ask it to open a tunnel to the server; the TLS
+        # handshake is then made with the server through the tunnel.
+        server_hostname = self.host
+        if self._tunnel_host:
+            self._tunnel()
+            server_hostname = self._tunnel_host
+        connected = time.monotonic()
+
+        session = self.pool.tls_session
+        if hasattr(ssl, 'SSLSession') and session is not None:
+            self.sock = self._context.wrap_socket(
+                self.sock, server_hostname=server_hostname, session=session)
+        else:
+            self.sock = self._context.wrap_socket(
+                self.sock, server_hostname=server_hostname)
+        self.connect_timing = (resolved - start, connected - resolved,
+                               time.monotonic() - connected)
+
+
+class ConnectionPool:
+    """
+    A pool of persistent HTTPS connections to a single host. Up to maxsize
+    idle connections are kept open; connections that have been idle for
+    longer than idle_timeout seconds are closed instead of being reused. The
+    pool is safe to use from multiple threads. If more than maxsize requests
+    are in flight at once extra connections are opened, and closed again when
+    their responses have been read.
+    """
+
+    def __init__(self, host, context, maxsize=4, idle_timeout=60.0,
+                 timeout=None):
+        self.host = host
+        self.context = context
+        self.proxy = proxy_for(host)
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    @property
+    def tls_session(self):
+        """
+        The TLS session offered when opening a new connection, shared with
+        every pool for the same host and SSLContext.
+        """
+
+        with _tls_sessions_lock:
+            return _tls_sessions.get((self.host, self.context))
+
+    @tls_session.setter
+    def tls_session(self, session):
+        with _tls_sessions_lock:
+            _tls_sessions[(self.host, self.context)] = session
+
+    def urlopen(self, method, url, selector, body=None, headers=None):
+        """
+        Send a request over a pooled connection and return a PooledResponse.
+        Responses are returned for every status code. OSError is raised if
+        the server cannot be reached.
+        """
+
+        headers = headers or {}
+        if (body is not None and not is_stream(body) and
+                not isinstance(body, (bytes, bytearray, str, memoryview))):
+            # Buffers such as an mmap also have a read method, which
+            # http.client would use to copy them a block at a time. A view of
+            # the buffer is sent as it is.
+            with memoryview(body) as view:
+                return self.urlopen(method, url, selector, view, headers)
+
+        position = body_position(body)
+        while True:
+            connection, reused = self._get_connection()
+            timing = RequestTiming()
+            timing.reused = reused
+            start = time.monotonic()
+            request_body, request_headers = body, headers
+            if is_stream(body):
+                # A file object is sent as an iterable of blocks, so it is
+                # read STREAM_BLOCK_SIZE bytes at a time on every version of
+                # Python. Its length is sent when it is known; otherwise
+                # http.client (from Python 3.6) sends it with chunked
+                # transfer encoding.
+                request_body = _iter_blocks(body)
+                length = body_length(body)
+                if length is not None and 'Content-Length' not in headers:
+                    request_headers = dict(headers)
+                    request_headers['Content-Length'] = str(length)
+            try:
+                connection.request(method, selector, body=request_body,
+                                   headers=request_headers)
+                raw = connection.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                connection.close()
+                if reused and rewind_body(body, position):
+                    continue
+                raise
+            except http.client.HTTPException as e:
+                connection.close()
+                raise URLError(e)
+            except BaseException:
+                connection.close()
+                raise
+
+            timing._headers_received_at = time.monotonic()
+            if connection.connect_timing is not None:
+                timing.dns, timing.connect, timing.tls = (
+                    connection.connect_timing)
+                connection.connect_timing = None
+            timing.ttfb = (timing._headers_received_at - start -
+                           timing.dns - timing.connect - timing.tls)
+            timing.bytes_out = body_length(body, position) or 0
+            return PooledResponse(raw, self, connection, url, timing)
+
+    def release(self, connection):
+        """
+        Return a connection whose response has been fully read to the pool.
+        """
+
+        if connection.sock is None:
+            return
+        if isinstance(connection.sock, ssl.SSLSocket):
+            # TLS 1.3 session tickets are only received after the handshake,
+            # so the session is saved once a response has been read.
+            session = getattr(connection.sock, 'session', None)
+            if session is not None:
+                self.tls_session = session
+        connection.last_used = time.monotonic()
+        with self._lock:
+            self._evict_idle(connection.last_used)
+            if len(self._idle) < self.maxsize:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """
+        Close all idle connections held by the pool.
+        """
+
+        with self._lock:
+            while self._idle:
+                self._idle.popleft().close()
+
+    def _get_connection(self):
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            if self._idle:
+                # Reuse the most recently used connection first; it is the
+                # least likely to have been closed by the server.
+                return self._idle.pop(), True
+
+        if self.timeout is None:
+            return PooledHTTPSConnection(self), False
+        return PooledHTTPSConnection(self, timeout=self.timeout), False
+
+    def _evict_idle(self, now):
+        # The oldest connections are at the left of the deque.
+        while (self._idle and
+               now - self._idle[0].last_used > self.idle_timeout):
+            self._idle.popleft().close()
+
+
+class Response:
+    """
+    The attributes and methods shared by the response objects returned from
+    RestApiClient.call_api. They mirror the objects returned by
+    urllib.request.urlopen so existing code can use code, headers, info()
+    and read() as before.
+    """
+
+    # The RequestTiming of the request, if it was sent over a pool.
+    timing = None
+
+    def __init__(self, code, reason, headers, url):
+        self.code = code
+        self.status = code
+        self.reason = reason
+        self.msg = reason
+        self.headers = headers
+        self.url = url
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+    def geturl(self):
+        return self.url
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def getheaders(self):
+        return list(self.headers.items())
+
+    def readable(self):
+        return True
+
+    def iter_json(self, chunk_size=64 * 1024):
+        """
+        Return a generator over the elements of a JSON array body. Elements
+        are decoded as the body is read, so the whole body is never held in
+        memory at once.
+        """
+
+        return JsonStream.iter_json_array(self, chunk_size=chunk_size)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PooledResponse(Response):
+    """
+    A response read directly from a pooled connection. The connection is
+    handed back to the pool as soon as the body has been read to the end.
+    Closing the response before the body has been read closes the connection.
+    """
+
+    def __init__(self, raw, pool, connection, url, timing=None):
+        super().__init__(raw.status, raw.reason, raw.msg, url)
+        self.raw = raw
+        self.timing = timing or RequestTiming()
+        self._pool = pool
+        self._connection = connection
+
+        # Responses without a body (204, 304, HEAD) never need to be read, so
+        # the connection can go back to the pool straight away.
+        if raw.length == 0:
+            raw.read()
+        self._release_if_done()
+
+    def read(self, amt=None):
+        data = self._read(self.raw.read, amt)
+        self.timing.bytes_in += len(data)
+        self._release_if_done()
+        return data
+
+    def readinto(self, buffer):
+        count = self._read(self.raw.readinto, buffer)
+        self.timing.bytes_in += count
+        self._release_if_done()
+        return count
+
+    def readline(self, limit=-1):
+        line = self._read(self.raw.readline, limit)
+        self.timing.bytes_in += len(line)
+        self._release_if_done()
+        return line
+
+    def _read(self, function, argument):
+        # A body cut short raises IncompleteRead; the connection cannot be
+        # used again.
+        try:
+            return function(argument)
+        except http.client.HTTPException as e:
+            self.raw.close()
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+                self.timing.finish()
+            raise URLError(e)
+
+    def close(self):
+        if self._connection is None:
+            return
+        if not self.raw.isclosed():
+            self.raw.close()
+            self._connection.close()
+        self._connection = None
+        self.timing.finish()
+
+    def _release_if_done(self):
+        if self._connection is not None and self.raw.isclosed():
+            connection = self._connection
+            self._connection = None
+            if self.raw.length:
+                # The server closed the connection before sending the whole
+                # body, so it cannot be used again.
+                connection.close()
+            else:
+                self._pool.release(connection)
+            self.timing.finish()
+
+
+class BufferedResponse(Response):
+    """
+    A response whose body has already been read into memory. It is used when
+    the body was received some other way than through a ConnectionPool, for
+    example by the AsyncRestApiClient.
+    """
+
+    def __init__(self, code, reason, headers, url, body):
+        super().__init__(code, reason, headers, url)
+        self._body = io.BytesIO(body)
+
+    def read(self, amt=None):
+        if amt is None:
+            amt = -1
+        return self._body.read(amt)
+
+    def readinto(self, buffer):
+        return self._body.readinto(buffer)
+
+    def readline(self, limit=-1):
+        return self._body.readline(limit)
+
+    def close(self):
+        self._body.close()
+
+
+class DecompressedResponse(Response):
+    """
+    Wraps a response whose body was sent with a gzip or deflate
+    Content-Encoding. Reading returns the decompressed body, which is
+    decompressed a chunk at a time as it is read. The headers are those sent
+    by the server, so Content-Length, if present, is the compressed length.
+    """
+
+    def __init__(self, response, encoding):
+        super().__init__(response.code, response.reason, response.headers,
+                         response.url)
+        self.raw = response
+        self.timing = response.timing
+        self._wbits = _ENCODING_WBITS[encoding]
+        self._decompressor = zlib.decompressobj(self._wbits)
+        self._started = False
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, amt=None):
+        if amt is None or amt < 0:
+            while self._fill():
+                pass
+            amt = len(self._buffer)
+        else:
+            while len(self._buffer) < amt and self._fill():
+                pass
+        return self._take(amt)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self, limit=-1):
+        while True:
+            end = self._buffer.find(b'\n')
+            if end >= 0:
+                end += 1
+                break
+            if 0 <= limit <= len(self._buffer) or not self._fill():
+                end = len(self._buffer)
+                break
+        if limit >= 0:
+            end = min(end, limit)
+        return self._take(end)
+
+    def close(self):
+        self.raw.close()
+
+    def _take(self, amt):
+        data = bytes(self._buffer[:amt])
+        del self._buffer[:amt]
+        return data
+
+    def _fill(self):
+        # Decompress the next chunk of the body into the buffer. Returns
+        # False once the whole body has been decompressed.
+        if self._eof:
+            return False
+        data = self.raw.read(_COMPRESSED_CHUNK_SIZE)
+        if not data:
+            self._eof = True
+            self._buffer += self._decompressor.flush()
+            return False
+        if not self._started and self._wbits == zlib.MAX_WBITS:
+            # Some servers send deflate bodies without the zlib header.
+            self._started = True
+            try:
+                self._buffer += self._decompressor.decompress(data)
+            except zlib.error:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                self._buffer += self._decompressor.decompress(data)
+            return True
+        self._started = True
+        if not self._decompressor.eof:
+            self._buffer += self._decompressor.decompress(data)
+        return True
+
+
+def proxy_for(host):
+    """
+    Return the (proxy host, tunnel headers) of the HTTPS proxy to use for
+    host, or None if there is no proxy or host bypasses it. The proxy is
+    found the same way urllib finds it, from the environment or, on Windows
+    and macOS, the system settings.
+    """
+
+    proxy = urllib.request.getproxies().get('https')
+    if not proxy:
+        return None
+    hostname = urllib.parse.urlsplit('//' + host).hostname or host
+    if urllib.request.proxy_bypass(hostname):
+        return None
+    if '://' not in proxy:
+        proxy = 'http://' + proxy
+    parts = urllib.parse.urlsplit(proxy)
+    headers = {}
+    if parts.username is not None:
+        credentials = (urllib.parse.unquote(parts.username) + ':' +
+                       urllib.parse.unquote(parts.password or ''))
+        headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(
+            credentials.encode('utf-8')).decode('ascii')
+    proxy_host = parts.hostname
+    if ':' in proxy_host:
+        proxy_host = '[' + proxy_host + ']'
+    return proxy_host + ':' + str(parts.port or 80), headers
+
+
+def decode_content(response):
+    """
+    Return response, or a DecompressedResponse wrapping it if its body was
+    sent with a Content-Encoding of gzip or deflate.
+    """
+
+    encoding = response.headers.get('Content-Encoding', '').strip().lower()
+    if encoding not in _ENCODING_WBITS:
+        return response
+    return DecompressedResponse(response, encoding)
+
+
+def is_stream(body):
+    """
+    Return True if body is a file object, rather than bytes or another
+    object that supports the buffer protocol.
+    """
+
+    if not hasattr(body, 'read'):
+        return False
+    try:
+        memoryview(body).release()
+    except TypeError:
+        return True
+    return False
+
+
+def _iter_blocks(body):
+    while True:
+        block = body.read(STREAM_BLOCK_SIZE)
+        if not block:
+            return
+        if isinstance(block, str):
+            block = block.encode('iso-8859-1')
+        yield block
+
+
+def body_length(body, position=None):
+    """
+    Return the number of bytes a request body will send, or None if it is not
+    known until the body has been read. The length of a file object is only
+    known if it is a regular file, from its size and current position;
+    position overrides the current position, for a body that has already
+    been sent. A body of unknown length is sent with chunked transfer
+    encoding.
+    """
+
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode('iso-8859-1'))
+    if is_stream(body):
+        try:
+            status = os.fstat(body.fileno())
+            if position is None:
+                position = body.tell()
+        except (AttributeError, OSError, ValueError):
+            return None
+        if not stat.S_ISREG(status.st_mode):
+            return None
+        return max(0, status.st_size - position)
+    with memoryview(body) as view:
+        return view.nbytes
+
+
+def body_position(body):
+    """
+    Return the position to rewind a file object body to before sending it
+    again, or None if the body is not a file object or cannot be rewound.
+    """
+
+    if not is_stream(body):
+        return None
+    try:
+        if body.seekable():
+            return body.tell()
+    except (AttributeError, OSError, ValueError):
+        pass
+    return None
+
+
+def rewind_body(body, position):
+    """
+    Prepare a body that has been sent to be sent again. Returns False if it
+    is a file object that cannot be rewound.
+    """
+
+    if not is_stream(body):
+        return True
+    if position is None:
+        return False
+    body.seek(position)
+    return True
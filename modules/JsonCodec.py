@@ -0,0 +1,133 @@
+"""
+JSON encoding and decoding for the client and the samples. orjson is used if
+it is installed, then ujson, then the json module of the standard library.
+Both orjson and ujson are several times faster than the standard library at
+decoding large responses such as offense and asset lists.
+
+loads() decodes bytes directly, so a response body does not have to be
+decoded to a str first. dumps_bytes() returns bytes ready to send as a request
+body. Output that people read, such as dumps() with indent, is always
+formatted by the standard library so it looks the same whichever library is
+installed.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def _available(name):
+    if name == 'orjson':
+        return orjson is not None
+    if name == 'ujson':
+        return ujson is not None
+    return name == 'json'
+
+
+def _stdlib_loads(data):
+    # json.loads accepts bytes and detects their encoding itself.
+    return json.loads(data)
+
+
+def _stdlib_dumps_bytes(value):
+    return json.dumps(value).encode('utf-8')
+
+
+def _ujson_loads(data):
+    if isinstance(data, (bytearray, memoryview)):
+        data = bytes(data)
+    return ujson.loads(data)
+
+
+def _ujson_dumps_bytes(value):
+    return ujson.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def _orjson_loads(data):
+    return orjson.loads(data)
+
+
+def _orjson_dumps_bytes(value):
+    try:
+        return orjson.dumps(value)
+    except TypeError:
+        # orjson refuses some values the standard library accepts, such as
+        # dictionaries with non-string keys and integers over 64 bits.
+        return _stdlib_dumps_bytes(value)
+
+
+_loads = _stdlib_loads
+_dumps_bytes = _stdlib_dumps_bytes
+backend = 'json'
+
+
+def use_backend(name):
+    """
+    Use the named library, one of BACKENDS, for loads() and dumps_bytes().
+    Raises ValueError if it is not installed.
+    """
+
+    global _loads, _dumps_bytes, backend
+
+    if name not in BACKENDS or not _available(name):
+        raise ValueError('JSON library ' + name + ' is not available.')
+    if name == 'orjson':
+        _loads, _dumps_bytes = _orjson_loads, _orjson_dumps_bytes
+    elif name == 'ujson':
+        _loads, _dumps_bytes = _ujson_loads, _ujson_dumps_bytes
+    else:
+        _loads, _dumps_bytes = _stdlib_loads, _stdlib_dumps_bytes
+    backend = name
+
+
+def loads(data):
+    """
+    Return the value of the JSON document data, which may be bytes or a str.
+    Raises ValueError if data is not valid JSON.
+    """
+
+    return _loads(data)
+
+
+def dumps_bytes(value):
+    """
+    Return value encoded as compact UTF-8 JSON bytes.
+    """
+
+    return _dumps_bytes(value)
+
+
+def dumps(value, indent=None):
+    """
+    Return value encoded as a JSON str. If indent is given the output is
+    indented by that many spaces per level.
+    """
+
+    if indent is not None:
+        return json.dumps(value, indent=indent)
+    return _dumps_bytes(value).decode('utf-8')
+
+
+def load_response(response):
+    """
+    Read the body of a RestApiClient response and return its decoded JSON
+    value.
+    """
+
+    return _loads(response.read())
+
+
+for _name in BACKENDS:
+    if _available(_name):
+        use_backend(_name)
+        break
@@ -0,0 +1,92 @@
+"""
+Incremental decoding of JSON arrays. Most list endpoints of the API return a
+single JSON array; iter_json_array decodes the elements of that array one at a
+time while the body is still being received, so only the element being decoded
+has to be held in memory rather than the whole body.
+"""
+import codecs
+import json
+
+
+_WHITESPACE = ' \t\n\r'
+_SEPARATORS = _WHITESPACE + ',]'
+
+
+def iter_json_array(fp, chunk_size=64 * 1024):
+    """
+    A generator that returns the elements of the JSON array read from the
+    binary file object fp. fp is read chunk_size bytes at a time. ValueError
+    is raised if the body is not a JSON array.
+    """
+
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    at_eof = False
+
+    def fill(minimum):
+        # Read from fp until at least minimum characters are available after
+        # position, or the end of the body is reached.
+        nonlocal buffer, position, at_eof
+        buffer = buffer[position:]
+        position = 0
+        while not at_eof and len(buffer) < minimum:
+            chunk = fp.read(max(chunk_size, minimum - len(buffer)))
+            if not chunk:
+                buffer += utf8.decode(b'', final=True)
+                at_eof = True
+            else:
+                buffer += utf8.decode(chunk)
+
+    def next_character():
+        # Skip whitespace and return the next character without consuming it,
+        # or None at the end of the body.
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if at_eof:
+                return None
+            fill(1)
+
+    if next_character() != '[':
+        raise ValueError('The response body is not a JSON array.')
+    position += 1
+
+    if next_character() == ']':
+        return
+
+    while True:
+        # Decode the next element. If it fails because the element has not
+        # been received in full, read more and try again. The amount read is
+        # doubled each time so large elements are not decoded repeatedly.
+        required = chunk_size
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                # A number at the end of the buffer, or one cut off before
+                # its fraction or exponent, may continue in the next chunk, so
+                # the element only counts once a separator follows it.
+                if at_eof or (end < len(buffer) and
+                              buffer[end] in _SEPARATORS):
+                    break
+            except json.JSONDecodeError:
+                if at_eof:
+                    raise
+            required = max(required, 2 * (len(buffer) - position))
+            fill(required)
+
+        position = end
+        yield element
+
+        separator = next_character()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError('Expected "," or "]" in the JSON array but '
+                             'found ' + repr(separator) + '.')
+        position += 1
+        next_character()
@@ -0,0 +1,210 @@
+"""
+Client side rate limiting for RestApiClient. Each limit is a token bucket:
+tokens are added at rate per second up to burst, and every request takes one
+token, waiting for it if the bucket is empty. There is a bucket for all
+requests to a host and optionally one for each endpoint prefix, such as
+'siem/' or 'ariel/'. A request takes a token from the host bucket and from the
+bucket of every prefix its endpoint starts with.
+
+When a state directory is given the buckets are kept in files in it and
+updated under an exclusive file lock, so every thread and every process on the
+machine that uses the same directory shares one budget. On platforms without
+fcntl the buckets are kept in memory and shared only by the threads of one
+process.
+"""
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# The directory used to share buckets between processes when the
+# configuration does not name one.
+DEFAULT_STATE_DIRECTORY = os.path.join(tempfile.gettempdir(),
+                                       'qradar_api_rate_limits')
+
+# A bucket file holds the number of tokens and the time.time() at which that
+# number was correct.
+_STATE = struct.Struct('=dd')
+
+
+class TokenBucket:
+    """
+    A token bucket shared by the threads of one process.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available. Returns the number of
+        seconds spent waiting.
+        """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._tokens, self._updated, delay = _take(
+                    self._tokens, self._updated, self.rate, self.burst)
+            if delay == 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+class FileTokenBucket:
+    """
+    A token bucket stored in a file, shared by every process that opens the
+    same path. The file is locked with fcntl.flock while the bucket is
+    updated, and a thread lock serializes the threads of this process.
+    """
+
+    def __init__(self, path, rate, burst=None):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available. Returns the number of
+        seconds spent waiting.
+        """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                delay = self._try_take()
+            if delay == 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def _try_take(self):
+        file_descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            data = os.pread(file_descriptor, _STATE.size, 0)
+            if len(data) == _STATE.size:
+                tokens, updated = _STATE.unpack(data)
+            else:
+                # A new bucket starts full.
+                tokens, updated = self.burst, time.time()
+            tokens, updated, delay = _take(tokens, updated, self.rate,
+                                           self.burst)
+            os.pwrite(file_descriptor, _STATE.pack(tokens, updated), 0)
+            return delay
+        finally:
+            # Closing the file releases the lock.
+            os.close(file_descriptor)
+
+
+def _take(tokens, updated, rate, burst):
+    # Refill the bucket for the time since it was updated, then take a token
+    # if there is one. Returns the new state and how long to wait before
+    # trying again, or 0 if a token was taken.
+    now = time.time()
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, now, 0
+    return tokens, now, (1 - tokens) / rate
+
+
+class RateLimiter:
+    """
+    Limits the rate of requests to each host. host_rate is the number of
+    requests per second allowed to a host, or None for no host-wide limit.
+    prefix_rates is a dictionary of endpoint prefix to requests per second.
+    burst is how many requests may be sent at once after a quiet period, as
+    a multiple of the rate; it defaults to one second's worth.
+
+    If state_directory is given, or if shared is True, buckets are kept in
+    files so all processes on the machine share them; shared uses
+    DEFAULT_STATE_DIRECTORY.
+    """
+
+    def __init__(self, host_rate=None, prefix_rates=None, burst=1.0,
+                 state_directory=None, shared=False):
+        self.host_rate = host_rate
+        self.prefix_rates = dict(prefix_rates or {})
+        self.burst = burst
+        if state_directory is None and shared:
+            state_directory = DEFAULT_STATE_DIRECTORY
+        if fcntl is None:
+            state_directory = None
+        if state_directory is not None:
+            os.makedirs(state_directory, exist_ok=True)
+        self.state_directory = state_directory
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host, endpoint):
+        """
+        Wait until a request to endpoint on host is allowed. Returns the
+        number of seconds spent waiting.
+        """
+
+        endpoint = endpoint.lstrip('/')
+        waited = 0.0
+        for prefix, rate in sorted(self.prefix_rates.items()):
+            if endpoint.startswith(prefix):
+                waited += self._bucket(host, prefix, rate).acquire()
+        if self.host_rate is not None:
+            waited += self._bucket(host, '', self.host_rate).acquire()
+        return waited
+
+    def _bucket(self, host, prefix, rate):
+        key = (host, prefix)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                burst = max(1.0, rate * self.burst)
+                if self.state_directory is None:
+                    bucket = TokenBucket(rate, burst)
+                else:
+                    name = hashlib.sha256(
+                        (host + '\n' + prefix).encode('utf-8')).hexdigest()
+                    bucket = FileTokenBucket(
+                        os.path.join(self.state_directory,
+                                     name + '.bucket'), rate, burst)
+                self._buckets[key] = bucket
+            return bucket
+
+
+def rate_limiter_from_config(config):
+    """
+    Return a RateLimiter built from the rate_limit, rate_limits,
+    rate_limit_burst and rate_limit_dir settings of a Config, or None if
+    neither rate_limit nor rate_limits is set. rate_limits is a comma
+    separated list of prefix:rate pairs, for example
+    'siem/:10, ariel/:2'.
+    """
+
+    host_rate = config.get_config_value('rate_limit')
+    prefix_text = config.get_config_value('rate_limits')
+    if not host_rate and not prefix_text:
+        return None
+
+    prefix_rates = {}
+    for item in (prefix_text or '').split(','):
+        if item.strip():
+            prefix, rate = item.rsplit(':', 1)
+            prefix_rates[prefix.strip().lstrip('/')] = float(rate)
+    return RateLimiter(
+        host_rate=float(host_rate) if host_rate else None,
+        prefix_rates=prefix_rates,
+        burst=float(config.get_config_value('rate_limit_burst') or 1.0),
+        state_directory=config.get_config_value('rate_limit_dir'),
+        shared=True)
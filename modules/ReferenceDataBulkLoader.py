@@ -0,0 +1,237 @@
+"""
+Loads large collections into reference sets, maps, maps of sets and tables
+with the reference_data/{type}/bulk_load/{name} endpoints. The elements are
+split into chunks, each sent as one bulk load request, and several chunks are
+sent at once. Chunks that fail because the server is temporarily unable to
+handle them (429, 502, 503, 504) or with a connection error are retried by
+the loader, which sends each attempt with the retries of the client turned
+off so a chunk is never retried by both.
+
+The bulk load bodies for each type of collection are:
+
+    sets           ["value", ...]
+    maps           {"key": "value", ...}
+    map_of_sets    {"key": ["value", ...], ...}
+    tables         {"outer_key": {"inner_key": "value", ...}, ...}
+"""
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from urllib.error import URLError
+from urllib.parse import quote
+import copy
+import time
+
+import JsonCodec
+from RestApiClient import RestApiClient
+from RetryPolicy import RETRY_CODES
+
+
+class BulkLoadResult:
+    """
+    The progress of a bulk load. failed_chunks holds an
+    (elements, code, error) tuple for each chunk that could not be loaded,
+    where code is the response code of the last attempt, or None if it
+    raised error, such as a URLError for a connection error.
+    """
+
+    def __init__(self, collection_type, name):
+        self.collection_type = collection_type
+        self.name = name
+        self.elements_loaded = 0
+        self.chunks_loaded = 0
+        self.retries = 0
+        self.failed_chunks = []
+        self.start_time = time.monotonic()
+        self.end_time = None
+
+    def elapsed(self):
+        end_time = self.end_time
+        if end_time is None:
+            end_time = time.monotonic()
+        return end_time - self.start_time
+
+    def rate(self):
+        """
+        Return the number of elements loaded per second.
+        """
+
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return self.elements_loaded / elapsed
+
+    def summary(self):
+        text = ('Loaded ' + str(self.elements_loaded) + ' elements into ' +
+                self.collection_type + '/' + self.name + ' in ' +
+                str(self.chunks_loaded) + ' chunks in ' +
+                '{0:.1f}'.format(self.elapsed()) + ' seconds (' +
+                '{0:.0f}'.format(self.rate()) + ' elements per second).')
+        if self.retries:
+            text += ' Retried ' + str(self.retries) + ' requests.'
+        if self.failed_chunks:
+            text += (' Failed to load ' + str(len(self.failed_chunks)) +
+                     ' chunks.')
+        return text
+
+
+class ReferenceDataBulkLoader:
+    """
+    Sends chunks of chunk_size elements to the bulk load endpoints, with up
+    to max_in_flight requests at a time. A chunk is retried up to
+    max_retries times, waiting retry_interval seconds before the first retry
+    and twice as long before each one after that. If progress is given it is
+    called with the BulkLoadResult after each chunk completes.
+
+    For maps of sets each value counts as an element, and for tables each
+    cell does, so a large set under one key is split across chunks.
+    """
+
+    def __init__(self, client=None, chunk_size=10000, max_in_flight=4,
+                 max_retries=3, retry_interval=1.0, progress=None):
+        if client is None:
+            client = RestApiClient(version='6.0')
+        self.client = client
+        self.retry_policy = copy.copy(client.retry_policy)
+        self.retry_policy.max_retries = 0
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.progress = progress
+
+    def load_set(self, name, values):
+        """
+        Add an iterable of values to the reference set name.
+        """
+
+        return self._load('sets', name, _chunks(values, self.chunk_size),
+                          list)
+
+    def load_map(self, name, mapping):
+        """
+        Add the keys and values of a dictionary, or an iterable of
+        (key, value) pairs, to the reference map name.
+        """
+
+        return self._load('maps', name,
+                          _chunks(_items(mapping), self.chunk_size), dict)
+
+    def load_map_of_sets(self, name, mapping):
+        """
+        Add the values of a dictionary of key to iterable of values, or an
+        iterable of (key, value) pairs, to the reference map of sets name.
+        """
+
+        pairs = _items(mapping)
+        if isinstance(mapping, dict):
+            pairs = ((key, value) for key, values in pairs
+                     for value in values)
+        return self._load('map_of_sets', name,
+                          _chunks(pairs, self.chunk_size), _group_pairs)
+
+    def load_table(self, name, table):
+        """
+        Add the cells of a dictionary of outer key to dictionary of inner key
+        to value, or an iterable of (outer_key, inner_key, value) tuples, to
+        the reference table name.
+        """
+
+        cells = _items(table)
+        if isinstance(table, dict):
+            cells = ((outer_key, inner_key, value)
+                     for outer_key, row in cells
+                     for inner_key, value in _items(row))
+        return self._load('tables', name, _chunks(cells, self.chunk_size),
+                          _group_cells)
+
+    def _load(self, collection_type, name, chunks, to_body):
+        endpoint = ('reference_data/' + collection_type + '/bulk_load/' +
+                    quote(name, ''))
+        result = BulkLoadResult(collection_type, name)
+        headers = {'Content-Type': 'application/json'}
+
+        with ThreadPoolExecutor(self.max_in_flight) as executor:
+            in_flight = {}
+            for chunk in chunks:
+                if len(in_flight) >= self.max_in_flight:
+                    self._collect(in_flight, result)
+                body = JsonCodec.dumps_bytes(to_body(chunk))
+                future = executor.submit(self._send, endpoint, headers, body)
+                in_flight[future] = chunk
+            while in_flight:
+                self._collect(in_flight, result)
+
+        result.end_time = time.monotonic()
+        return result
+
+    def _collect(self, in_flight, result):
+        # Wait for at least one chunk to finish and record its outcome.
+        done, pending = wait(list(in_flight), return_when=FIRST_COMPLETED)
+        for future in done:
+            chunk = in_flight.pop(future)
+            try:
+                code, retries, error = future.result()
+            except Exception as e:
+                code, retries, error = None, 0, e
+            result.retries += retries
+            if code is not None and 200 <= code < 300:
+                result.elements_loaded += len(chunk)
+                result.chunks_loaded += 1
+            else:
+                result.failed_chunks.append((chunk, code, error))
+            if self.progress is not None:
+                self.progress(result)
+
+    def _send(self, endpoint, headers, body):
+        # Returns the response code of the last attempt, or None if it failed
+        # to connect, the number of retries and the connection error.
+        delay = self.retry_interval
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            try:
+                response = self.client.call_api(
+                    endpoint, 'POST', headers=headers, data=body,
+                    retry_policy=self.retry_policy)
+                response.read()
+                code, error = response.code, None
+            except URLError as e:
+                code, error = None, e
+            # Other error codes mean the chunk itself was rejected, so
+            # sending it again would not help.
+            if code is not None and code not in RETRY_CODES:
+                break
+        return code, attempt, error
+
+
+def _items(collection):
+    if isinstance(collection, dict):
+        return iter(collection.items())
+    return iter(collection)
+
+
+def _chunks(elements, chunk_size):
+    chunk = []
+    for element in elements:
+        chunk.append(element)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _group_pairs(pairs):
+    grouped = {}
+    for key, value in pairs:
+        grouped.setdefault(key, []).append(value)
+    return grouped
+
+
+def _group_cells(cells):
+    grouped = {}
+    for outer_key, inner_key, value in cells:
+        grouped.setdefault(outer_key, {})[inner_key] = value
+    return grouped
@@ -0,0 +1,262 @@
+"""
+Instrumentation for RestApiClient. A RequestMetrics passed to the client
+records, for every request sent to the server:
+
+ - the time spent resolving the host name, connecting, completing the TLS
+   handshake, waiting for the first byte of the response and reading the
+   body, as histograms per endpoint template;
+ - the number of body bytes sent and received;
+ - the number of responses with each status code.
+
+Endpoint templates replace ids and names in the path with placeholders, so
+siem/offenses/42/notes and siem/offenses/7/notes are counted together as
+siem/offenses/{id}/notes. summary() formats the results as a table, either
+per endpoint template or per API family such as ariel or siem.
+
+Functions can also be registered to run before each call and after each
+call returns.
+"""
+import math
+import re
+import sys
+import threading
+
+from HttpTransport import RequestTiming
+
+
+_ID_PATTERN = re.compile(
+    r'^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+    r'[0-9a-fA-F]{12})$')
+
+# Reference data collections are addressed by name rather than by id.
+_REFERENCE_DATA_PATTERN = re.compile(
+    r'^(reference_data/(?:sets|maps|map_of_sets|tables)/(?:bulk_load/)?)'
+    r'([^/]+)')
+
+
+def endpoint_template(path):
+    """
+    Return the endpoint template of a request path, without the query string
+    and with ids and reference data names replaced by {id} and {name}.
+    """
+
+    endpoint = path.split('?', 1)[0].strip('/')
+    endpoint = _REFERENCE_DATA_PATTERN.sub(
+        lambda match: match.group(1) + (match.group(2)
+                                        if match.group(2) == 'bulk_load'
+                                        else '{name}'), endpoint)
+    return '/'.join('{id}' if _ID_PATTERN.match(segment) else segment
+                    for segment in endpoint.split('/'))
+
+
+class LatencyHistogram:
+    """
+    Counts durations in buckets whose bounds grow by 20% from 0.1ms, so
+    percentiles are accurate to within 20% however many values are added.
+    """
+
+    _BASE = 0.0001
+    _GROWTH = 1.2
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        if seconds <= self._BASE:
+            index = 0
+        else:
+            index = int(math.ceil(math.log(seconds / self._BASE,
+                                           self._GROWTH)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """
+        Return an upper bound for the given percentile of the durations.
+        """
+
+        if not self.count:
+            return 0.0
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self._BASE * self._GROWTH ** index, self.maximum)
+        return self.maximum
+
+
+class EndpointStats:
+    """
+    The statistics recorded for one endpoint template.
+    """
+
+    def __init__(self):
+        self.histograms = dict((phase, LatencyHistogram())
+                               for phase in RequestTiming.PHASES + ('total',))
+        self.status_codes = {}
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def count(self):
+        return self.histograms['total'].count
+
+
+class RequestMetrics:
+    """
+    Collects statistics about the requests a RestApiClient sends. Pass an
+    instance to the client as metrics. It is safe to share one between
+    clients and threads.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self.pre_request_hooks = []
+        self.post_request_hooks = []
+        self._lock = threading.Lock()
+
+    def add_pre_request_hook(self, hook):
+        """
+        Call hook(method, path, headers) before each call_api call sends its
+        request. path includes the query string.
+        """
+
+        self.pre_request_hooks.append(hook)
+
+    def add_post_request_hook(self, hook):
+        """
+        Call hook(method, path, response) when each call_api call returns.
+        response.timing is None for responses served from the response
+        cache, and its body time is not known until the body has been read.
+        """
+
+        self.post_request_hooks.append(hook)
+
+    def before_request(self, method, path, headers):
+        for hook in self.pre_request_hooks:
+            hook(method, path, headers)
+
+    def after_request(self, method, path, response):
+        for hook in self.post_request_hooks:
+            hook(method, path, response)
+
+    def record(self, method, path, code, timing):
+        """
+        Record a request sent to the server once its body has been read.
+        """
+
+        with self._lock:
+            stats = self._stats(method, path)
+            for phase in RequestTiming.PHASES:
+                stats.histograms[phase].add(getattr(timing, phase))
+            stats.histograms['total'].add(timing.total())
+            stats.status_codes[code] = stats.status_codes.get(code, 0) + 1
+            stats.bytes_in += timing.bytes_in
+            stats.bytes_out += timing.bytes_out
+
+    def record_error(self, method, path):
+        """
+        Record a request that failed without a response.
+        """
+
+        with self._lock:
+            self._stats(method, path).errors += 1
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+    def summary(self, by_family=False):
+        """
+        Return a table of the recorded statistics, one row per method and
+        endpoint template, or per API family (the first part of the path) if
+        by_family is True. Times are in milliseconds: the 50th, 95th and 99th
+        percentiles of the total time and the mean of each phase.
+        """
+
+        with self._lock:
+            rows = self._summary_rows(by_family)
+
+        header = ('ENDPOINT', 'CALLS', 'ERR', 'P50', 'P95', 'P99', 'DNS',
+                  'CONN', 'TLS', 'TTFB', 'BODY', 'KB IN', 'KB OUT',
+                  'STATUS')
+        table = [header] + rows
+        widths = [max(len(row[column]) for row in table)
+                  for column in range(len(header))]
+        lines = []
+        for row in table:
+            cells = [row[0].ljust(widths[0])]
+            cells += [cell.rjust(width)
+                      for cell, width in zip(row[1:-1], widths[1:-1])]
+            cells.append(row[-1])
+            lines.append('  '.join(cells))
+        return '\n'.join(lines)
+
+    def print_summary(self, by_family=False, file=None):
+        print(self.summary(by_family), file=file or sys.stdout)
+
+    def _stats(self, method, path):
+        # Called with the lock held.
+        key = (method.upper(), endpoint_template(path))
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = EndpointStats()
+            self.endpoints[key] = stats
+        return stats
+
+    def _summary_rows(self, by_family):
+        # Called with the lock held.
+        groups = {}
+        for (method, template), stats in self.endpoints.items():
+            if by_family:
+                name = template.split('/', 1)[0]
+            else:
+                name = method + ' ' + template
+            groups.setdefault(name, []).append(stats)
+
+        rows = []
+        for name in sorted(groups):
+            merged = EndpointStats()
+            for stats in groups[name]:
+                for phase, histogram in stats.histograms.items():
+                    _merge_histogram(merged.histograms[phase], histogram)
+                for code, count in stats.status_codes.items():
+                    merged.status_codes[code] = (
+                        merged.status_codes.get(code, 0) + count)
+                merged.errors += stats.errors
+                merged.bytes_in += stats.bytes_in
+                merged.bytes_out += stats.bytes_out
+
+            total = merged.histograms['total']
+            rows.append(
+                [name, str(total.count), str(merged.errors)] +
+                [_milliseconds(total.percentile(percent))
+                 for percent in (50, 95, 99)] +
+                [_milliseconds(merged.histograms[phase].mean())
+                 for phase in RequestTiming.PHASES] +
+                ['{0:.1f}'.format(merged.bytes_in / 1024.0),
+                 '{0:.1f}'.format(merged.bytes_out / 1024.0),
+                 ' '.join(str(code) + ':' + str(count) for code, count
+                          in sorted(merged.status_codes.items()))])
+        return rows
+
+
+def _merge_histogram(target, source):
+    for index, count in source.buckets.items():
+        target.buckets[index] = target.buckets.get(index, 0) + count
+    target.count += source.count
+    target.total += source.total
+    target.maximum = max(target.maximum, source.maximum)
+
+
+def _milliseconds(seconds):
+    return '{0:.1f}'.format(seconds * 1000)
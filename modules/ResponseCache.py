@@ -0,0 +1,241 @@
+"""
+An on-disk cache of GET responses for RestApiClient, stored in a DiskCache.
+
+A response that carries an ETag or Last-Modified header is kept for the
+validator_ttl of its policy, and is revalidated with If-None-Match or
+If-Modified-Since once it is older than the revalidate_after of its policy.
+If the server answers 304 Not Modified the cached response is returned as if
+the server had sent it again.
+A response without validators can only be reused for the ttl of its policy,
+after which it is requested again in full.
+
+Policies are chosen by the longest endpoint prefix that matches the request.
+By default only responses with validators are cached, and they are
+revalidated on every request, so the cache never returns data the server
+would not. LOOKUP_POLICIES serves endpoints whose contents rarely change from
+the cache for an hour without asking the server.
+
+RestApiClient calls invalidate() for every request other than a GET, so a
+change made through the client is seen by its next GET. The cached responses
+of the endpoint prefix the request matches, and of the endpoints the request
+path is under or above, are no longer used.
+"""
+import hashlib
+import http.client
+import time
+
+from DiskCache import DiskCache
+
+
+class CachePolicy:
+    """
+    How responses of an endpoint are cached. Responses without validators
+    are reused for ttl seconds; 0 means they are not cached. Responses with
+    validators are reused without asking the server for revalidate_after
+    seconds, then revalidated, and removed after validator_ttl seconds. If
+    enabled is False nothing is cached.
+    """
+
+    def __init__(self, ttl=0, revalidate_after=0, enabled=True,
+                 validator_ttl=86400):
+        self.ttl = ttl
+        self.revalidate_after = revalidate_after
+        self.enabled = enabled
+        self.validator_ttl = validator_ttl
+
+
+# Endpoints whose contents change rarely enough that a cached copy can be
+# used for an hour.
+LOOKUP_POLICIES = {
+    'data_classification/high_level_categories':
+        CachePolicy(ttl=3600, revalidate_after=3600),
+    'data_classification/low_level_categories':
+        CachePolicy(ttl=3600, revalidate_after=3600),
+    'siem/offense_types': CachePolicy(ttl=3600, revalidate_after=3600),
+    'siem/offense_closing_reasons':
+        CachePolicy(ttl=3600, revalidate_after=3600),
+    'config/access/tenant_management/tenants':
+        CachePolicy(ttl=3600, revalidate_after=3600),
+    'help/capabilities': CachePolicy(ttl=3600, revalidate_after=3600),
+}
+
+# Request headers that change the response, and so are part of the key.
+_VARY_HEADERS = ('Accept', 'Range', 'Version')
+
+# Request headers holding credentials. They are part of the key, so users do
+# not see each other's responses, but only as a hash.
+_CREDENTIAL_HEADERS = ('Authorization', 'SEC')
+
+# Response headers that describe the encoded body and are not stored, since
+# the cache stores the decoded body.
+_ENCODING_HEADERS = ('content-encoding', 'content-length',
+                     'transfer-encoding')
+
+
+class ResponseCache:
+    """
+    Caches GET responses in directory, keeping at most max_bytes; the least
+    recently used responses are removed first. policies is a dictionary of
+    endpoint prefix to CachePolicy, and default_policy is used for endpoints
+    that match none of them.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024,
+                 policies=None, default_policy=None):
+        self.cache = DiskCache(directory, max_bytes=max_bytes)
+        self.policies = dict(LOOKUP_POLICIES if policies is None
+                             else policies)
+        if default_policy is None:
+            default_policy = CachePolicy()
+        self.default_policy = default_policy
+        # Endpoint prefix -> time.time() of the last invalidate() for it.
+        self._invalidated = {}
+
+    def policy(self, path):
+        """
+        Return the CachePolicy for a request path, without the query string.
+        """
+
+        prefix = self._policy_prefix(_endpoint(path))
+        if prefix is None:
+            return self.default_policy
+        return self.policies[prefix]
+
+    def invalidate(self, path):
+        """
+        Stop using the cached responses affected by a request to path that
+        changes data: those of the policy prefix path matches, or of path
+        itself if it matches none, and those of any endpoint that path is
+        under or above.
+        """
+
+        endpoint = _endpoint(path)
+        prefix = self._policy_prefix(endpoint)
+        self._invalidated[endpoint if prefix is None else prefix] = (
+            time.time())
+
+    def cache_key(self, path, headers):
+        """
+        Return the cache key for a request.
+        """
+
+        parts = [path.lstrip('/')]
+        for name in _VARY_HEADERS:
+            if name in headers:
+                parts.append(name + ': ' + str(headers[name]))
+        for name in _CREDENTIAL_HEADERS:
+            if name in headers:
+                value = headers[name]
+                if isinstance(value, str):
+                    value = value.encode('utf-8')
+                parts.append(name + ': ' + hashlib.sha256(value).hexdigest())
+        return '\n'.join(parts)
+
+    def fetch(self, path, headers, send):
+        """
+        Return the response to a GET request for path with headers, from the
+        cache if possible. send(headers) is called to send the request and
+        must return a (code, reason, headers, url, body) tuple; responses are
+        returned in the same form.
+        """
+
+        policy = self.policy(path)
+        if not policy.enabled:
+            return send(headers)
+
+        key = self.cache_key(path, headers)
+        entry = self.cache.get(key)
+        now = time.time()
+        if entry is not None and self._is_invalidated(path, entry):
+            self.cache.delete(key)
+            entry = None
+        if entry is not None and now < entry.metadata['fresh_until']:
+            return _from_entry(entry)
+
+        request_headers = headers
+        if entry is not None:
+            request_headers = dict(headers)
+            if entry.metadata.get('etag'):
+                request_headers['If-None-Match'] = entry.metadata['etag']
+            if entry.metadata.get('last_modified'):
+                request_headers['If-Modified-Since'] = (
+                    entry.metadata['last_modified'])
+
+        response = send(request_headers)
+        code, reason, response_headers, url, body = response
+        if code == 304 and entry is not None:
+            # The cached response is still current. Store it again so it is
+            # fresh for another revalidate_after seconds.
+            entry.metadata['fresh_until'] = now + policy.revalidate_after
+            entry.metadata['stored_at'] = now
+            self.cache.set(key, entry.value, ttl=policy.validator_ttl,
+                           metadata=entry.metadata)
+            return _from_entry(entry)
+
+        if code == 200:
+            self._store(key, policy, response, now)
+        return response
+
+    def clear(self):
+        """
+        Remove every cached response.
+        """
+
+        self.cache.clear()
+
+    def _policy_prefix(self, endpoint):
+        best = None
+        for prefix in self.policies:
+            if endpoint.startswith(prefix) and (best is None or
+                                                len(prefix) > len(best)):
+                best = prefix
+        return best
+
+    def _is_invalidated(self, path, entry):
+        endpoint = _endpoint(path)
+        stored_at = entry.metadata.get('stored_at', 0)
+        for prefix, invalidated_at in self._invalidated.items():
+            if stored_at <= invalidated_at and (
+                    endpoint.startswith(prefix) or
+                    prefix.startswith(endpoint + '/')):
+                return True
+        return False
+
+    def _store(self, key, policy, response, now):
+        code, reason, headers, url, body = response
+        cache_control = headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control:
+            return
+
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        metadata = {'code': code,
+                    'reason': reason,
+                    'url': url,
+                    'headers': [(name, value)
+                                for name, value in headers.items()
+                                if name.lower() not in _ENCODING_HEADERS],
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'stored_at': now}
+        if etag or last_modified:
+            # Kept for longer than the ttl, since it can be revalidated.
+            metadata['fresh_until'] = now + policy.revalidate_after
+            self.cache.set(key, body, ttl=policy.validator_ttl,
+                           metadata=metadata)
+        elif policy.ttl > 0:
+            metadata['fresh_until'] = now + policy.ttl
+            self.cache.set(key, body, ttl=policy.ttl, metadata=metadata)
+
+
+def _endpoint(path):
+    return path.split('?', 1)[0].strip('/')
+
+
+def _from_entry(entry):
+    headers = http.client.HTTPMessage()
+    for name, value in entry.metadata['headers']:
+        headers[name] = value
+    headers['Content-Length'] = str(len(entry.value))
+    return (entry.metadata['code'], entry.metadata['reason'], headers,
+            entry.metadata['url'], entry.value)
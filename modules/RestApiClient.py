@@ -1,26 +1,88 @@
 from config import Config
 
-from urllib.error import HTTPError
+from HttpTransport import ACCEPT_ENCODING
+from HttpTransport import BufferedResponse
+from HttpTransport import body_length
+from HttpTransport import body_position
+from HttpTransport import ConnectionPool
+from HttpTransport import decode_content
+from HttpTransport import is_stream
+from HttpTransport import rewind_body
+from EndpointTemplate import append_query
+from RateLimiter import rate_limiter_from_config
+from ResponseCache import ResponseCache
+from RetryPolicy import CircuitOpenError
+from RetryPolicy import RetryPolicy
+from SingleFlight import SingleFlight
+
+from concurrent.futures import ThreadPoolExecutor
 from urllib.error import URLError
-from urllib.parse import quote
-from urllib.request import Request
-from urllib.request import urlopen
-from urllib.request import install_opener
-from urllib.request import build_opener
-from urllib.request import HTTPSHandler
 
+import JsonCodec
 import SampleUtilities
 
+import collections
+import mmap
+import os
 import ssl
 import sys
+import threading
+import time
 import base64
 
 
+# Canonical spelling of the headers the client sets itself, used when merging
+# headers that callers spell differently (for example 'Content-type').
+_HEADER_NAMES = {'accept': 'Accept',
+                 'accept-encoding': 'Accept-Encoding',
+                 'authorization': 'Authorization',
+                 'content-type': 'Content-Type',
+                 'range': 'Range',
+                 'sec': 'SEC',
+                 'version': 'Version'}
+
+
+# The size of the chunks download() copies from the response to the file.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+# SSLContexts shared between clients, keyed by the certificate file, its
+# modification time and the protocol options.
+_ssl_contexts = {}
+_ssl_contexts_lock = threading.Lock()
+
+
+# Returns the modification time of a file, or None if there is no such file.
+def _modification_time(file_name):
+    if file_name is None:
+        return None
+    try:
+        return os.path.getmtime(file_name)
+    except OSError:
+        return None
+
+
+# This exception is raised by the RestApiClient methods that return data
+# rather than a response object, when the API responds with an error.
+class RestApiError(Exception):
+
+    def __init__(self, response):
+        self.response = response
+        self.code = response.code
+        self.body = response.read()
+        super(RestApiError, self).__init__(
+            'The API returned ' + str(self.code) + ' for ' +
+            response.geturl() + ': ' + self.body.decode('utf-8', 'replace'))
+
+
 # This is a simple HTTP client that can be used to access the REST API
 class RestApiClient:
 
     # Constructor for the RestApiClient Class
-    def __init__(self, config_section='DEFAULT', version=None, config=None):
+    def __init__(self, config_section='DEFAULT', version=None, config=None,
+                 pool_maxsize=None, pool_idle_timeout=None, compression=None,
+                 retry_policy=None, rate_limiter=None, coalesce_gets=None,
+                 response_cache=None, metrics=None):
 
         if config is None:
             self.config = Config(config_section=config_section)
@@ -44,6 +106,86 @@ class RestApiClient:
         self.server_ip = self.config.get_config_value('server_ip')
         self.base_uri = '/api/'
 
+        # Building an SSLContext parses the whole CA bundle, so contexts are
+        # shared by every client in the process that uses the same
+        # certificate file.
+        certificate_file = self.config.get_config_value('certificate_file')
+        context_key = (certificate_file, _modification_time(certificate_file),
+                       ssl.PROTOCOL_SSLv23, ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3)
+        with _ssl_contexts_lock:
+            context = _ssl_contexts.get(context_key)
+        if context is None:
+            # The context is built without the lock held, since building it
+            # may ask the user whether to continue. If another client built
+            # one meanwhile, that one is used.
+            context = self.create_ssl_context(certificate_file)
+            with _ssl_contexts_lock:
+                context = _ssl_contexts.setdefault(context_key, context)
+
+        # Connections to the server are kept open and reused between calls.
+        # The number of idle connections kept open and how long they may stay
+        # idle can be passed in or set in config.ini as pool_maxsize and
+        # pool_idle_timeout.
+        if pool_maxsize is None:
+            pool_maxsize = int(self.config.get_config_value('pool_maxsize') or
+                               4)
+        if pool_idle_timeout is None:
+            pool_idle_timeout = float(
+                self.config.get_config_value('pool_idle_timeout') or 60)
+        # Responses are requested gzip or deflate compressed unless
+        # compression is False or set to false in config.ini.
+        if compression is None:
+            compression = (self.config.get_config_value('compression') or
+                           'true').lower() != 'false'
+        self.compression = compression
+
+        # Requests that fail because the server is busy or unreachable are
+        # retried with a growing, randomized delay. The number of retries can
+        # be set in config.ini as max_retries, or a RetryPolicy passed in.
+        if retry_policy is None:
+            retry_policy = RetryPolicy(max_retries=int(
+                self.config.get_config_value('max_retries') or 3))
+        self.retry_policy = retry_policy
+
+        # Requests can be limited to a number per second for the server and
+        # for endpoint prefixes, shared by every process on this machine.
+        # See RateLimiter.py for the config.ini settings.
+        if rate_limiter is None:
+            rate_limiter = rate_limiter_from_config(self.config)
+        self.rate_limiter = rate_limiter
+
+        # Identical GETs in flight at the same time can share one request.
+        # This is off unless coalesce_gets is True or set to true in
+        # config.ini, because every caller then waits for the whole body.
+        if coalesce_gets is None:
+            coalesce_gets = (self.config.get_config_value('coalesce_gets') or
+                             'false').lower() == 'true'
+        self.single_flight = SingleFlight() if coalesce_gets else None
+
+        # GET responses can be cached on disk and revalidated with the
+        # server. The cache is used when a ResponseCache is passed in or
+        # response_cache_dir is set in config.ini.
+        if (response_cache is None and
+                self.config.get_config_value('response_cache_dir')):
+            response_cache = ResponseCache(
+                self.config.get_config_value('response_cache_dir'),
+                max_bytes=int(float(self.config.get_config_value(
+                    'response_cache_size_mb') or 64) * 1024 * 1024))
+        self.response_cache = response_cache
+
+        # A RequestMetrics, if given, records the timing, size and status of
+        # every request and runs its hooks around every call.
+        self.metrics = metrics
+
+        self.ssl_context = context
+        self.connection_pool = ConnectionPool(
+            self.server_ip, context, maxsize=pool_maxsize,
+            idle_timeout=pool_idle_timeout)
+
+    # This method creates the SSLContext used to connect to the server,
+    # trusting only certificate_file if it is not None.
+    def create_ssl_context(self, certificate_file):
+
         # Create a secure SSLContext
         # PROTOCOL_SSLv23 is misleading.  PROTOCOL_SSLv23 will use the highest
         # version of SSL or TLS that both the client and server supports.
@@ -76,8 +218,6 @@ class RestApiClient:
         if sys.version_info >= (3, 4):
             context.check_hostname = True
 
-        check_hostname = True
-        certificate_file = self.config.get_config_value('certificate_file')
         if certificate_file is not None:
             # Load the certificate if the user has specified a certificate
             # file in config.ini.
@@ -86,7 +226,6 @@ class RestApiClient:
             # so me must disable hostname checking.
             if sys.version_info >= (3, 4):
                 context.check_hostname = False
-            check_hostname = False
 
             # Instead of loading the default certificates load only the
             # certificates specified by the user.
@@ -103,75 +242,460 @@ class RestApiClient:
                 # this call fails the certificate will fail to validate.
                 context.set_default_verify_paths()
 
-        install_opener(build_opener(
-            HTTPSHandler(context=context, check_hostname=check_hostname)))
+        return context
 
-    # This method is used to set up an HTTP request and send it to the server
+    # This method is used to set up an HTTP request and send it to the server.
+    # data may be bytes, a memory-mapped file or other buffer, or a binary
+    # file object, which is read and sent in blocks rather than all at once.
+    # retry_policy replaces the client's retry policy for this request.
     def call_api(self, endpoint, method, headers=None, params=[], data=None,
-                 print_request=False):
+                 print_request=False, retry_policy=None):
+
+        path, actual_headers = self.prepare_request(
+            endpoint, method, headers=headers, params=params, data=data,
+            print_request=print_request)
+        if self.metrics is not None:
+            self.metrics.before_request(method, path, actual_headers)
+
+        # GETs are answered from the response cache when it is on, and
+        # identical GETs made by several threads at once are sent as one
+        # request when coalescing is on. Both return the whole body, so each
+        # caller gets its own buffered copy of the response.
+        if method.upper() == 'GET' and (self.response_cache is not None or
+                                        self.single_flight is not None):
+            if self.response_cache is not None:
+                parts = self.response_cache.fetch(
+                    path, actual_headers,
+                    lambda request_headers: self.send_coalesced(
+                        path, request_headers, retry_policy))
+            else:
+                parts = self.send_coalesced(path, actual_headers,
+                                            retry_policy)
+            response = BufferedResponse(*parts)
+        else:
+            response = self.send(method, path, actual_headers, data,
+                                 retry_policy)
+            # A request that may have changed data makes the cached GETs of
+            # the endpoint stale.
+            if self.response_cache is not None and method.upper() != 'GET':
+                self.response_cache.invalidate(path)
+        self.check_response(response)
+        if self.metrics is not None:
+            self.metrics.after_request(method, path, response)
+
+        # returns the response object. Responses with an error status code
+        # are returned in the same way as successful responses.
+        return response
+
+    # This method sends a GET and copies the response body to the file
+    # file_name a chunk at a time, so a body of any size is downloaded with
+    # constant memory. The response is returned once the body has been
+    # written; responses with an error status code are returned unread, and
+    # the file is not touched.
+    #
+    # progress, if given, is called as progress(bytes_written, total_bytes)
+    # after each chunk; total_bytes is None if the server did not say how
+    # long the body is. If resume is True and file_name already has data,
+    # only the rest of the body is requested with a bytes Range header and
+    # appended. QRadar only accepts items ranges, so if the server does not
+    # answer with 206 Partial Content the whole body is downloaded again.
+    # If use_mmap is True and the length of the body is known, the
+    # body is read straight into a memory-mapped view of the file.
+    def download(self, endpoint, file_name, headers=None, params=[],
+                 progress=None, resume=False, use_mmap=False,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, print_request=False):
+
+        path, actual_headers = self.prepare_request(
+            endpoint, 'GET', headers=headers, params=params,
+            print_request=print_request)
+
+        # A Range header from the caller, such as an Ariel items range, cannot
+        # be combined with resuming, so the whole body is downloaded again.
+        offset = 0
+        if (resume and 'Range' not in actual_headers and
+                os.path.exists(file_name)):
+            offset = os.path.getsize(file_name)
+        if offset:
+            # The range is of the bytes of the body as it was written, so the
+            # rest must be sent without compression.
+            actual_headers['Range'] = 'bytes=' + str(offset) + '-'
+            actual_headers['Accept-Encoding'] = 'identity'
+
+        # Downloads bypass the response cache and coalescing, which would
+        # hold the whole body in memory.
+        if self.metrics is not None:
+            self.metrics.before_request('GET', path, actual_headers)
+        response = self.send('GET', path, actual_headers)
+        self.check_response(response)
+
+        if offset and 400 <= response.code < 500:
+            # The byte range was refused, for example with 422 by QRadar,
+            # so the whole body is requested instead.
+            response.read()
+            if self.metrics is not None:
+                self.metrics.after_request('GET', path, response)
+            del actual_headers['Range']
+            if self.metrics is not None:
+                self.metrics.before_request('GET', path, actual_headers)
+            response = self.send('GET', path, actual_headers)
+            self.check_response(response)
+
+        if response.code in (200, 206):
+            if response.code == 206:
+                # 'Content-Range: bytes 100-199/200'. Write from where the
+                # server starts, which may be before the end of the file.
+                content_range = response.headers.get('Content-Range', '')
+                start_text = content_range.split(' ', 1)[-1].split('-', 1)[0]
+                offset = int(start_text) if start_text.isdigit() else offset
+            else:
+                offset = 0
+            self.write_body(response, file_name, offset, progress, use_mmap,
+                            chunk_size)
+
+        if self.metrics is not None:
+            self.metrics.after_request('GET', path, response)
+        return response
+
+    # This method copies the body of a response into file_name starting at
+    # offset, and truncates the file where the body ends.
+    def write_body(self, response, file_name, offset, progress, use_mmap,
+                   chunk_size):
+
+        length = None
+        # The length of a compressed body is not the length written.
+        encoding = response.headers.get('Content-Encoding', '')
+        if encoding.strip().lower() in ('', 'identity'):
+            length_text = response.headers.get('Content-Length')
+            if length_text is not None and length_text.isdigit():
+                length = int(length_text)
+        total = offset + length if length is not None else None
+
+        mode = 'r+b' if offset and os.path.exists(file_name) else 'w+b'
+        with open(file_name, mode) as output:
+            output.seek(offset)
+            output.truncate()
+            written = offset
+            if use_mmap and length:
+                # Size the file first, then have each read fill the mapped
+                # pages directly.
+                output.truncate(total)
+                with mmap.mmap(output.fileno(), total) as mapped:
+                    with memoryview(mapped) as view:
+                        while written < total:
+                            count = response.readinto(
+                                view[written:min(written + chunk_size,
+                                                 total)])
+                            if not count:
+                                break
+                            written += count
+                            if progress is not None:
+                                progress(written, total)
+                if written < total:
+                    output.truncate(written)
+            else:
+                buffer = bytearray(chunk_size)
+                with memoryview(buffer) as view:
+                    while True:
+                        count = response.readinto(view)
+                        if not count:
+                            break
+                        output.write(view[:count])
+                        written += count
+                        if progress is not None:
+                            progress(written, total)
+        response.close()
+        if length is not None and written < total:
+            raise URLError('Connection closed after ' + str(written) +
+                           ' of ' + str(total) + ' bytes of ' + file_name +
+                           ' were received.')
+
+    # This method sends a request, retrying it under the retry policy, and
+    # returns the response with its body decoded.
+    def send(self, method, path, actual_headers, data=None,
+             retry_policy=None):
+
+        # Send the request and receive the response. The request is sent
+        # again if the retry policy allows it, after waiting as long as the
+        # policy says.
+        if retry_policy is None:
+            retry_policy = self.retry_policy
+        url = 'https://' + self.server_ip + self.base_uri + path
+        breaker = retry_policy.circuit_breaker(self.server_ip)
+        # A file object body is rewound before it is sent again. One that
+        # cannot be rewound is only sent once.
+        position = body_position(data)
+        attempt = 0
+        while True:
+            try:
+                if breaker is not None:
+                    breaker.before_request()
+            except CircuitOpenError as e:
+                # While the server is failing, wait for the breaker to let
+                # requests through again rather than giving up at once.
+                if attempt >= retry_policy.max_retries:
+                    raise
+                time.sleep(max(e.retry_at - time.monotonic(),
+                               retry_policy.backoff(attempt)))
+                attempt += 1
+                continue
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire(self.server_ip, path)
+                response = self.connection_pool.urlopen(
+                    method, url, self.base_uri + path, body=data,
+                    headers=actual_headers)
+            except OSError as e:
+                if self.metrics is not None:
+                    self.metrics.record_error(method, path)
+                self.record_result(breaker, error=e, retry_policy=retry_policy)
+                if not (retry_policy.should_retry(method, attempt,
+                                                  error=e) and
+                        rewind_body(data, position)):
+                    self.handle_connection_error(e)
+                time.sleep(retry_policy.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Any other error, such as a KeyboardInterrupt, still ends
+                # the request, so a trial request cannot leave the breaker
+                # waiting for its result for good.
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+
+            if self.metrics is not None:
+                self.record_metrics(method, path, response)
+            self.record_result(breaker, code=response.code,
+                               retry_policy=retry_policy)
+            if not (retry_policy.should_retry(method, attempt,
+                                              code=response.code) and
+                    rewind_body(data, position)):
+                break
+            # Read the error body so the connection can be reused.
+            response.read()
+            time.sleep(retry_policy.backoff(attempt, response))
+            attempt += 1
+
+        # Compressed bodies are decompressed as they are read, so callers
+        # always read the decoded body.
+        return decode_content(response)
+
+    # This method sends a GET and reads the whole response, sharing the
+    # request with any identical GET already in flight if coalescing is on.
+    def send_coalesced(self, path, actual_headers, retry_policy=None):
+
+        if self.single_flight is None:
+            return self.send_buffered('GET', path, actual_headers,
+                                      retry_policy=retry_policy)
+        key = (path, tuple(sorted(
+            (name, str(value)) for name, value in actual_headers.items())))
+        parts, _ = self.single_flight.do(
+            key, lambda: self.send_buffered('GET', path, actual_headers,
+                                            retry_policy=retry_policy))
+        return parts
+
+    # This method sends a request and reads the whole response. It returns
+    # the parts needed to build a BufferedResponse.
+    def send_buffered(self, method, path, actual_headers, data=None,
+                      retry_policy=None):
+
+        response = self.send(method, path, actual_headers, data, retry_policy)
+        with response:
+            body = response.read()
+        return (response.code, response.reason, response.headers,
+                response.geturl(), body)
+
+    # This method builds the path and the headers for a request. It is shared
+    # by call_api and the AsyncRestApiClient so both send identical requests.
+    def prepare_request(self, endpoint, method, headers=None, params=[],
+                        data=None, print_request=False):
 
         path = self.parse_path(endpoint, params)
 
         # If the caller specified customer headers merge them with the default
         # headers.
-        actual_headers = self.headers.copy()
-        if headers is not None:
-            for header_key in headers:
-                actual_headers[header_key] = headers[header_key]
-
-        # Send the request and receive the response
-        request = Request(
-            'https://' + self.server_ip + self.base_uri + path,
-            headers=actual_headers)
-        request.get_method = lambda: method
+        actual_headers = self.merge_headers(headers)
+
+        # Form encoded bodies are sent with the same Content-Type that urllib
+        # uses when the caller does not specify one. File objects are sent as
+        # binary data.
+        streamed = is_stream(data)
+        if data is not None and 'Content-Type' not in actual_headers:
+            if streamed:
+                actual_headers['Content-Type'] = 'application/octet-stream'
+            else:
+                actual_headers['Content-Type'] = (
+                    'application/x-www-form-urlencoded')
+
+        # File objects are read as they are sent. Send their length when it
+        # is known, otherwise they are sent with chunked transfer encoding.
+        if streamed and not any(name.lower() in ('content-length',
+                                                 'transfer-encoding')
+                                for name in actual_headers):
+            length = body_length(data)
+            if length is not None:
+                actual_headers['Content-Length'] = str(length)
+
+        # Ask for a compressed response unless the caller chose an encoding.
+        if self.compression and 'Accept-Encoding' not in actual_headers:
+            actual_headers['Accept-Encoding'] = ACCEPT_ENCODING
 
         # Print the request if print_request is True.
         if print_request:
             SampleUtilities.pretty_print_request(self, path, method,
                                                  headers=actual_headers)
 
-        try:
-            response = urlopen(request, data)
-
-            response_info = response.info()
-            if 'Deprecated' in response_info:
-
-                # This version of the API is Deprecated. Print a warning to
-                # stderr.
-                print("WARNING: " + response_info['Deprecated'],
-                      file=sys.stderr)
-
-            # returns response object for opening url.
-            return response
-        except HTTPError as e:
-            # an object which contains information similar to a request object
-            return e
-        except URLError as e:
-            if (isinstance(e.reason, ssl.SSLError) and
-                    e.reason.reason == "CERTIFICATE_VERIFY_FAILED"):
-                print("Certificate verification failed.")
-                sys.exit(3)
-            else:
-                raise e
-
-    # This method constructs the query string
-    def parse_path(self, endpoint, params):
+        return path, actual_headers
 
-        path = endpoint + '?'
-
-        if isinstance(params, list):
-
-            for kv in params:
-                if kv[1]:
-                    path += kv[0]+'='+quote(kv[1])+'&'
+    # This method handles an error raised while connecting to the server. A
+    # failed certificate verification ends the program, anything else is
+    # raised as a URLError.
+    def handle_connection_error(self, error):
 
+        if (isinstance(error, ssl.SSLError) and
+                error.reason == "CERTIFICATE_VERIFY_FAILED"):
+            print("Certificate verification failed.")
+            sys.exit(3)
+        elif isinstance(error, URLError):
+            raise error
         else:
-            for k, v in params.items():
-                if params[k]:
-                    path += k+'='+quote(v)+'&'
+            raise URLError(error)
+
+    # This method tells the circuit breaker of the server whether a request
+    # failed, as judged by the retry policy the request was sent with.
+    def record_result(self, breaker, code=None, error=None,
+                      retry_policy=None):
+
+        if breaker is None:
+            return
+        if retry_policy is None:
+            retry_policy = self.retry_policy
+        if retry_policy.is_failure(code=code, error=error):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    # This method records the timing of a response in the metrics once its
+    # body has been read.
+    def record_metrics(self, method, path, response):
+
+        code = response.code
+        response.timing.on_complete(
+            lambda timing: self.metrics.record(method, path, code, timing))
+
+    # This method inspects a response before it is returned to the caller.
+    def check_response(self, response):
+
+        response_info = response.info()
+        if 'Deprecated' in response_info:
+
+            # This version of the API is Deprecated. Print a warning to
+            # stderr.
+            print("WARNING: " + response_info['Deprecated'],
+                  file=sys.stderr)
+
+    # This method merges the caller's headers into a copy of the default
+    # headers. Header names are matched case insensitively and the caller's
+    # value wins, so a header is never sent twice.
+    def merge_headers(self, headers=None):
+
+        merged = {}
+        names = {}
+        for source in (self.headers, headers or {}):
+            for key, value in source.items():
+                if isinstance(key, bytes):
+                    key = key.decode('ascii')
+                lower_key = key.lower()
+                if lower_key in names:
+                    del merged[names[lower_key]]
+                names[lower_key] = _HEADER_NAMES.get(lower_key, key)
+                merged[names[lower_key]] = value
+        return merged
+
+    # This method is a generator that returns every element of a list endpoint,
+    # requesting the list one page of page_size elements at a time with the
+    # Range header. The total number of elements is read from the
+    # Content-Range header of the first page, then up to max_workers of the
+    # remaining pages are requested in parallel. Elements are returned in the
+    # same order as the endpoint returns them. RestApiError is raised if a
+    # page cannot be retrieved.
+    def paginate(self, endpoint, params=[], page_size=50, headers=None,
+                 max_workers=4):
+
+        elements, total = self.get_page(endpoint, 0, page_size - 1,
+                                        params=params, headers=headers)
+        for element in elements:
+            yield element
+
+        if total is None:
+            # Without a total keep asking for pages until one comes back
+            # short.
+            start = page_size
+            while len(elements) == page_size:
+                elements, total = self.get_page(
+                    endpoint, start, start + page_size - 1, params=params,
+                    headers=headers)
+                for element in elements:
+                    yield element
+                start += page_size
+            return
+
+        starts = iter(range(page_size, total, page_size))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            # Keep at most max_workers pages requested ahead of the page being
+            # returned, so memory use does not grow with the size of the list.
+            pending = collections.deque()
+
+            def request_next_page():
+                for start in starts:
+                    pending.append(executor.submit(
+                        self.get_page, endpoint, start,
+                        min(start + page_size, total) - 1, params=params,
+                        headers=headers))
+                    return
+
+            for _ in range(max_workers):
+                request_next_page()
+            try:
+                while pending:
+                    elements, _ = pending.popleft().result()
+                    request_next_page()
+                    for element in elements:
+                        yield element
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    # This method requests the elements start to end (inclusive) of a list
+    # endpoint. It returns the decoded list and the total number of elements
+    # from the Content-Range header, or None if the header is missing.
+    def get_page(self, endpoint, start, end, params=[], headers=None):
+
+        page_headers = dict(headers or {})
+        page_headers['Range'] = 'items=' + str(start) + '-' + str(end)
+        response = self.call_api(endpoint, 'GET', headers=page_headers,
+                                 params=params)
+        if response.code < 200 or response.code > 299:
+            raise RestApiError(response)
+
+        elements = JsonCodec.load_response(response)
+
+        # The Content-Range header looks like 'items 0-49/1234'.
+        total = None
+        content_range = response.info().get('Content-Range')
+        if content_range is not None and '/' in content_range:
+            total_text = content_range.rsplit('/', 1)[1].strip()
+            if total_text.isdigit():
+                total = int(total_text)
+        return elements, total
+
+    # This method adds the query string for params to the endpoint. Values
+    # that are None or '' are left out, and keys may repeat. See
+    # EndpointTemplate.py for building endpoints with path parameters.
+    def parse_path(self, endpoint, params):
 
-        # removes last '&' or hanging '?' if no params.
-        return path[:len(path)-1]
+        return append_query(endpoint, params)
 
     # Simple getters that can be used to inspect the state of this client.
     def get_headers(self):
@@ -182,3 +706,15 @@ class RestApiClient:
 
     def get_base_uri(self):
         return self.base_uri
+
+    # Closes the idle connections held open by this client.
+    def close(self):
+        self.connection_pool.close()
+
+    # A client can be used in a with statement, which closes its connections
+    # at the end of the block.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,217 @@
+"""
+Decides whether a failed request made by RestApiClient should be sent again,
+and how long to wait first. Requests are retried when the server reports that
+it is temporarily unable to handle them (429, 502, 503, 504) or when the
+connection fails. Methods that are not idempotent, such as POST, are only
+retried when the server cannot have acted on the request.
+
+Each host also has a circuit breaker. After failure_threshold consecutive
+failures the breaker opens and requests to the host fail immediately with
+CircuitOpenError for recovery_timeout seconds. A single trial request is then
+let through; if it succeeds the breaker closes again, otherwise it stays open
+for another recovery_timeout. Breakers are shared by every client in the
+process that talks to the same host.
+"""
+from email.utils import parsedate_to_datetime
+from urllib.error import URLError
+import datetime
+import random
+import threading
+import time
+
+
+# Methods that can safely be sent twice.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# Response codes that mean the request may succeed if it is sent again.
+RETRY_CODES = (429, 502, 503, 504)
+
+# Response codes that mean the server did not act on the request, so even a
+# request that is not idempotent can be sent again.
+NOT_PROCESSED_CODES = (429, 503)
+
+# Response codes that count as failures of the host for the circuit breaker.
+# 429 means the host is up but busy, so it is retried without counting.
+FAILURE_CODES = (502, 503, 504)
+
+
+class CircuitOpenError(URLError):
+    """
+    Raised instead of sending a request while the circuit breaker of the
+    host is open. It is a URLError, so code that handles connection failures
+    handles it too.
+    """
+
+    def __init__(self, host, retry_at):
+        super().__init__('Too many failed requests to ' + host + '. '
+                         'Requests are paused for ' +
+                         '{0:.0f}'.format(max(0, retry_at - time.monotonic()))
+                         + ' seconds.')
+        self.host = host
+        self.retry_at = retry_at
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures of requests to one host. See the description
+    at the top of this module.
+    """
+
+    def __init__(self, host, failure_threshold=5, recovery_timeout=30.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_request(self):
+        """
+        Raise CircuitOpenError if a request to the host should not be sent.
+        """
+
+        with self._lock:
+            if self.opened_at is None:
+                return
+            retry_at = self.opened_at + self.recovery_timeout
+            if time.monotonic() < retry_at or self._trial_in_flight:
+                raise CircuitOpenError(self.host, retry_at)
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self._trial_in_flight or
+                    self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host, failure_threshold=5, recovery_timeout=30.0):
+    """
+    Return the circuit breaker for host, creating it with failure_threshold
+    and recovery_timeout if there is none yet.
+    """
+
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host, failure_threshold,
+                                     recovery_timeout)
+            _breakers[host] = breaker
+        return breaker
+
+
+class RetryPolicy:
+    """
+    Retries a request up to max_retries times. Before retry n (counting from
+    0) the policy waits a random time between 0 and
+    min(max_backoff, backoff_factor * 2 ** n) seconds, so clients that failed
+    together do not retry together. If the response has a Retry-After header
+    that time is waited instead, up to max_retry_after seconds.
+
+    A policy with max_retries=0 never retries but still uses the circuit
+    breaker. Pass failure_threshold=None to turn the breaker off.
+    """
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30.0,
+                 max_retry_after=120.0, retry_codes=RETRY_CODES,
+                 idempotent_methods=IDEMPOTENT_METHODS, failure_threshold=5,
+                 recovery_timeout=30.0):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.retry_codes = retry_codes
+        self.idempotent_methods = idempotent_methods
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+    def circuit_breaker(self, host):
+        """
+        Return the circuit breaker for host, or None if breakers are off.
+        """
+
+        if self.failure_threshold is None:
+            return None
+        return get_circuit_breaker(host, self.failure_threshold,
+                                   self.recovery_timeout)
+
+    def is_failure(self, code=None, error=None):
+        """
+        Return True if a response code, or an error raised instead of a
+        response, counts as a failure of the host.
+        """
+
+        if error is not None:
+            return isinstance(error, (ConnectionError, TimeoutError))
+        return code in FAILURE_CODES
+
+    def should_retry(self, method, attempt, code=None, error=None):
+        """
+        Return True if a request that has already been retried attempt times
+        and got the response code, or raised error, should be sent again.
+        """
+
+        if attempt >= self.max_retries:
+            return False
+        idempotent = method.upper() in self.idempotent_methods
+        if error is not None:
+            # A refused connection never reached the server. Other errors may
+            # have happened after the server received the request.
+            if isinstance(error, ConnectionRefusedError):
+                return True
+            return idempotent and isinstance(error,
+                                             (ConnectionError, TimeoutError))
+        if code not in self.retry_codes:
+            return False
+        return idempotent or code in NOT_PROCESSED_CODES
+
+    def backoff(self, attempt, response=None):
+        """
+        Return how many seconds to wait before retry number attempt.
+        """
+
+        if response is not None:
+            retry_after = parse_retry_after(
+                response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff_factor * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """
+    Return the number of seconds to wait given by a Retry-After header, which
+    is either a number of seconds or an HTTP date, or None if value is None
+    or cannot be parsed.
+    """
+
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
@@ -1,12 +1,12 @@
 import sys
-import json
+import JsonCodec
 
 
 # This function prints out the response from an endpoint in a consistent way.
 def pretty_print_response(response):
     print(response.code)
-    parsed_response = json.loads(response.read().decode('utf-8'))
-    print(json.dumps(parsed_response, indent=4))
+    parsed_response = JsonCodec.load_response(response)
+    print(JsonCodec.dumps(parsed_response, indent=4))
     return
 
 
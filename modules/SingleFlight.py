@@ -0,0 +1,61 @@
+"""
+Collapses identical calls made at the same time into one. While a call for a
+key is running, other threads that ask for the same key wait for it and get
+its result instead of making the call themselves. Once the call finishes the
+key is forgotten, so later calls run again; nothing is cached.
+"""
+import threading
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. RestApiClient uses it to send a
+    single request for identical GETs made by several threads at once.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        Return the result of function(), or of the call for key that is
+        already running. If the call raises, every caller waiting on it gets
+        the same exception. Returns a (result, shared) pair, where shared is
+        True if the result is also being returned to other callers.
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.waiters > 0
@@ -40,7 +40,7 @@ class APIClient(RestApiClient):
         # sends a GET request to https://<server_ip>/rest/api/ariel/searches
         return self.call_api(endpoint, 'GET', self.headers)
 
-    def create_search(self, query_expression):
+    def create_search(self, query_expression, retry_policy=None):
 
         endpoint = self.endpoint_start + "searches"
         # sends a POST request to https://<server_ip>/rest/api/ariel/searches
@@ -50,7 +50,8 @@ class APIClient(RestApiClient):
         data = urllib.parse.urlencode(data)
         data = data.encode('utf-8')
 
-        return self.call_api(endpoint, 'POST', self.headers, data=data)
+        return self.call_api(endpoint, 'POST', self.headers, data=data,
+                             retry_policy=retry_policy)
 
     def get_search(self, search_id):
 
@@ -60,8 +61,14 @@ class APIClient(RestApiClient):
 
         return self.call_api(endpoint, 'GET', self.headers)
 
+    # If file_name is given the results are downloaded to that file with
+    # download(), instead of being returned in the body of the response, so
+    # results of any size can be saved with constant memory. progress, resume
+    # and use_mmap are passed on to download().
     def get_search_results(self, search_id,
-                           response_type, range_start=None, range_end=None):
+                           response_type, range_start=None, range_end=None,
+                           file_name=None, progress=None, resume=False,
+                           use_mmap=False):
 
         headers = self.headers.copy()
         headers[b'Accept'] = response_type
@@ -74,6 +81,11 @@ class APIClient(RestApiClient):
         # https://<server_ip>/rest/api/ariel/searches/<search_id>
         endpoint = self.endpoint_start + "searches/" + search_id + '/results'
 
+        if file_name is not None:
+            return self.download(endpoint, file_name, headers=headers,
+                                 progress=progress, resume=resume,
+                                 use_mmap=use_mmap)
+
         # response object body should contain information pertaining to search.
         return self.call_api(endpoint, 'GET', headers)
 
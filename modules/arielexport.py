@@ -0,0 +1,405 @@
+"""
+Exports the results of an Ariel search to a columnar file so they can be
+analysed without re-parsing JSON or CSV. Results are read a page at a time and
+written as they arrive, so an export of any size needs only one page in
+memory.
+
+If pyarrow is installed the results are written to a Parquet file. Otherwise
+they are written to a directory in a simple Arrow-like layout that needs
+nothing beyond the standard library:
+
+    schema.json              column names, types and the row count
+    <n>.values               fixed width values of column n (int64, float64
+                             or one byte per bool), in native byte order
+    <n>.offsets, <n>.data    for string columns, int64 end offsets and the
+                             UTF-8 bytes of the values
+    <n>.validity             one byte per row, 0 where the value is null
+
+read_columnar() reads such a directory back into lists.
+
+The schema is resolved from the first page of results and widened when a
+later page does not fit it: a column that first appears later is added, an
+int64 column with a fraction becomes float64, and a column with a value its
+type cannot hold becomes string. Because a file cannot be changed once
+written, the export then starts again from the first page with the wider
+schema. schema.json is written, and a Parquet file kept, only when the export
+completes. A search with no results gives an export with no columns.
+"""
+import array
+import json
+import os
+import sys
+
+import JsonCodec
+from RestApiClient import RestApiError
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# The column types used in exported files, keyed by the argument_type of the
+# column in the GET ariel/databases/{database_name} response. Columns with any
+# other argument_type are exported as strings.
+ARGUMENT_TYPES = {'NUMERIC': 'int64',
+                  'LONG': 'int64',
+                  'INTEGER': 'int64',
+                  'PORT': 'int64',
+                  'DATE': 'int64',
+                  'DATETIME': 'int64',
+                  'DOUBLE': 'float64',
+                  'FLOAT': 'float64',
+                  'BOOLEAN': 'bool'}
+
+_ARRAY_TYPECODES = {'int64': 'q', 'float64': 'd', 'bool': 'B'}
+
+
+def get_column_types(api_client, database_name):
+    """
+    Return a dictionary of column name to export type for an Ariel database,
+    using the column metadata returned by APIClient.get_database.
+    """
+
+    response = api_client.get_database(database_name)
+    if response.code != 200:
+        raise RestApiError(response)
+    database = JsonCodec.load_response(response)
+    return dict((column['name'].lower(),
+                 ARGUMENT_TYPES.get(column.get('argument_type'), 'string'))
+                for column in database['columns'])
+
+
+def resolve_schema(rows, column_types):
+    """
+    Return a list of (column name, export type) pairs for the columns in
+    rows. Columns that are not in column_types, such as aliases and function
+    results, get a type based on their values. An int64 column whose values
+    include fractions is exported as float64.
+    """
+
+    schema = []
+    names = []
+    for row in rows:
+        for name in row:
+            if name not in names:
+                names.append(name)
+
+    for name in names:
+        values = [row.get(name) for row in rows if row.get(name) is not None]
+        column_type = column_types.get(name.lower())
+        if column_type is None:
+            column_type = _infer_type(values)
+        if column_type == 'int64' and any(
+                isinstance(value, float) and not value.is_integer()
+                for value in values):
+            column_type = 'float64'
+        schema.append((name, column_type))
+    return schema
+
+
+def widen_schema(schema, rows):
+    """
+    Return schema widened to hold every value in rows, as described at the
+    top of this module. The columns keep their order and new columns are
+    added at the end.
+    """
+
+    types = dict(schema)
+    names = [name for name, column_type in schema]
+    for row in rows:
+        for name, value in row.items():
+            if name not in types:
+                names.append(name)
+                types[name] = None
+            if value is not None:
+                types[name] = _widen(types[name], value)
+    return [(name, types[name] or 'string') for name in names]
+
+
+def _widen(column_type, value):
+    if column_type is None:
+        # The first value of a new column.
+        if isinstance(value, bool):
+            return 'bool'
+        if isinstance(value, int) and _fits(value, 'int64'):
+            return 'int64'
+        if isinstance(value, float):
+            return 'float64'
+        return 'string'
+    if _fits(value, column_type):
+        return column_type
+    if column_type == 'int64' and _fits(value, 'float64'):
+        return 'float64'
+    return 'string'
+
+
+def _fits(value, column_type):
+    # Whether _convert can store value in a column of column_type without
+    # losing anything.
+    if column_type == 'string':
+        return True
+    if column_type == 'bool':
+        return (isinstance(value, bool) or
+                (isinstance(value, str) and
+                 value.lower() in ('true', 'false')))
+    if isinstance(value, bool):
+        return False
+    if column_type == 'int64':
+        if isinstance(value, float):
+            if not value.is_integer():
+                return False
+        elif isinstance(value, str):
+            try:
+                value = int(value)
+            except ValueError:
+                return False
+        elif not isinstance(value, int):
+            return False
+        return -2 ** 63 <= value < 2 ** 63
+    if isinstance(value, str):
+        try:
+            float(value)
+        except ValueError:
+            return False
+        return True
+    return isinstance(value, (int, float))
+
+
+def _infer_type(values):
+    if not values:
+        return 'string'
+    if all(isinstance(value, bool) for value in values):
+        return 'bool'
+    if all(isinstance(value, int) and not isinstance(value, bool)
+           for value in values):
+        return 'int64'
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool)
+           for value in values):
+        return 'float64'
+    return 'string'
+
+
+def _convert(value, column_type):
+    # Convert a value from the JSON results to the type of its column.
+    if value is None:
+        return None
+    if column_type == 'int64':
+        return int(value)
+    if column_type == 'float64':
+        return float(value)
+    if column_type == 'bool':
+        if isinstance(value, str):
+            return value.lower() == 'true'
+        return bool(value)
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class ParquetResultWriter:
+    """
+    Writes pages of result rows to a Parquet file with pyarrow. Each page is
+    written as its own row group.
+    """
+
+    _PYARROW_TYPES = {'int64': 'int64', 'float64': 'float64',
+                      'bool': 'bool_', 'string': 'string'}
+
+    def __init__(self, path, schema):
+        self.schema = schema
+        self.arrow_schema = pyarrow.schema(
+            [(name, getattr(pyarrow, self._PYARROW_TYPES[column_type])())
+             for name, column_type in schema])
+        self.path = path
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.arrow_schema)
+
+    def write_rows(self, rows):
+        columns = [[_convert(row.get(name), column_type) for row in rows]
+                   for name, column_type in self.schema]
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type)
+             for column, field in zip(columns, self.arrow_schema)],
+            schema=self.arrow_schema))
+
+    def close(self, complete=True):
+        # An incomplete file is removed, since its footer would make it look
+        # like a whole export.
+        self.writer.close()
+        if not complete:
+            os.remove(self.path)
+
+
+class ColumnarDirectoryWriter:
+    """
+    Writes pages of result rows to a directory with one set of files per
+    column, as described at the top of this module. Used when pyarrow is not
+    installed.
+    """
+
+    def __init__(self, path, schema):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        # A schema.json left by an earlier export is removed first, so the
+        # directory only has one while it holds a complete export.
+        schema_file_name = os.path.join(path, 'schema.json')
+        if os.path.exists(schema_file_name):
+            os.remove(schema_file_name)
+        self.schema = schema
+        self.row_count = 0
+        self.files = []
+        self.string_lengths = []
+        for index, (name, column_type) in enumerate(schema):
+            files = {'validity': self._open(index, 'validity')}
+            if column_type == 'string':
+                files['offsets'] = self._open(index, 'offsets')
+                files['data'] = self._open(index, 'data')
+            else:
+                files['values'] = self._open(index, 'values')
+            self.files.append(files)
+            self.string_lengths.append(0)
+
+    def _open(self, index, kind):
+        return open(os.path.join(self.path, str(index) + '.' + kind), 'wb')
+
+    def write_rows(self, rows):
+        for index, (name, column_type) in enumerate(self.schema):
+            files = self.files[index]
+            values = [_convert(row.get(name), column_type) for row in rows]
+            array.array('B', [value is not None for value in values]).tofile(
+                files['validity'])
+
+            if column_type == 'string':
+                offsets = array.array('q')
+                data = []
+                length = self.string_lengths[index]
+                for value in values:
+                    if value is not None:
+                        encoded = value.encode('utf-8')
+                        data.append(encoded)
+                        length += len(encoded)
+                    offsets.append(length)
+                self.string_lengths[index] = length
+                offsets.tofile(files['offsets'])
+                files['data'].write(b''.join(data))
+            else:
+                default = False if column_type == 'bool' else 0
+                array.array(_ARRAY_TYPECODES[column_type],
+                            [default if value is None else value
+                             for value in values]).tofile(files['values'])
+        self.row_count += len(rows)
+
+    def close(self, complete=True):
+        for files in self.files:
+            for file in files.values():
+                file.close()
+        if not complete:
+            # Remove the partial column files.
+            for files in self.files:
+                for file in files.values():
+                    os.remove(file.name)
+            return
+        with open(os.path.join(self.path, 'schema.json'), 'w') as schema_file:
+            json.dump({'columns': [{'name': name, 'type': column_type}
+                                   for name, column_type in self.schema],
+                       'row_count': self.row_count,
+                       'byteorder': sys.byteorder}, schema_file, indent=2)
+
+
+def export_search_results(runner, search_id, path, database_name='events',
+                          use_pyarrow=None):
+    """
+    Write the results of a completed search to path, reading them a page at
+    a time through an ArielSearchRunner. Column types come from the metadata
+    of database_name. A Parquet file is written if pyarrow is installed (or
+    use_pyarrow is True), otherwise a columnar directory. Returns the number
+    of rows written.
+    """
+
+    if use_pyarrow is None:
+        use_pyarrow = pyarrow is not None
+    if use_pyarrow:
+        writer_class = ParquetResultWriter
+    else:
+        writer_class = ColumnarDirectoryWriter
+    column_types = get_column_types(runner.api_client, database_name)
+
+    schema = None
+    while True:
+        writer = None
+        row_count = 0
+        complete = False
+        try:
+            for rows in runner.iter_result_pages(search_id):
+                if not rows:
+                    continue
+                if schema is None:
+                    schema = widen_schema(
+                        resolve_schema(rows, column_types), rows)
+                widened = widen_schema(schema, rows)
+                if widened != schema:
+                    # Start again from the first page with the wider schema.
+                    schema = widened
+                    break
+                if writer is None:
+                    writer = writer_class(path, schema)
+                writer.write_rows(rows)
+                row_count += len(rows)
+            else:
+                if writer is None:
+                    writer = writer_class(path, schema or [])
+                complete = True
+        finally:
+            if writer is not None:
+                writer.close(complete)
+        if complete:
+            return row_count
+
+
+def read_columnar(path, columns=None):
+    """
+    Read a directory written by ColumnarDirectoryWriter. Returns a dictionary
+    of column name to list of values, for every column or only those named in
+    columns.
+    """
+
+    with open(os.path.join(path, 'schema.json')) as schema_file:
+        schema = json.load(schema_file)
+    swap = schema['byteorder'] != sys.byteorder
+
+    result = {}
+    for index, column in enumerate(schema['columns']):
+        if columns is not None and column['name'] not in columns:
+            continue
+        prefix = os.path.join(path, str(index) + '.')
+        validity = _read_array('B', prefix + 'validity', False)
+
+        if column['type'] == 'string':
+            offsets = _read_array('q', prefix + 'offsets', swap)
+            with open(prefix + 'data', 'rb') as data_file:
+                data = data_file.read()
+            values = []
+            start = 0
+            for valid, end in zip(validity, offsets):
+                values.append(data[start:end].decode('utf-8')
+                              if valid else None)
+                start = end
+        else:
+            raw = _read_array(_ARRAY_TYPECODES[column['type']],
+                              prefix + 'values', swap)
+            if column['type'] == 'bool':
+                raw = [bool(value) for value in raw]
+            values = [value if valid else None
+                      for valid, value in zip(validity, raw)]
+        result[column['name']] = values
+    return result
+
+
+def _read_array(typecode, file_name, swap):
+    values = array.array(typecode)
+    with open(file_name, 'rb') as array_file:
+        values.frombytes(array_file.read())
+    if swap:
+        values.byteswap()
+    return values
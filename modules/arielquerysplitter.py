@@ -0,0 +1,327 @@
+"""
+Splits an AQL query with START and STOP bounds into queries over consecutive
+time slices, runs the slices as concurrent searches and merges their results
+into the results of the original query.
+
+Merging supports:
+ - plain queries, with the slices returned in time order;
+ - ORDER BY on one or more columns in the same direction, merged so the
+   combined results keep that order;
+ - GROUP BY (or a whole-query aggregate) with COUNT, SUM, MIN and MAX, where
+   the rows of each group are combined across slices;
+ - SELECT DISTINCT, with rows repeated across slices returned once;
+ - LIMIT, applied to the merged results.
+
+Aggregate columns must be given a name with AS so they can be found in the
+results, and must be a column of their own rather than part of a larger
+expression. Other aggregates, such as AVG, DISTINCT aggregates such as
+COUNT(DISTINCT sourceip), and HAVING clauses, which would filter the partial
+totals of each slice, cannot be combined across slices and are rejected.
+
+START and STOP may be quoted 'yyyy-MM-dd HH:mm' or 'yyyy-MM-dd HH:mm:ss'
+times or epoch milliseconds. Slices share their boundaries, as Ariel does not
+include the STOP time in a search.
+"""
+import datetime
+import heapq
+import itertools
+import re
+
+from arielsearchscheduler import ArielSearchScheduler
+
+
+_MERGEABLE_AGGREGATES = ('count', 'sum', 'min', 'max')
+_UNMERGEABLE_AGGREGATES = ('avg', 'stdev', 'stdevp', 'median', 'uniquecount',
+                           'distinctcount', 'first', 'last')
+_TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M')
+
+
+def _mask(query_expression):
+    # Return a copy of the query in lower case, the same length as the
+    # original, with the contents of quotes and parentheses replaced by '_'.
+    # Clause keywords and commas found in the copy are then known to be at
+    # the top level of the query, and their positions match the original.
+    masked = []
+    quote = None
+    depth = 0
+    for character in query_expression.lower():
+        if quote is not None:
+            if character == quote:
+                quote = None
+                masked.append(character)
+            else:
+                masked.append('_')
+        elif character in '\'"':
+            quote = character
+            masked.append(character)
+        elif character == '(':
+            depth += 1
+            masked.append(character)
+        elif character == ')':
+            depth -= 1
+            masked.append(character)
+        elif depth > 0:
+            masked.append('_')
+        else:
+            masked.append(character)
+    return ''.join(masked)
+
+
+class ParsedQuery:
+    """
+    The parts of an AQL query needed to split it and merge the results.
+    """
+
+    def __init__(self, query_expression):
+        self.text = query_expression.strip().rstrip(';')
+        masked = _mask(self.text)
+
+        match = re.search(
+            r"\bstart\s+('_*'|\d+)\s+stop\s+('_*'|\d+)", masked)
+        if match is None:
+            raise ValueError('The query does not have START and STOP bounds.')
+        self.time_span = match.span()
+        self.start, self.time_format = _parse_time(
+            self.text[match.start(1):match.end(1)])
+        self.stop = _parse_time(self.text[match.start(2):match.end(2)])[0]
+        if self.stop <= self.start:
+            raise ValueError('STOP must be later than START.')
+
+        match = re.search(r'\s*\blimit\s+(\d+)', masked)
+        self.limit = None if match is None else int(match.group(1))
+        self.limit_span = None if match is None else match.span()
+
+        self.order_by = []
+        self.descending = False
+        match = re.search(r'\border\s+by\s+(.+?)(?=\s+limit\b|\s+start\b|$)',
+                          masked)
+        if match is not None:
+            directions = set()
+            for item in self.text[match.start(1):match.end(1)].split(','):
+                words = item.split()
+                if words[-1].lower() in ('asc', 'desc'):
+                    directions.add(words.pop().lower())
+                else:
+                    directions.add('asc')
+                self.order_by.append(_unquote(' '.join(words)))
+            if len(directions) > 1:
+                raise ValueError('ORDER BY columns must all be sorted in the '
+                                 'same direction.')
+            self.descending = directions == {'desc'}
+
+        if re.search(r'\bhaving\b', masked) is not None:
+            raise ValueError('HAVING cannot be applied to the results of '
+                             'each time slice.')
+
+        # Read the select list to find the aggregate columns.
+        self.aggregates = {}
+        match = re.match(r'\s*select\s+(distinct\s+)?(.*?)\s+from\b', masked)
+        if match is None:
+            raise ValueError('The query does not start with SELECT.')
+        distinct = match.group(1) is not None
+        position = match.start(2)
+        for masked_item in masked[match.start(2):match.end(2)].split(','):
+            item = self.text[position:position + len(masked_item)].strip()
+            position += len(masked_item) + 1
+            functions = [name.lower()
+                         for name in re.findall(r'(\w+)\s*\(', item)]
+            aggregates = [name for name in functions
+                          if name in _MERGEABLE_AGGREGATES or
+                          name in _UNMERGEABLE_AGGREGATES]
+            if not aggregates:
+                continue
+            for name in aggregates:
+                if name in _UNMERGEABLE_AGGREGATES:
+                    raise ValueError(name.upper() + ' cannot be merged '
+                                     'across time slices.')
+            name = aggregates[0]
+            if re.match(r'\w+\s*\(\s*distinct\b', item, re.IGNORECASE):
+                raise ValueError(name.upper() + '(DISTINCT ...) cannot be '
+                                 'merged across time slices.')
+            call = re.fullmatch(r'(\w+)\s*\(_*\)(\s+as\s+\S+)?',
+                                masked_item.strip())
+            if (call is None or call.group(1).lower() != name or
+                    len(aggregates) > 1):
+                raise ValueError(name.upper() + ' can only be merged across '
+                                 'time slices as a column of its own, such '
+                                 'as ' + name.upper() + '(x) AS total.')
+            if call.group(2) is None:
+                raise ValueError('Give the ' + name.upper() + ' column a '
+                                 'name with AS.')
+            alias = re.search(r'\s+as\s+(\S+)$', item, re.IGNORECASE)
+            self.aggregates[_unquote(alias.group(1))] = name
+
+        self.grouped = (bool(self.aggregates) or distinct or
+                        re.search(r'\bgroup\s+by\b', masked) is not None)
+
+    def slice_queries(self, slices):
+        """
+        Return the queries for up to slices consecutive time slices.
+        """
+
+        # Slices are whole seconds, or whole minutes if the times have no
+        # seconds, so the bounds can be written back in the same format.
+        if self.time_format is None:
+            unit = 1000
+        elif self.time_format.endswith('%S'):
+            unit = datetime.timedelta(seconds=1)
+        else:
+            unit = datetime.timedelta(minutes=1)
+        units = (self.stop - self.start) // unit
+        slices = max(1, min(slices, units))
+
+        queries = []
+        for index in range(slices):
+            start = self.start + unit * (units * index // slices)
+            stop = self.start + unit * (units * (index + 1) // slices)
+            if index == slices - 1:
+                stop = self.stop
+            replacements = [(self.time_span,
+                             'START ' + _format_time(start, self.time_format) +
+                             ' STOP ' + _format_time(stop, self.time_format))]
+            if self.grouped and self.limit_span is not None:
+                # Each slice must return every group for the totals to be
+                # right, so the limit is only applied after merging.
+                replacements.append((self.limit_span, ''))
+
+            query = self.text
+            for (begin, end), replacement in sorted(replacements,
+                                                    reverse=True):
+                query = query[:begin] + replacement + query[end:]
+            queries.append(query)
+        return queries
+
+    def merge(self, slice_results):
+        """
+        Merge the results of the slice queries, given as iterables of rows in
+        slice order, into the results of the whole query.
+        """
+
+        if self.grouped:
+            rows = self._merge_groups(slice_results)
+            if self.order_by:
+                rows.sort(key=self._sort_key, reverse=self.descending)
+        elif self.order_by:
+            rows = heapq.merge(*slice_results, key=self._sort_key,
+                               reverse=self.descending)
+        else:
+            rows = itertools.chain(*slice_results)
+
+        if self.limit is not None:
+            rows = itertools.islice(rows, self.limit)
+        return rows
+
+    def _sort_key(self, row):
+        # None sorts before any value, as it would in a single search.
+        return tuple((row.get(column) is not None, row.get(column))
+                     for column in self.order_by)
+
+    def _merge_groups(self, slice_results):
+        groups = {}
+        for rows in slice_results:
+            for row in rows:
+                key = tuple(sorted(
+                    (name, repr(value)) for name, value in row.items()
+                    if name not in self.aggregates))
+                merged = groups.get(key)
+                if merged is None:
+                    groups[key] = dict(row)
+                    continue
+                for name, function in self.aggregates.items():
+                    merged[name] = _combine(function, merged.get(name),
+                                            row.get(name))
+        return list(groups.values())
+
+
+def _combine(function, total, value):
+    if total is None:
+        return value
+    if value is None:
+        return total
+    if function in ('count', 'sum'):
+        return total + value
+    if function == 'min':
+        return min(total, value)
+    return max(total, value)
+
+
+def _unquote(name):
+    if len(name) > 1 and name[0] == name[-1] and name[0] in '\'"':
+        return name[1:-1]
+    return name
+
+
+def _parse_time(text):
+    # Returns the time and the format it was written in, or None as the
+    # format for epoch milliseconds.
+    if text.isdigit():
+        return int(text), None
+    for time_format in _TIME_FORMATS:
+        try:
+            return (datetime.datetime.strptime(text[1:-1], time_format),
+                    time_format)
+        except ValueError:
+            pass
+    raise ValueError('Unrecognized START or STOP time ' + text + '.')
+
+
+def _format_time(value, time_format):
+    if time_format is None:
+        return str(value)
+    return "'" + value.strftime(time_format) + "'"
+
+
+class ArielQuerySplitter:
+    """
+    Runs queries with START and STOP bounds as a number of concurrent
+    searches, one per time slice, through an ArielSearchScheduler that
+    limits how many of them run on the console at once.
+    """
+
+    def __init__(self, scheduler=None, slices=8):
+        if scheduler is None:
+            scheduler = ArielSearchScheduler()
+        self.scheduler = scheduler
+        self.slices = slices
+
+    def split(self, query_expression, slices=None):
+        """
+        Return the slice queries query_expression would be run as.
+        """
+
+        return ParsedQuery(query_expression).slice_queries(
+            slices or self.slices)
+
+    def run(self, query_expression, slices=None, priority=0,
+            caller='splitter'):
+        """
+        A generator that runs query_expression as time slices and returns the
+        merged result rows. The slice searches are deleted once the rows have
+        been read, or if reading stops early.
+        """
+
+        parsed = ParsedQuery(query_expression)
+        runner = self.scheduler.runner
+
+        def delete_search(future):
+            if not future.cancelled() and future.exception() is None:
+                runner.delete(future.result()['search_id'])
+
+        futures = [self.scheduler.submit(query, priority=priority,
+                                         caller=caller)
+                   for query in parsed.slice_queries(slices or self.slices)]
+        searches = []
+        try:
+            for future in futures:
+                searches.append(future.result())
+            slice_results = [runner.iter_results(search['search_id'],
+                                                 search.get('record_count'))
+                             for search in searches]
+            for row in parsed.merge(slice_results):
+                yield row
+        finally:
+            # Slices still queued are cancelled. The searches of the others
+            # are deleted now if they have completed, or when they do.
+            for future in futures:
+                future.cancel()
+                future.add_done_callback(delete_search)
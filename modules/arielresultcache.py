@@ -0,0 +1,179 @@
+"""
+A local cache of Ariel search results. Queries are keyed by their normalized
+AQL text and the absolute time window they cover, so a dashboard that runs
+the same query again is answered from disk instead of starting a new search.
+
+Relative windows such as LAST 15 MINUTES are turned into absolute bounds
+rounded down to time_granularity seconds. Runs of the same query within the
+same interval share a cache entry, so the results returned can be up to
+time_granularity seconds (or the ttl, if shorter) old.
+
+Searches saved on the console for the cache are deleted when their entry
+expires, is evicted to make room or is invalidated. Expired entries are
+removed whenever a query has to run a new search.
+"""
+import re
+import time
+
+import JsonCodec
+from DiskCache import DiskCache
+from RestApiClient import RestApiError
+from arielsearchrunner import ArielSearchRunner
+
+
+_LAST_PATTERN = re.compile(
+    r'\blast\s+(\d+)\s+(second|minute|hour|day)s?\b')
+_UNIT_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Single or double quoted text in AQL, with quotes escaped by doubling them.
+_QUOTED_PATTERN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_query(query_expression):
+    """
+    Return query_expression with keywords and identifiers in lower case, runs
+    of whitespace collapsed to a single space and any trailing semicolon
+    removed. Quoted text is left unchanged.
+    """
+
+    parts = _QUOTED_PATTERN.split(query_expression.strip().rstrip(';'))
+    for index in range(0, len(parts), 2):
+        parts[index] = re.sub(r'\s+', ' ', parts[index].lower())
+    return ''.join(parts).strip()
+
+
+def time_window(normalized_query, now=None, time_granularity=60):
+    """
+    Return the (start, stop) epoch seconds covered by a normalized query with
+    a LAST clause, rounded down to time_granularity, or None if the query
+    has no LAST clause. Queries with START and STOP are already absolute.
+    """
+
+    # Quoted text, such as a string literal that mentions 'last 5 minutes',
+    # is not part of the time window.
+    match = _LAST_PATTERN.search(_QUOTED_PATTERN.sub("''", normalized_query))
+    if match is None:
+        return None
+    if now is None:
+        now = time.time()
+    stop = int(now // time_granularity * time_granularity)
+    return (stop - int(match.group(1)) * _UNIT_SECONDS[match.group(2)],
+            stop)
+
+
+class ArielResultCache:
+    """
+    Runs AQL queries through an ArielSearchRunner and caches their results
+    in directory. At most max_bytes of results are kept; the least recently
+    used are removed first. Results expire after ttl seconds.
+
+    If save_results is True the cache stores the search id instead of the
+    rows, and asks the console to keep the search with update_search. A
+    repeated query then reads the rows of the saved search back from the
+    console, which costs a results request but no new search. The saved
+    search is deleted from the console when its cache entry is removed.
+    """
+
+    def __init__(self, directory, runner=None, max_bytes=256 * 1024 * 1024,
+                 ttl=300, time_granularity=60, save_results=False):
+        if runner is None:
+            runner = ArielSearchRunner()
+        self.runner = runner
+        self.cache = DiskCache(directory, max_bytes=max_bytes,
+                               on_remove=self._entry_removed)
+        self.ttl = ttl
+        self.time_granularity = time_granularity
+        self.save_results = save_results
+
+    def cache_key(self, query_expression, now=None):
+        """
+        Return the cache key for query_expression.
+        """
+
+        normalized = normalize_query(query_expression)
+        window = time_window(normalized, now, self.time_granularity)
+        if window is None:
+            return normalized
+        return normalized + '\n' + str(window[0]) + '-' + str(window[1])
+
+    def query(self, query_expression, ttl=None):
+        """
+        Return the result rows of query_expression as a list, from the cache
+        if possible. ttl overrides the cache's ttl for this query.
+        """
+
+        key = self.cache_key(query_expression)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if 'search_id' not in entry.metadata:
+                return JsonCodec.loads(entry.value)
+            rows = self._read_saved_search(entry.metadata['search_id'],
+                                           entry.metadata['record_count'])
+            if rows is not None:
+                return rows
+            self.cache.delete(key)
+
+        self.cache.remove_expired()
+        if ttl is None:
+            ttl = self.ttl
+        if self.save_results:
+            return self._run_and_save(key, query_expression, ttl)
+
+        rows = list(self.runner.run(query_expression))
+        self.cache.set(key, JsonCodec.dumps_bytes(rows), ttl=ttl)
+        return rows
+
+    def invalidate(self, query_expression):
+        """
+        Remove the cached results of query_expression.
+        """
+
+        key = self.cache_key(query_expression)
+        entry = self.cache.get(key, include_expired=True)
+        self.cache.delete(key)
+        if entry is not None:
+            self._entry_removed(entry)
+
+    def _run_and_save(self, key, query_expression, ttl):
+        search = self.runner.submit(query_expression)
+        search_id = search['search_id']
+        try:
+            search = self.runner.wait(search_id, search)
+            response = self.runner.api_client.update_search(
+                search_id, save_results='true')
+            response.read()
+            rows = list(self.runner.iter_results(search_id,
+                                                 search['record_count']))
+        except BaseException:
+            self._delete_search(search_id)
+            raise
+
+        if response.code != 200:
+            # The search cannot be kept on the console, so cache the rows.
+            self._delete_search(search_id)
+            self.cache.set(key, JsonCodec.dumps_bytes(rows), ttl=ttl)
+        elif not self.cache.set(key, b'', ttl=ttl,
+                                metadata={'search_id': search_id,
+                                          'record_count':
+                                          search['record_count']}):
+            self._delete_search(search_id)
+        return rows
+
+    def _entry_removed(self, entry):
+        if 'search_id' in entry.metadata:
+            self._delete_search(entry.metadata['search_id'])
+
+    def _delete_search(self, search_id):
+        # A search that cannot be deleted now is left for the console to
+        # remove; failing to delete it should not fail the query.
+        try:
+            self.runner.delete(search_id)
+        except OSError:
+            pass
+
+    def _read_saved_search(self, search_id, record_count):
+        # Returns None if the saved search is no longer on the console.
+        try:
+            return list(self.runner.iter_results(search_id, record_count))
+        except RestApiError:
+            return None
@@ -0,0 +1,166 @@
+"""
+Runs Ariel searches from start to finish on top of arielapiclient.APIClient.
+A search is created, its status is polled with an increasing delay until it
+completes, the results are read a page at a time with the Range header and
+the search is deleted afterwards.
+"""
+import time
+
+import JsonCodec
+from arielapiclient import APIClient
+from RestApiClient import RestApiError
+
+
+# Search states in which the search is still running on the console.
+RUNNING_STATES = ('WAIT', 'EXECUTE', 'SORTING')
+
+
+class ArielSearchError(Exception):
+    """
+    Raised when a search ends in a state other than COMPLETED, or does not
+    complete before the timeout.
+    """
+
+    def __init__(self, message, search=None):
+        super().__init__(message)
+        self.search = search
+
+
+class ArielSearchRunner:
+    """
+    Runs AQL queries through an APIClient. While a search runs its status is
+    polled after initial_interval seconds, and the delay grows by
+    backoff_factor after each poll up to max_interval. When the console
+    reports the progress of the search the delay is also capped at the
+    estimated time remaining, so short searches are not left waiting.
+    """
+
+    def __init__(self, api_client=None, initial_interval=0.25,
+                 max_interval=10.0, backoff_factor=2.0, timeout=None,
+                 page_size=1000):
+        if api_client is None:
+            api_client = APIClient()
+        self.api_client = api_client
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.page_size = page_size
+
+    def run(self, query_expression):
+        """
+        A generator that runs query_expression and returns the result rows
+        one at a time. The search is deleted once the rows have been read,
+        or if reading stops early.
+        """
+
+        search = self.submit(query_expression)
+        try:
+            search = self.wait(search['search_id'], search)
+            for row in self.iter_results(search['search_id'],
+                                         search.get('record_count')):
+                yield row
+        finally:
+            self.delete(search['search_id'])
+
+    def submit(self, query_expression):
+        """
+        Create a search for query_expression and return the search status.
+        """
+
+        response = self.api_client.create_search(query_expression)
+        if response.code != 201:
+            raise RestApiError(response)
+        return JsonCodec.load_response(response)
+
+    def get_status(self, search_id):
+        """
+        Return the current status of a search.
+        """
+
+        response = self.api_client.get_search(search_id)
+        if response.code != 200:
+            raise RestApiError(response)
+        return JsonCodec.load_response(response)
+
+    def wait(self, search_id, search=None):
+        """
+        Poll a search until it is no longer running and return its final
+        status. ArielSearchError is raised if the search does not complete.
+        """
+
+        start_time = time.monotonic()
+        interval = self.initial_interval
+        if search is None:
+            search = self.get_status(search_id)
+
+        while search['status'] in RUNNING_STATES:
+            elapsed = time.monotonic() - start_time
+            if self.timeout is not None and elapsed > self.timeout:
+                raise ArielSearchError(
+                    'Search ' + search_id + ' did not complete within ' +
+                    str(self.timeout) + ' seconds.', search)
+
+            time.sleep(self.next_interval(interval, elapsed,
+                                          search.get('progress')))
+            interval = min(interval * self.backoff_factor, self.max_interval)
+            search = self.get_status(search_id)
+
+        if search['status'] != 'COMPLETED':
+            raise ArielSearchError(
+                'Search ' + search_id + ' ended with status ' +
+                search['status'] + ': ' +
+                JsonCodec.dumps(search.get('error_messages', [])), search)
+        return search
+
+    def next_interval(self, interval, elapsed, progress):
+        """
+        Return how long to wait before the next poll. progress is the
+        percentage of the search completed, or None if it is not known.
+        """
+
+        if progress:
+            remaining = elapsed * (100 - progress) / progress
+            interval = min(interval, remaining)
+        return max(min(interval, self.max_interval), self.initial_interval)
+
+    def iter_results(self, search_id, record_count=None):
+        """
+        A generator that returns the result rows of a completed search,
+        requesting page_size rows at a time.
+        """
+
+        for rows in self.iter_result_pages(search_id, record_count):
+            for row in rows:
+                yield row
+
+    def iter_result_pages(self, search_id, record_count=None):
+        """
+        A generator that returns the result rows of a completed search as
+        lists of up to page_size rows, one list per request.
+        """
+
+        if record_count is None:
+            record_count = self.get_status(search_id)['record_count']
+
+        for start in range(0, record_count, self.page_size):
+            end = min(start + self.page_size, record_count) - 1
+            response = self.api_client.get_search_results(
+                search_id, 'application/json', start, end)
+            if response.code != 200:
+                raise RestApiError(response)
+
+            # The rows are returned under a single key named after the
+            # database that was searched, for example 'events' or 'flows'.
+            page = JsonCodec.load_response(response)
+            for rows in page.values():
+                yield rows
+
+    def delete(self, search_id):
+        """
+        Delete a search and its results from the console.
+        """
+
+        response = self.api_client.delete_search(search_id)
+        response.read()
+        return response.code
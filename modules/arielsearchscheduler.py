@@ -0,0 +1,318 @@
+"""
+Schedules many Ariel searches while keeping the number running on the
+console within a limit. Queries wait in a priority queue until a search slot
+is free. Queries submitted by different callers at the same priority are
+started in turn, so one caller with a long backlog cannot hold every slot.
+A query that the console rejects because too many searches are running is
+put back at the front of the queue and tried again later.
+"""
+import collections
+import copy
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+import JsonCodec
+from RestApiClient import RestApiError
+from RetryPolicy import CircuitOpenError
+from arielsearchrunner import ArielSearchError
+from arielsearchrunner import ArielSearchRunner
+from arielsearchrunner import RUNNING_STATES
+
+
+# Status codes the console uses when it cannot accept another search.
+CAPACITY_ERROR_CODES = (429, 503)
+
+
+class _Job:
+
+    def __init__(self, query_expression, priority, caller, sequence):
+        self.query_expression = query_expression
+        self.priority = priority
+        self.caller = caller
+        self.sequence = sequence
+        self.future = Future()
+        self.search_id = None
+        self.started = None
+        self.interval = None
+
+    def __lt__(self, other):
+        return ((self.priority, self.sequence) <
+                (other.priority, other.sequence))
+
+
+class ArielSearchScheduler:
+    """
+    Runs queries with at most max_searches searches in flight at once.
+    submit() returns a concurrent.futures.Future that resolves to the final
+    status of the search once it has completed; the results can then be read
+    with runner.iter_results and the search removed with runner.delete.
+    A search that does not complete, or is still running after the timeout
+    of the runner, is deleted before its Future is given the exception.
+    A query can be cancelled with the cancel() method of its Future until
+    its search is started.
+
+    When the console rejects a search because it is at capacity the limit is
+    lowered to the number of searches currently running and raised again by
+    one each time a search completes, up to max_searches.
+    """
+
+    def __init__(self, runner=None, max_searches=5, retry_interval=5.0):
+        if runner is None:
+            runner = ArielSearchRunner()
+        self.runner = runner
+        self.max_searches = max_searches
+        self.slot_limit = max_searches
+        self.retry_interval = retry_interval
+        # Searches are created without retries, so a console at capacity is
+        # seen at once and handled by the scheduler rather than by the client.
+        self._create_policy = copy.copy(runner.api_client.retry_policy)
+        self._create_policy.max_retries = 0
+
+        self._pending = {}
+        self._callers = collections.deque()
+        self._in_flight = {}
+        self._starting = None
+        self._polls = []
+        self._sequence = itertools.count()
+        self._retry_at = 0
+        self._shutdown = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, query_expression, priority=0, caller='default'):
+        """
+        Queue query_expression to run. Lower priority values run first.
+        Returns a Future for the completed search status.
+        """
+
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('The scheduler has been shut down.')
+            job = _Job(query_expression, priority, caller,
+                       next(self._sequence))
+            self._queue(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return job.future
+
+    def in_flight(self):
+        """
+        Return the ids of the searches currently running.
+        """
+
+        with self._condition:
+            return list(self._in_flight)
+
+    def pending(self):
+        """
+        Return the number of queries waiting for a search slot.
+        """
+
+        with self._condition:
+            return sum(len(jobs) for jobs in self._pending.values())
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting queries. If wait is True, block until every queued
+        query has finished.
+        """
+
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True)
+
+    def _queue(self, job):
+        if job.caller not in self._pending:
+            self._pending[job.caller] = []
+            self._callers.append(job.caller)
+        heapq.heappush(self._pending[job.caller], job)
+
+    def _next_job(self):
+        # Only the callers whose first job has the best priority are
+        # considered. Of those, the one that has waited longest since it was
+        # last served is chosen and moved to the back of the line.
+        best = min(jobs[0].priority for jobs in self._pending.values())
+        for caller in self._callers:
+            if self._pending[caller][0].priority == best:
+                break
+        self._callers.remove(caller)
+        jobs = self._pending[caller]
+        job = heapq.heappop(jobs)
+        if jobs:
+            self._callers.append(caller)
+        else:
+            del self._pending[caller]
+        return job
+
+    def _run(self):
+        try:
+            while True:
+                job = None
+                with self._condition:
+                    now = time.monotonic()
+                    if (self._pending and
+                            len(self._in_flight) < self.slot_limit and
+                            now >= self._retry_at):
+                        job = self._next_job()
+                        if (not job.future.running() and
+                                not job.future.set_running_or_notify_cancel()):
+                            # Cancelled while it was queued.
+                            continue
+                        self._starting = job
+                    elif (self._shutdown and not self._pending and
+                            not self._in_flight):
+                        return
+                    else:
+                        # Sleep until the next poll is due, a retry is
+                        # allowed, or a new query is submitted.
+                        wake_times = [poll[0] for poll in self._polls[:1]]
+                        if self._pending and now < self._retry_at:
+                            wake_times.append(self._retry_at)
+                        if wake_times:
+                            timeout = max(0, min(wake_times) - now)
+                        else:
+                            timeout = None
+                        if timeout != 0:
+                            self._condition.wait(timeout)
+
+                if job is not None:
+                    self._start(job)
+                else:
+                    self._poll_due()
+        except BaseException as e:
+            # The worker cannot go on, for example because a connection
+            # error made the client exit. Fail every outstanding query so
+            # no caller waits forever.
+            self._fail_all(e)
+            raise
+
+    def _start(self, job):
+        # Called without the condition held, since creating the search sends
+        # a request to the console.
+        try:
+            response = self.runner.api_client.create_search(
+                job.query_expression, retry_policy=self._create_policy)
+            if response.code in CAPACITY_ERROR_CODES:
+                response.read()
+                self._requeue(job, time.monotonic() + self.retry_interval)
+                return
+            if response.code != 201:
+                raise RestApiError(response)
+            search = JsonCodec.load_response(response)
+        except CircuitOpenError as e:
+            self._requeue(job, e.retry_at)
+            return
+        except Exception as e:
+            with self._condition:
+                self._starting = None
+            job.future.set_exception(e)
+            return
+
+        job.search_id = search['search_id']
+        job.started = time.monotonic()
+        job.interval = self.runner.initial_interval
+        with self._condition:
+            self._starting = None
+            self._in_flight[job.search_id] = job
+            heapq.heappush(self._polls, (job.started + job.interval,
+                                         job.sequence, job))
+
+    def _requeue(self, job, retry_at):
+        # The console is at capacity, so the job goes back to the front of
+        # the queue and no search is started before retry_at.
+        with self._condition:
+            self._starting = None
+            self._queue(job)
+            self.slot_limit = max(1, len(self._in_flight))
+            self._retry_at = retry_at
+
+    def _fail_all(self, exception):
+        with self._condition:
+            self._shutdown = True
+            jobs = list(self._in_flight.values())
+            if self._starting is not None:
+                jobs.append(self._starting)
+            for pending in self._pending.values():
+                jobs.extend(pending)
+            self._pending.clear()
+            self._callers.clear()
+            self._in_flight.clear()
+            self._polls = []
+            self._starting = None
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(exception)
+
+    def _poll_due(self):
+        while True:
+            with self._condition:
+                if (not self._polls or
+                        self._polls[0][0] > time.monotonic()):
+                    return
+                job = heapq.heappop(self._polls)[2]
+
+            try:
+                search = self.runner.get_status(job.search_id)
+            except Exception as e:
+                self._finish(job, exception=e)
+                continue
+
+            timeout = self.runner.timeout
+            if search['status'] in RUNNING_STATES:
+                elapsed = time.monotonic() - job.started
+                if timeout is not None and elapsed > timeout:
+                    # Give up on the search, as the runner's wait() does,
+                    # so it does not hold its slot and Future forever.
+                    self._finish(job, exception=ArielSearchError(
+                        'Search ' + job.search_id + ' did not complete '
+                        'within ' + str(timeout) + ' seconds.', search))
+                    continue
+                delay = self.runner.next_interval(job.interval, elapsed,
+                                                  search.get('progress'))
+                if timeout is not None:
+                    # Poll again no later than just after the timeout.
+                    delay = min(delay, max(0, timeout - elapsed) + 0.01)
+                job.interval = min(job.interval * self.runner.backoff_factor,
+                                   self.runner.max_interval)
+                with self._condition:
+                    heapq.heappush(self._polls,
+                                   (time.monotonic() + delay, job.sequence,
+                                    job))
+            elif search['status'] == 'COMPLETED':
+                self._finish(job, search=search)
+            else:
+                self._finish(job, exception=ArielSearchError(
+                    'Search ' + job.search_id + ' ended with status ' +
+                    search['status'] + ': ' +
+                    JsonCodec.dumps(search.get('error_messages', [])), search))
+
+    def _finish(self, job, search=None, exception=None):
+        with self._condition:
+            del self._in_flight[job.search_id]
+            if self.slot_limit < self.max_searches:
+                self.slot_limit += 1
+        if exception is not None:
+            # The caller only gets the exception, so the search is deleted
+            # here. A search that cannot be deleted is left for the console
+            # to remove.
+            try:
+                self.runner.delete(job.search_id)
+            except Exception:
+                pass
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(search)
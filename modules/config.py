@@ -3,7 +3,7 @@ import os
 import sys
 import RestApiClient
 import getpass
-import json
+import JsonCodec
 
 
 class Config:
@@ -19,12 +19,12 @@ class Config:
         then the settings are read from the config_file. Otherwise the user is
         prompted for the settings and given the option to save the settings to
         config_file. config_file is read from and written to the root of the
-        samples directory.
+        samples directory, unless it is an absolute path.
         """
 
         # Read config_file from the root of the samples directory.
-        config_file = os.path.abspath(os.path.dirname(__file__) +
-                                      '/../' + config_file)
+        config_file = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                   '..', config_file))
 
         self.config_file = config_file
         self.config_section = config_section
@@ -143,7 +143,7 @@ class Config:
             if response.code == 401 or response.code == 403:
                 fail_message = "Authorization failed."
             elif response.code < 200 or response.code > 299:
-                response_json = json.loads(response.read().decode('utf-8'))
+                response_json = JsonCodec.load_response(response)
                 fail_message = response_json['http_response']['message']
                 fail_message += "\n" + response_json['message']
         except Exception as e:
@@ -38,6 +38,7 @@ import importlib
 sys.path.append(os.path.realpath('../modules'))
 client_module = importlib.import_module('RestApiClient')
 SampleUtilities = importlib.import_module('SampleUtilities')
+BulkLoader = importlib.import_module('ReferenceDataBulkLoader')
 
 
 def main():
@@ -127,88 +128,41 @@ def setup_data(client):
     SampleUtilities.data_setup(client, 'reference_data/tables', 'POST',
                                params=params)
 
-    # For each parameter set defined in the for loop, add the data to the
-    # rest_api_samples_server_access reference set using the POST
-    # reference_data/tables/{name} endpoint.
-    for params in [
-            {
-                'outer_key': 'calvin',
-                'inner_key': 'Authorization_Server_IP_Secure',
-                'value': '6.3.9.12'
-            },
-            {
-                'outer_key': 'calvin',
-                'inner_key': 'Authorization_Server_PORT_Secure',
-                'value': '443'
-            },
-            {
-                'outer_key': 'calvin',
-                'inner_key': 'Authorization_Server_IP_General',
-                'value': '7.12.15.12'
-            },
-            {
-                'outer_key': 'calvin',
-                'inner_key': 'Last_Secure_Login',
-                'value': str(current_time)
-            },
-            {
-                'outer_key': 'socrates',
-                'inner_key': 'Authorization_Server_IP_General',
-                'value': '7.12.14.85'
-            },
-            {
-                'outer_key': 'mill',
-                'inner_key': 'Authorization_Server_IP_Secure',
-                'value': '6.3.9.12'
-            },
-            {
-                'outer_key': 'mill',
-                'inner_key': 'Authorization_Server_PORT_Secure',
-                'value': '443'
-            },
-            {
-                'outer_key': 'mill',
-                'inner_key': 'Last_Secure_Login',
-                'value': str(current_time)
-            },
-            {
-                'outer_key': 'mill',
-                'inner_key': 'Authorization_Server_IP_General',
-                'value': '7.13.22.85'
-            },
-            {
-                'outer_key': 'hobbes',
-                'inner_key': 'Authorization_Server_IP_Secure',
-                'value': '6.3.9.12'
-            },
-            {
-                'outer_key': 'hobbes',
-                'inner_key': 'Authorization_Server_PORT_Secure',
-                'value': '22'
-            },
-            {
-                'outer_key': 'hobbes',
-                'inner_key': 'Last_Secure_Login',
-                'value': str(current_time)
-            },
-            {
-                'outer_key': 'hobbes',
-                'inner_key': 'Authorization_Server_IP_General',
-                'value': '7.12.19.125'
-            },
-            {
-                'outer_key': 'aquinas',
-                'inner_key': 'Last_Secure_Login',
-                'value': str(current_time - 1000000)
-            },
-            {
-                'outer_key': 'aquinas',
-                'inner_key': 'Authorization_Server_IP_General',
-                'value': '7.12.15.12'
-            }]:
-        SampleUtilities.data_setup(
-            client, 'reference_data/tables/rest_api_samples_server_access',
-            'POST', params=params)
+    # Add the data to the rest_api_samples_server_access reference table with
+    # a single request to the POST reference_data/tables/bulk_load/{name}
+    # endpoint. The loader splits larger tables into chunks and sends several
+    # chunks at once, so the same call can load millions of cells.
+    loader = BulkLoader.ReferenceDataBulkLoader(client)
+    result = loader.load_table('rest_api_samples_server_access', {
+        'calvin': {
+            'Authorization_Server_IP_Secure': '6.3.9.12',
+            'Authorization_Server_PORT_Secure': '443',
+            'Authorization_Server_IP_General': '7.12.15.12',
+            'Last_Secure_Login': str(current_time)
+        },
+        'socrates': {
+            'Authorization_Server_IP_General': '7.12.14.85'
+        },
+        'mill': {
+            'Authorization_Server_IP_Secure': '6.3.9.12',
+            'Authorization_Server_PORT_Secure': '443',
+            'Last_Secure_Login': str(current_time),
+            'Authorization_Server_IP_General': '7.13.22.85'
+        },
+        'hobbes': {
+            'Authorization_Server_IP_Secure': '6.3.9.12',
+            'Authorization_Server_PORT_Secure': '22',
+            'Last_Secure_Login': str(current_time),
+            'Authorization_Server_IP_General': '7.12.19.125'
+        },
+        'aquinas': {
+            'Last_Secure_Login': str(current_time - 1000000),
+            'Authorization_Server_IP_General': '7.12.15.12'
+        }})
+    print(result.summary())
+    if result.failed_chunks:
+        print("An error occurred setting up sample data.")
+        sys.exit(1)
 
 
 # This function represents work done by an external system to determine which
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# This sample demonstrates how to use the AsyncRestApiClient to send several
+# requests to the REST API at the same time.
+
+# It finds the offenses associated with an IP address, like
+# 09_GetOffensesForIp.py, but the siem/source_addresses and
+# siem/local_destination_addresses requests are sent together instead of one
+# after the other, and each offense is then retrieved with its own request,
+# all of them in flight at once. For this scenario to work there must already
+# be offenses on the system the sample is being run against.
+
+# The scenario demonstrates the following actions:
+#  - Creating an AsyncRestApiClient with a limit on concurrent requests.
+#  - Sending requests concurrently with asyncio.gather.
+
+# To view a list of the endpoints with the parameters they accept, you can view
+# the REST API interactive help page on your deployment at
+# https://<hostname>/api_doc.  You can also retrieve a list of available
+# endpoints with the REST API itself at the /api/help/endpoints endpoint.
+
+import asyncio
+import ipaddress
+import json
+import os
+import sys
+
+import importlib
+sys.path.append(os.path.realpath('../modules'))
+async_client_module = importlib.import_module('AsyncRestApiClient')
+
+
+def main():
+    """
+    The entry point for the sample.
+    """
+
+    # Prompt the user for an IP address.
+    ip = input("Enter an IP address: ").strip()
+    try:
+        ip = str(ipaddress.ip_address(ip))
+    except ValueError as e:
+        print(str(e))
+        sys.exit(1)
+
+    offenses = asyncio.run(get_offenses_for_ip(ip))
+
+    if offenses is None:
+        sys.exit(1)
+
+    print("The following offenses are associated with the IP address " + ip +
+          ":")
+    print(json.dumps(offenses, indent=4))
+
+
+async def get_offenses_for_ip(ip):
+    """
+    Returns the offenses associated with ip, or None if there was an error.
+    """
+
+    # No more than 20 requests are sent to the server at the same time. Any
+    # other requests wait until one of those 20 completes.
+    async with async_client_module.AsyncRestApiClient(
+            version='6.0', max_concurrency=20) as api_client:
+
+        # Send both address requests at the same time and wait for both of
+        # them to complete.
+        source_addresses, local_destination_addresses = await asyncio.gather(
+            get_list(api_client, 'siem/source_addresses',
+                     'source_ip="' + ip + '"'),
+            get_list(api_client, 'siem/local_destination_addresses',
+                     'local_destination_ip="' + ip + '"'))
+
+        if source_addresses is None or local_destination_addresses is None:
+            return None
+
+        # Combine all offense IDs into a single set of unique offense ids.
+        offense_ids = set()
+        for address in source_addresses + local_destination_addresses:
+            offense_ids = offense_ids | set(address['offense_ids'])
+
+        if len(offense_ids) == 0:
+            print("The set of offense IDs is empty.")
+            return []
+
+        # Retrieve every offense with its own request. The requests are all
+        # started at once and the client limits how many run together.
+        offenses = await asyncio.gather(
+            *[get_offense(api_client, offense_id)
+              for offense_id in sorted(offense_ids)])
+
+        return [offense for offense in offenses if offense is not None]
+
+
+async def get_list(api_client, endpoint, filter):
+    """
+    Call endpoint with the provided filter. Returns the list returned by the
+    endpoint, or None if there was an error.
+    """
+
+    params = {'filter': filter}
+    response = await api_client.call_api(endpoint, 'GET', params=params,
+                                         print_request=True)
+    response_body = response.read().decode('utf-8')
+
+    if response.code > 299 or response.code < 200:
+
+        print("Failed to call " + endpoint + ".")
+        print(response_body)
+        return None
+
+    return json.loads(response_body)
+
+
+async def get_offense(api_client, offense_id):
+    """
+    Get an offense summary for offense_id. Returns the offense or None if
+    there was an error.
+    """
+
+    endpoint = 'siem/offenses/' + str(offense_id)
+    params = {'fields': 'id,description,status,offense_type,offense_source'}
+
+    response = await api_client.call_api(endpoint, 'GET', params=params)
+    response_body = response.read().decode('utf-8')
+
+    if response.code > 299 or response.code < 200:
+
+        print("Failed to get offense " + str(offense_id) + ".")
+        print(response_body)
+        return None
+
+    return json.loads(response_body)
+
+if __name__ == "__main__":
+    main()
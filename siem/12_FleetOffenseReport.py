@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# This sample demonstrates how to use the FleetClient to send the same
+# requests to several QRadar consoles at the same time.
+
+# Each console is a section of config.ini, for example
+#
+#     [console_east]
+#     server_ip = 10.0.0.1
+#     auth_token = ...
+#
+# and the section names are given on the command line:
+#
+#     python3 12_FleetOffenseReport.py console_east console_west
+#
+# The scenario demonstrates the following actions:
+#  - Creating a FleetClient for several configuration sections.
+#  - Sending one request to every console in parallel with call_api.
+#  - Listing the open offenses of every console in parallel with paginate,
+#    merged into a single list sorted by magnitude.
+
+# To view a list of the endpoints with the parameters they accept, you can view
+# the REST API interactive help page on your deployment at
+# https://<hostname>/api_doc.  You can also retrieve a list of available
+# endpoints with the REST API itself at the /api/help/endpoints endpoint.
+
+import os
+import sys
+
+import importlib
+sys.path.append(os.path.realpath('../modules'))
+fleet_module = importlib.import_module('FleetClient')
+
+
+def main():
+    """
+    The entry point for the sample.
+    """
+
+    sections = sys.argv[1:]
+    if not sections:
+        print("Usage: python3 12_FleetOffenseReport.py <config section> " +
+              "[<config section> ...]")
+        sys.exit(1)
+
+    with fleet_module.FleetClient(sections, version='6.0') as fleet:
+
+        # Ask every console for the first open offense. The total number of
+        # open offenses is in the Content-Range header of each response.
+        params = {'filter': 'status = "OPEN"', 'fields': 'id'}
+        try:
+            responses = fleet.call_api('siem/offenses', 'GET',
+                                       headers={'Range': 'items=0-0'},
+                                       params=params)
+        except fleet_module.FleetError as e:
+            print(str(e))
+            sys.exit(1)
+
+        print("Open offenses per console:")
+        for console, response in responses.items():
+            response.read()
+            if response.code != 200:
+                print("  " + console + ": failed with " + str(response.code))
+                continue
+            content_range = response.headers.get('Content-Range', '')
+            print("  " + console + ": " + content_range.rsplit('/', 1)[-1])
+
+        # List the open offenses of every console, each sorted by magnitude,
+        # and merge them so the most severe offenses of the whole fleet come
+        # first. Each offense is tagged with the console it came from.
+        params = {'filter': 'status = "OPEN"',
+                  'fields': 'id,description,magnitude',
+                  'sort': '-magnitude'}
+        offenses = fleet.paginate('siem/offenses', params=params,
+                                  page_size=100,
+                                  key=lambda offense: -offense['magnitude'])
+
+        print()
+        print("The 10 open offenses with the highest magnitude:")
+        try:
+            for count, offense in enumerate(offenses):
+                if count == 10:
+                    break
+                print("  [" + offense['console'] + "] offense " +
+                      str(offense['id']) + ", magnitude " +
+                      str(offense['magnitude']) + ": " +
+                      offense['description'].strip())
+        except fleet_module.FleetError as e:
+            print(str(e))
+            sys.exit(1)
+        finally:
+            offenses.close()
+
+if __name__ == "__main__":
+    main()
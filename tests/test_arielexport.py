@@ -0,0 +1,117 @@
+"""
+Tests for modules/arielexport.py. Run them with python3 -m unittest from
+this directory.
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'modules'))
+
+import arielexport
+
+
+class FakeResponse:
+
+    def __init__(self, body):
+        self.code = 200
+        self.body = json.dumps(body).encode('utf-8')
+
+    def read(self):
+        return self.body
+
+
+class FakeApiClient:
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def get_database(self, database_name):
+        return FakeResponse({'columns': self.columns})
+
+
+class FakeRunner:
+    # Serves fixed pages of results, as ArielSearchRunner.iter_result_pages
+    # does for a completed search.
+
+    def __init__(self, pages, columns=()):
+        self.api_client = FakeApiClient(list(columns))
+        self.pages = pages
+
+    def iter_result_pages(self, search_id):
+        for rows in self.pages:
+            yield rows
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'export')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def export(self, pages, columns=()):
+        return arielexport.export_search_results(
+            FakeRunner(pages, columns), 'id', self.path, use_pyarrow=False)
+
+    def schema(self):
+        with open(os.path.join(self.path, 'schema.json')) as schema_file:
+            return dict((column['name'], column['type'])
+                        for column in json.load(schema_file)['columns'])
+
+    def test_types_from_database(self):
+        pages = [[{'qid': 1, 'sourceip': '10.0.0.1'}],
+                 [{'qid': 2, 'sourceip': '10.0.0.2'}]]
+        columns = [{'name': 'qid', 'argument_type': 'NUMERIC'},
+                   {'name': 'sourceIP', 'argument_type': 'IP'}]
+        self.assertEqual(self.export(pages, columns), 2)
+        self.assertEqual(self.schema(), {'qid': 'int64',
+                                         'sourceip': 'string'})
+        self.assertEqual(arielexport.read_columnar(self.path),
+                         {'qid': [1, 2],
+                          'sourceip': ['10.0.0.1', '10.0.0.2']})
+
+    def test_later_fraction_widens_int_column(self):
+        pages = [[{'total': 1}, {'total': 2}], [{'total': 2.5}]]
+        self.assertEqual(self.export(pages), 3)
+        self.assertEqual(self.schema(), {'total': 'float64'})
+        self.assertEqual(arielexport.read_columnar(self.path),
+                         {'total': [1.0, 2.0, 2.5]})
+
+    def test_later_column_is_added(self):
+        pages = [[{'a': 1}], [{'a': 2, 'b': 'x'}]]
+        self.export(pages)
+        self.assertEqual(self.schema(), {'a': 'int64', 'b': 'string'})
+        self.assertEqual(arielexport.read_columnar(self.path),
+                         {'a': [1, 2], 'b': [None, 'x']})
+
+    def test_later_string_widens_numeric_column(self):
+        pages = [[{'port': 80}], [{'port': 'N/A'}]]
+        self.export(pages, [{'name': 'port', 'argument_type': 'PORT'}])
+        self.assertEqual(self.schema(), {'port': 'string'})
+        self.assertEqual(arielexport.read_columnar(self.path),
+                         {'port': ['80', 'N/A']})
+
+    def test_no_rows(self):
+        self.assertEqual(self.export([[]]), 0)
+        self.assertEqual(self.schema(), {})
+        self.assertEqual(arielexport.read_columnar(self.path), {})
+
+    def test_failed_export_has_no_schema(self):
+        def pages():
+            yield [{'a': 1}]
+            raise OSError('connection lost')
+
+        with self.assertRaises(OSError):
+            self.export(pages())
+        self.assertFalse(os.path.exists(os.path.join(self.path,
+                                                     'schema.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
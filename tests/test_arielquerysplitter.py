@@ -0,0 +1,110 @@
+"""
+Tests for modules/arielquerysplitter.py. Run them with python3 -m unittest
+from this directory.
+"""
+import os
+import sys
+import unittest
+from concurrent.futures import Future
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'modules'))
+
+from arielquerysplitter import ArielQuerySplitter
+from arielquerysplitter import ParsedQuery
+
+
+BOUNDS = " START '2024-01-01 00:00' STOP '2024-01-01 04:00'"
+
+
+class ParsedQueryTest(unittest.TestCase):
+
+    def test_rejects_having(self):
+        with self.assertRaises(ValueError):
+            ParsedQuery('SELECT sourceip, COUNT(*) AS events FROM events '
+                        'GROUP BY sourceip HAVING events > 10' + BOUNDS)
+
+    def test_rejects_distinct_aggregate(self):
+        with self.assertRaises(ValueError):
+            ParsedQuery('SELECT COUNT(DISTINCT sourceip) AS sources '
+                        'FROM events' + BOUNDS)
+
+    def test_rejects_unmergeable_aggregate(self):
+        for select in ('AVG(magnitude) AS average',
+                       'SUM(magnitude) / COUNT(*) AS average',
+                       'ROUND(SUM(magnitude)) AS total',
+                       'UNIQUECOUNT(sourceip) AS sources'):
+            with self.assertRaises(ValueError, msg=select):
+                ParsedQuery('SELECT ' + select + ' FROM events' + BOUNDS)
+
+    def test_accepts_quoted_having(self):
+        parsed = ParsedQuery("SELECT sourceip FROM events WHERE "
+                             "payload = 'having' " + BOUNDS)
+        self.assertFalse(parsed.grouped)
+
+    def test_merges_groups(self):
+        parsed = ParsedQuery('SELECT sourceip, COUNT(*) AS events, '
+                             'MAX(magnitude) AS worst FROM events '
+                             'GROUP BY sourceip ORDER BY events DESC' +
+                             BOUNDS)
+        rows = list(parsed.merge([
+            [{'sourceip': 'a', 'events': 2, 'worst': 5},
+             {'sourceip': 'b', 'events': 1, 'worst': 3}],
+            [{'sourceip': 'b', 'events': 4, 'worst': 7}]]))
+        self.assertEqual(rows, [{'sourceip': 'b', 'events': 5, 'worst': 7},
+                                {'sourceip': 'a', 'events': 2, 'worst': 5}])
+
+    def test_merges_select_distinct(self):
+        parsed = ParsedQuery('SELECT DISTINCT sourceip FROM events' + BOUNDS)
+        rows = list(parsed.merge([[{'sourceip': 'a'}, {'sourceip': 'b'}],
+                                  [{'sourceip': 'b'}]]))
+        self.assertEqual(rows, [{'sourceip': 'a'}, {'sourceip': 'b'}])
+
+
+class FakeRunner:
+
+    def __init__(self):
+        self.deleted = []
+
+    def delete(self, search_id):
+        self.deleted.append(search_id)
+
+
+class FakeScheduler:
+    # The first slice fails at once, the second is left running and the
+    # rest are left queued.
+
+    def __init__(self):
+        self.runner = FakeRunner()
+        self.futures = []
+
+    def submit(self, query_expression, priority=0, caller='default'):
+        future = Future()
+        if not self.futures:
+            future.set_exception(RuntimeError('The search failed.'))
+        elif len(self.futures) == 1:
+            future.set_running_or_notify_cancel()
+        self.futures.append(future)
+        return future
+
+
+class ArielQuerySplitterTest(unittest.TestCase):
+
+    def test_searches_deleted_after_failure(self):
+        scheduler = FakeScheduler()
+        rows = ArielQuerySplitter(scheduler, slices=4).run(
+            'SELECT * FROM events' + BOUNDS)
+        with self.assertRaises(RuntimeError):
+            next(rows)
+
+        # The queued slices are cancelled, and the running one is deleted
+        # once it completes.
+        running, queued = scheduler.futures[1], scheduler.futures[2:]
+        self.assertTrue(all(future.cancelled() for future in queued))
+        self.assertEqual(scheduler.runner.deleted, [])
+        running.set_result({'search_id': 'running'})
+        self.assertEqual(scheduler.runner.deleted, ['running'])
+
+
+if __name__ == '__main__':
+    unittest.main()